@@ -10,6 +10,9 @@ import multiprocessing
 import logging
 import hashlib
 import pickle
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
 from urllib.parse import urlparse
 from warcio.archiveiterator import ArchiveIterator
 import justext
@@ -17,10 +20,18 @@ import trafilatura
 import fasttext
 from langdetect import detect
 from langdetect.lang_detect_exception import LangDetectException
-import pandas as pd
+import numpy as np
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import datetime
 import re
 
+# Output shards are zstd-compressed when zstandard is installed, plain JSONL otherwise
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # Create output directory if it doesn't exist
 os.makedirs('./warc_text_output', exist_ok=True)
 
@@ -42,16 +53,44 @@ if not PARQUET_PATH:
     logger.error("Usage: python script.py <parquet_file_path_or_url>")
     sys.exit(1)
 
-MAX_CONCURRENT = 100
+MAX_CONCURRENT = 100  # Concurrent range requests (network side)
 logger.info(f"Using MAX_CONCURRENT = {MAX_CONCURRENT}")
+FETCH_QUEUE_SIZE = 2 * MAX_CONCURRENT  # Planned range requests waiting for a fetcher
+
+# The index is streamed in batches of INDEX_BATCH_SIZE rows, reading only these columns
+INDEX_COLUMNS = ["url", "warc_filename", "warc_record_offset", "warc_record_length",
+                 "content_languages", "content_mime_detected"]
+INDEX_BATCH_SIZE = 65536
+
+# HTML extraction runs in a process pool (CPU side), fed by the fetchers through a bounded queue
+EXTRACT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+EXTRACT_QUEUE_SIZE = 4 * EXTRACT_WORKERS  # Fetched records waiting for extraction
+METRICS_INTERVAL = 30  # Seconds between pipeline metric log lines
+
+# Range requests of records in the same WARC file are merged when the gap between them is at most
+# COALESCE_GAP bytes; the skipped bytes are downloaded and discarded
+WARC_BASE_URL = os.environ.get("WARC_BASE_URL", "https://data.commoncrawl.org")  # Any server honouring Range
+COALESCE_GAP = 64 * 1024
+MAX_COALESCED_BYTES = 16 * 1024 * 1024  # Upper bound of one merged request
 
 MY_AGENT = "simple-warc-extractor/1.0 (Text extraction; research@example.com)"
+# Outputs are written as numbered shards, e.g. extracted_text-00000.jsonl.zst
 OUTPUT_FILE = "./warc_text_output/extracted_text.jsonl"
 OUTPUT_FILE_SCORED = "./warc_text_output/extracted_text_scored.jsonl"
+OUTPUT_SHARD_BYTES = 256 * 1024 * 1024  # Uncompressed bytes per shard before rotating
+OUTPUT_COMPRESSION = "zstd" if zstandard is not None else None
+ZSTD_LEVEL = 3
+WRITE_QUEUE_SIZE = 1024  # Results waiting for the writer task
+WRITE_BATCH_SIZE = 256  # Results written (and marked as processed) per batch
+WRITE_MAX_FAILURES = 3  # Consecutive failed batches before the run is aborted
 ERROR_LOG_FILE = "./warc_text_output/extraction_errors.log"
-PROCESSED_URLS_FILE = "./warc_text_output/processed_urls.pkl"
+PROCESSED_URLS_LOG = "./warc_text_output/processed_urls.fp64"  # Append-only log of URL fingerprints
+PROCESSED_URLS_FILE = "./warc_text_output/processed_urls.pkl"  # Legacy pickle, migrated on first load
 MAX_RETRIES = 3
 
+FASTTEXT_MODEL_PATH = "./warc_text_output/lid.176.bin"
+FASTTEXT_MODEL_URL = "https://dl.fbaipublicfiles.com/fasttext/supervised-models/lid.176.bin"
+
 # Global variables for fasttext model and processed URLs tracking
 fasttext_model = None
 processed_urls = set()
@@ -61,21 +100,38 @@ MIN_TEXT_LENGTH = 20  # Reduced from 50
 MAX_TEXT_LENGTH = 500000
 MIN_WORD_COUNT = 5    # Reduced from 10
 
+def download_fasttext_model():
+    """
+    Download the fasttext language detection model once, in the parent process, before the
+    extraction workers start. The file is verified by loading it before it is moved into
+    place, so workers never see a partial or corrupt model.
+    """
+    if os.path.exists(FASTTEXT_MODEL_PATH):
+        return True
+    tmp_path = FASTTEXT_MODEL_PATH + ".part"
+    try:
+        logger.info("Downloading fasttext language detection model...")
+        import urllib.request
+        # Raises ContentTooShortError when fewer bytes than announced arrive
+        urllib.request.urlretrieve(FASTTEXT_MODEL_URL, tmp_path)
+        fasttext.load_model(tmp_path)
+        os.replace(tmp_path, FASTTEXT_MODEL_PATH)
+        logger.info("FastText model downloaded and verified")
+        return True
+    except Exception as e:
+        logger.warning(f"Failed to download fasttext model: {e}, workers will fall back to langdetect")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
 def load_fasttext_model():
-    """Download and load fasttext language detection model."""
+    """Load the fasttext language detection model fetched by download_fasttext_model()."""
     global fasttext_model
     if fasttext_model is None:
         try:
-            # Download model if it doesn't exist
-            model_path = "./warc_text_output/lid.176.bin"
-            if not os.path.exists(model_path):
-                logger.info("Downloading fasttext language detection model...")
-                import urllib.request
-                urllib.request.urlretrieve(
-                    "https://dl.fbaipublicfiles.com/fasttext/supervised-models/lid.176.bin",
-                    model_path
-                )
-            fasttext_model = fasttext.load_model(model_path)
+            if not os.path.exists(FASTTEXT_MODEL_PATH):
+                raise FileNotFoundError(FASTTEXT_MODEL_PATH)
+            fasttext_model = fasttext.load_model(FASTTEXT_MODEL_PATH)
             logger.info("FastText model loaded successfully")
         except Exception as e:
             logger.warning(f"Failed to load fasttext model: {e}, falling back to langdetect")
@@ -185,28 +241,85 @@ def calculate_english_score(text):
     
     return round(min(100, score), 2)
 
+def url_fingerprint(url):
+    """64-bit fingerprint of a URL; collisions stay unlikely up to billions of URLs."""
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+
+class UrlLedger:
+    """
+    Processed URLs as an append-only binary log of little-endian 64-bit fingerprints.
+    Each new URL costs one 8-byte unbuffered append, so a crash loses at most the record
+    being written; a torn tail is truncated on load. Fingerprints from earlier runs are
+    kept in a sorted NumPy array (8 bytes per URL), those of this run in a set.
+    """
+    RECORD = struct.Struct("<Q")
+
+    def __init__(self, path):
+        self.path = path
+        self.seen = np.empty(0, dtype=np.uint64)
+        self.added = set()
+        self.handle = None
+
+    def load(self):
+        if os.path.exists(self.path):
+            size = os.path.getsize(self.path)
+            complete = size - size % self.RECORD.size
+            if complete != size:
+                logger.warning(f"Truncating torn record at the end of {self.path}")
+                os.truncate(self.path, complete)
+            self.seen = np.unique(np.fromfile(self.path, dtype="<u8"))
+        self.handle = open(self.path, "ab", buffering=0)
+
+    def __contains__(self, url):
+        return self.contains_fingerprint(url_fingerprint(url))
+
+    def contains_fingerprint(self, fingerprint):
+        if fingerprint in self.added:
+            return True
+        i = np.searchsorted(self.seen, np.uint64(fingerprint))
+        return i < len(self.seen) and self.seen[i] == fingerprint
+
+    def add(self, url):
+        fingerprint = url_fingerprint(url)
+        if self.contains_fingerprint(fingerprint):
+            return
+        self.added.add(fingerprint)
+        self.handle.write(self.RECORD.pack(fingerprint))
+
+    def __len__(self):
+        return len(self.seen) + len(self.added)
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+def migrate_pickled_urls(ledger):
+    """Append the URLs of a legacy pickled set to an empty ledger."""
+    with open(PROCESSED_URLS_FILE, 'rb') as f:
+        urls = pickle.load(f)
+    for url in urls:
+        ledger.add(url)
+    logger.info(f"Migrated {len(urls)} URLs from {PROCESSED_URLS_FILE} to {PROCESSED_URLS_LOG}")
+
 def load_processed_urls():
-    """Load previously processed URLs from disk."""
+    """Open the processed URL ledger, migrating a legacy pickle when no ledger exists yet."""
     global processed_urls
-    try:
-        if os.path.exists(PROCESSED_URLS_FILE):
-            with open(PROCESSED_URLS_FILE, 'rb') as f:
-                processed_urls = pickle.load(f)
-            logger.info(f"Loaded {len(processed_urls)} previously processed URLs")
-        else:
-            processed_urls = set()
-    except Exception as e:
-        logger.error(f"Error loading processed URLs: {e}")
-        processed_urls = set()
+    processed_urls = UrlLedger(PROCESSED_URLS_LOG)
+    migrate = not os.path.exists(PROCESSED_URLS_LOG) and os.path.exists(PROCESSED_URLS_FILE)
+    processed_urls.load()
+    if migrate:
+        try:
+            migrate_pickled_urls(processed_urls)
+        except Exception as e:
+            logger.error(f"Error migrating processed URLs: {e}")
+    logger.info(f"Loaded {len(processed_urls)} previously processed URLs")
 
-def save_processed_urls():
-    """Save processed URLs to disk."""
-    try:
-        with open(PROCESSED_URLS_FILE, 'wb') as f:
-            pickle.dump(processed_urls, f)
-        logger.info(f"Saved {len(processed_urls)} processed URLs")
-    except Exception as e:
-        logger.error(f"Error saving processed URLs: {e}")
+def close_processed_urls():
+    """Close the processed URL ledger; every URL was already appended when it was marked."""
+    if processed_urls is not None:
+        processed_urls.close()
+        logger.info(f"Tracked {len(processed_urls)} processed URLs in {PROCESSED_URLS_LOG}")
 
 def is_already_processed(url):
     """Check if URL has already been processed."""
@@ -262,15 +375,23 @@ def is_good_quality_text(text: str, url: str = "") -> bool:
     
     return True
 
-async def download_parquet(session, url):
-    """Download parquet file from URL and return as bytes."""
+async def download_parquet(session, url, path):
+    """Stream a parquet file from URL to a local path (reused on later runs) and return the path."""
+    if os.path.exists(path):
+        logger.info(f"Using cached parquet file {path}")
+        return path
     logger.info(f"Downloading parquet file from {url}")
     try:
         async with session.get(url, headers={"user-agent": MY_AGENT}) as response:
             if response.status == 200:
-                data = await response.read()
-                logger.info(f"Download completed ({len(data)} bytes)")
-                return data
+                size = 0
+                async with aiofiles.open(path + ".part", "wb") as f_out:
+                    async for chunk in response.content.iter_chunked(1 << 20):
+                        await f_out.write(chunk)
+                        size += len(chunk)
+                os.replace(path + ".part", path)
+                logger.info(f"Download completed ({size} bytes)")
+                return path
             else:
                 logger.error(f"Failed to download file: HTTP {response.status}")
                 return None
@@ -278,155 +399,254 @@ async def download_parquet(session, url):
         logger.error(f"Exception during download: {e}")
         return None
 
-async def read_parquet(session):
-    """Read parquet file from local path or URL and return records as list of dicts."""
+def filter_index_batch(batch):
+    """
+    Apply the record filters to one decoded batch of the index and return the kept rows as dicts.
+    The English filter needs the content_languages column; iter_index_records warns when it is missing.
+    """
+    names = batch.schema.names
+    
+    # Filter by required fields
+    mask = pc.is_valid(batch.column("warc_record_offset"))
+    for field in ["warc_record_length", "warc_filename"]:
+        mask = pc.and_(mask, pc.is_valid(batch.column(field)))
+    
+    if "content_languages" in names:
+        english = pc.match_substring(batch.column("content_languages"), "eng", ignore_case=True)
+        mask = pc.and_(mask, pc.fill_null(english, False))
+    
+    # Filter by mime type if available
+    if "content_mime_detected" in names:
+        mime = batch.column("content_mime_detected")
+        html = pc.match_substring(mime, "text/html", ignore_case=True)
+        mask = pc.and_(mask, pc.or_(pc.is_null(mime), pc.fill_null(html, True)))
+    
+    return batch.filter(mask).to_pylist()
+
+def iter_index_records(path):
+    """Yield (rows read, filtered records) per batch of the parquet index, reading only INDEX_COLUMNS."""
+    parquet_file = pq.ParquetFile(path)
+    available = parquet_file.schema_arrow.names
+    columns = [column for column in INDEX_COLUMNS if column in available]
+    logger.info(f"Streaming {parquet_file.metadata.num_rows} index rows in "
+                f"{parquet_file.num_row_groups} row groups, columns: {columns}")
+    if "content_languages" not in available:
+        logger.warning(f"{path} has no content_languages column; records are not filtered to English")
+    for batch in parquet_file.iter_batches(batch_size=INDEX_BATCH_SIZE, columns=columns):
+        yield batch.num_rows, filter_index_batch(batch)
+
+async def read_parquet(session, fetch_queue, metrics):
+    """
+    Stream the parquet index from a local path or URL into the fetch queue as range groups.
+    Batches are decoded in a thread, so fetching starts after the first batch and memory stays
+    bounded by the batch size and the fetch queue. Returns the number of records queued.
+    """
     try:
         if PARQUET_PATH.startswith("http://") or PARQUET_PATH.startswith("https://"):
-            data = await download_parquet(session, PARQUET_PATH)
-            if data is None:
+            path = os.path.join("./warc_text_output", os.path.basename(urlparse(PARQUET_PATH).path))
+            path = await download_parquet(session, PARQUET_PATH, path)
+            if path is None:
                 logger.error("Failed to download parquet file")
-                return []
-            buffer = io.BytesIO(data)
-            df = pd.read_parquet(buffer)
+                return 0
         else:
             logger.info(f"Reading parquet file from local path: {PARQUET_PATH}")
-            df = pd.read_parquet(PARQUET_PATH)
-        
-        # Remove duplicates and limit for testing
-        # df = df.drop_duplicates(subset=['url'])
-        logger.info(f"Loaded {len(df)} unique records from parquet")
-        
-        # Apply filtering on dataframe first
-        initial_count = len(df)
+            path = PARQUET_PATH
         
-        # Filter by required fields
-        required_fields = ["warc_record_offset", "warc_record_length", "warc_filename"]
-        for field in required_fields:
-            df = df[df[field].notna()]
-
-        print(df.columns)
-        df = df[(df.content_languages.str.contains('eng', case=False, na=False)) ]
-        
-        logger.info(f"Loaded {len(df)} unique records from parquet")
-        logger.info(f"After required fields filter: {len(df)} records (removed {initial_count - len(df)})")
-        
-
-        # Filter by mime type if available
-        if 'content_mime_detected' in df.columns:
-            mime_count = len(df)
-            df = df[(df['content_mime_detected'].isna()) | 
-                   (df['content_mime_detected'].str.contains('text/html', case=False, na=True))]
-            logger.info(f"After mime type filter: {len(df)} records (removed {mime_count - len(df)})")
-        
-        # Limit to first 10 for testing (remove this line for full processing)
-        # if len(df) > 10:
-        #     df = df.iloc[:5000]
-        #     logger.info("Limited to first 10 records for testing")
+        batches = iter_index_records(path)
+        rows = 0
+        queued = 0
+        while True:
+            item = await asyncio.to_thread(next, batches, None)
+            if item is None:
+                break
+            batch_rows, records = item
+            rows += batch_rows
+            
+            # Skip already processed URLs before planning, so they are not downloaded
+            records = [record for record in records
+                       if not is_already_processed(record.get('url', 'unknown'))]
+            queued += len(records)
+            for group in plan_range_requests(records):
+                await fetch_queue.put(group)
+            metrics.indexed = rows
         
-        return df.to_dict(orient="records")
+        logger.info(f"Read {rows} index rows, queued {queued} records (removed {rows - queued})")
+        return queued
     except Exception as e:
         logger.error(f"Error reading parquet file: {e}")
-        return []
+        return 0
 
-async def download_warc_content(session, record, semaphore):
-    """Download WARC content separately from processing."""
-    url = record.get('url', 'unknown')
-    
-    # Skip if already processed
-    if is_already_processed(url):
-        logger.debug(f"Skipping already processed URL: {url}")
-        return None
-    
-    # Get metadata for later use
-    languages = record.get('content_languages', '')
-    mime = record.get('content_mime_detected', '')
+class PipelineMetrics:
+    """Counters of the fetch -> extract pipeline, used to size MAX_CONCURRENT and EXTRACT_WORKERS."""
+
+    def __init__(self):
+        self.indexed = 0  # Index rows read so far
+        self.requests = 0  # Range requests issued (after coalescing)
+        self.fetched = 0
+        self.extracted = 0
+        self.saved = 0
+        self.write_failures = 0  # Results lost to failed output writes (retried on the next run)
+        self.put_wait = 0.0  # Seconds fetchers spent blocked on a full queue
+        self.get_wait = 0.0  # Seconds extraction consumers spent idle on an empty queue
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.full_samples = 0
+
+    def sample(self, queue):
+        self.depth_samples += 1
+        self.depth_total += queue.qsize()
+        self.full_samples += queue.full()
+
+    def summary(self, queue):
+        samples = max(1, self.depth_samples)
+        return (f"index rows {self.indexed}, requests {self.requests}, fetched {self.fetched}, extracted {self.extracted}, saved {self.saved}, "
+                f"write failures {self.write_failures}, "
+                f"queue depth {queue.qsize()}/{queue.maxsize} (avg {self.depth_total / samples:.1f}, "
+                f"full {self.full_samples / samples * 100:.0f}% of samples), "
+                f"fetchers blocked {self.put_wait:.1f}s, extractors idle {self.get_wait:.1f}s")
+
+async def report_pipeline_metrics(queue, metrics):
+    """Sample the extraction queue depth every second and log the pipeline counters periodically."""
+    elapsed = 0
+    while True:
+        await asyncio.sleep(1)
+        metrics.sample(queue)
+        elapsed += 1
+        if elapsed % METRICS_INTERVAL == 0:
+            logger.info(f"Pipeline: {metrics.summary(queue)}")
+
+def init_extract_worker():
+    """ProcessPoolExecutor initializer: each extraction worker loads its own copy of the downloaded model."""
+    load_fasttext_model()
+
+def extract_warc_record(data, url):
+    """Parse a fetched WARC record and extract its text. Runs in an extraction worker process."""
+    stream = ArchiveIterator(io.BytesIO(data))
     
-    offset = int(record["warc_record_offset"])
-    length = int(record["warc_record_length"])
-    filename = record["warc_filename"]
-    s3_url = f"https://data.commoncrawl.org/{filename}"
-    byte_range = f"bytes={offset}-{offset + length - 1}"
+    for warc_record in stream:
+        if warc_record.rec_type == "response":
+            html_bytes = warc_record.content_stream().read()
+            html = html_bytes.decode("utf-8", errors="ignore")
+            
+            # Extract text using Justext first
+            paragraphs = justext.justext(html, justext.get_stoplist("English"))
+            text = "\n\n".join(p.text for p in paragraphs 
+                             if not p.is_boilerplate and p.text.strip())
+            
+            # If justext gives us nothing, try trafilatura
+            if not text.strip():
+                text = trafilatura.extract(html) or ""
+                if text.strip():
+                    logger.debug(f"Used trafilatura for {url} - got {len(text)} chars")
+            
+            # Always return a result, even if text is empty
+            text = text.strip()
+            
+            # Fast language detection
+            detected_lang = "unknown"
+            if text.strip():
+                detected_lang = detect_language_fast(text)
+                logger.debug(f"Detected language for {url}: {detected_lang}")
+            else:
+                logger.debug(f"Empty text from {url}")
+            
+            word_count = len(text.split()) if text else 0
+            char_count = len(text)
+            
+            if text:
+                logger.debug(f"Successfully extracted text from {url} "
+                           f"({word_count} words, {char_count} chars)")
+            else:
+                logger.debug(f"Blank text from {url}")
+            
+            return {
+                "text": text,
+                "word_count": word_count,
+                "char_count": char_count,
+                "detected_language": detected_lang
+            }
+    return None
+
+class RangeGroup:
+    """Index records of one WARC file fetched with a single range request covering [start, end)."""
+
+    def __init__(self, filename, record, offset, length):
+        self.filename = filename
+        self.start = offset
+        self.end = offset + length
+        self.records = [(record, offset, length)]
+
+    def add(self, record, offset, length):
+        self.records.append((record, offset, length))
+        self.end = max(self.end, offset + length)
+
+    def split(self, data):
+        """Cut the fetched buffer back into (record, bytes) pairs; records cut short by the server are skipped."""
+        for record, offset, length in self.records:
+            chunk = data[offset - self.start:offset - self.start + length]
+            if len(chunk) == length:
+                yield record, chunk
+            else:
+                logger.warning(f"Short range response for {record.get('url', 'unknown')} in {self.filename}")
+
+def plan_range_requests(records, gap=COALESCE_GAP, max_bytes=MAX_COALESCED_BYTES):
+    """
+    Group index records by WARC file and merge adjacent or near-adjacent byte ranges into
+    RangeGroups. Two ranges are merged when at most `gap` bytes separate them and the merged
+    request stays within `max_bytes`; a record larger than `max_bytes` gets its own request.
+    """
+    ranges = sorted(
+        (record["warc_filename"], int(record["warc_record_offset"]), int(record["warc_record_length"]), i)
+        for i, record in enumerate(records)
+    )
+    groups = []
+    current = None
+    for filename, offset, length, i in ranges:
+        if (current is not None and current.filename == filename and offset <= current.end + gap
+                and max(current.end, offset + length) - current.start <= max_bytes):
+            current.add(records[i], offset, length)
+        else:
+            current = RangeGroup(filename, records[i], offset, length)
+            groups.append(current)
+    return groups
+
+async def download_range_group(session, group):
+    """Download the raw bytes of a RangeGroup with one range request; extraction happens in extract_warc_record."""
+    s3_url = f"{WARC_BASE_URL}/{group.filename}"
+    label = f"{group.filename} [{group.start}-{group.end - 1}] ({len(group.records)} records)"
     
     headers = {
         "user-agent": MY_AGENT,
-        "Range": byte_range
+        "Range": f"bytes={group.start}-{group.end - 1}"
     }
     
-    async with semaphore:
-        for attempt in range(1, MAX_RETRIES + 1):
-            try:
-                async with session.get(s3_url, headers=headers) as response:
-                    if response.status == 206:
-                        data = await response.content.read()
-                        stream = ArchiveIterator(io.BytesIO(data))
-                        
-                        for warc_record in stream:
-                            if warc_record.rec_type == "response":
-                                html_bytes = warc_record.content_stream().read()
-                                html = html_bytes.decode("utf-8", errors="ignore")
-                                
-                                # Extract text using Justext first
-                                paragraphs = justext.justext(html, justext.get_stoplist("English"))
-                                text = "\n\n".join(p.text for p in paragraphs 
-                                                 if not p.is_boilerplate and p.text.strip())
-                                
-                                # If justext gives us nothing, try trafilatura
-                                if not text.strip():
-                                    text = trafilatura.extract(html) or ""
-                                    if text.strip():
-                                        logger.info(f"Used trafilatura for {url} - got {len(text)} chars")
-                                
-                                # Always return a result, even if text is empty
-                                text = text.strip()
-                                
-                                # Fast language detection
-                                detected_lang = "unknown"
-                                if text.strip():
-                                    detected_lang = detect_language_fast(text)
-                                    logger.debug(f"Detected language for {url}: {detected_lang}")
-                                else:
-                                    logger.info(f"Empty text from {url}")
-                                
-                                word_count = len(text.split()) if text else 0
-                                char_count = len(text)
-                                
-                                if text:
-                                    logger.info(f"Successfully extracted text from {url} "
-                                              f"({word_count} words, {char_count} chars)")
-                                else:
-                                    logger.info(f"Blank text from {url}")
-                                
-                                return {
-                                    "url": url,
-                                    "warc_filename": filename,
-                                    "text": text,
-                                    "word_count": word_count,
-                                    "char_count": char_count,
-                                    "content_languages": languages,
-                                    "content_mime_detected": mime,
-                                    "detected_language": detected_lang
-                                }
-                    
-                    elif response.status in [403, 429, 503]:
-                        wait_time = 2 ** attempt * random.uniform(10, 20)
-                        logger.warning(f"Rate limited or access denied ({response.status}) for {url}, "
-                                     f"retry {attempt}/{MAX_RETRIES}, waiting {wait_time:.2f}s")
-                        await asyncio.sleep(wait_time)
-                    else:
-                        logger.info(f"Failed to fetch {url}: HTTP {response.status}")
-                        return None
-            
-            except Exception as e:
-                wait_time =( 2 ** attempt) + random.uniform(10, 20)
-                logger.warning(f"Exception for {url}: {e}, "
-                             f"retry {attempt}/{MAX_RETRIES}, waiting {wait_time:.2f}s")
-                await asyncio.sleep(wait_time)
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            async with session.get(s3_url, headers=headers) as response:
+                if response.status == 206:
+                    return await response.content.read()
+                
+                elif response.status in [403, 429, 503]:
+                    wait_time = 2 ** attempt * random.uniform(10, 20)
+                    logger.warning(f"Rate limited or access denied ({response.status}) for {label}, "
+                                 f"retry {attempt}/{MAX_RETRIES}, waiting {wait_time:.2f}s")
+                    await asyncio.sleep(wait_time)
+                else:
+                    logger.info(f"Failed to fetch {label}: HTTP {response.status}")
+                    return None
+        
+        except Exception as e:
+            wait_time =( 2 ** attempt) + random.uniform(10, 20)
+            logger.warning(f"Exception for {label}: {e}, "
+                         f"retry {attempt}/{MAX_RETRIES}, waiting {wait_time:.2f}s")
+            await asyncio.sleep(wait_time)
     
     # Log final failure
-    logger.error(f"Failed to extract from {url} after {MAX_RETRIES} retries")
+    logger.error(f"Failed to fetch {label} after {MAX_RETRIES} retries")
     try:
         async with aiofiles.open(ERROR_LOG_FILE, "a") as err_file:
-            await err_file.write(f"Failed: {url}\n")
+            for record, _, _ in group.records:
+                await err_file.write(f"Failed: {record.get('url', 'unknown')}\n")
     except:
         pass
     return None
@@ -439,9 +659,6 @@ def process_extracted_content(content_data):
     url = content_data['url']
     text = content_data['text']
     
-    # Mark as processed
-    mark_as_processed(url)
-    
     # Create direct version (fast)
     direct_result = {
         "url": url,
@@ -465,99 +682,287 @@ def process_extracted_content(content_data):
     
     return direct_result, scored_result
 
-async def process_record(session, record, file_lock, semaphore):
-    """Process one record and save both direct and scored results."""
+async def process_range_group(session, group, extract_queue, metrics):
+    """Fetch one RangeGroup and hand its records to the extraction workers; waits while the queue is full."""
     try:
-        # Download and extract content
-        content_data = await download_warc_content(session, record, semaphore)
-        if content_data is not None:
+        data = await download_range_group(session, group)
+        metrics.requests += 1
+        if data is None:
+            return 0
+        fetched = 0
+        for record, record_data in group.split(data):
+            metrics.fetched += 1
+            started = time.monotonic()
+            await extract_queue.put((record, record_data))
+            metrics.put_wait += time.monotonic() - started
+            fetched += 1
+        return fetched
+    except Exception as e:
+        logger.error(f"Error processing range group {group.filename} [{group.start}-{group.end - 1}]: {e}")
+        return 0
+
+async def range_fetcher(session, fetch_queue, extract_queue, metrics):
+    """One of MAX_CONCURRENT fetchers: download queued range groups until a None sentinel arrives."""
+    while True:
+        group = await fetch_queue.get()
+        if group is None:
+            break
+        await process_range_group(session, group, extract_queue, metrics)
+
+async def extraction_consumer(pool, extract_queue, write_queue, metrics):
+    """Run queued records through the extraction pool and queue both direct and scored results for writing."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = time.monotonic()
+        item = await extract_queue.get()
+        metrics.get_wait += time.monotonic() - started
+        if item is None:
+            break
+        
+        record, data = item
+        url = record.get('url', 'unknown')
+        try:
+            extracted = await loop.run_in_executor(pool, extract_warc_record, data, url)
+            if extracted is None:
+                continue
+            metrics.extracted += 1
+            content_data = {
+                "url": url,
+                "warc_filename": record["warc_filename"],
+                "content_languages": record.get('content_languages', ''),
+                "content_mime_detected": record.get('content_mime_detected', ''),
+                **extracted
+            }
+            
             # Process content to create both versions
             direct_result, scored_result = process_extracted_content(content_data)
             
             if direct_result:
-                # Save both versions
-                async with file_lock:
-                    # Save direct version (fast)
-                    async with aiofiles.open(OUTPUT_FILE, "a", encoding="utf-8") as f_out:
-                        await f_out.write(json.dumps(direct_result, ensure_ascii=False) + "\n")
-                    
-                    # Save scored version (with English score)
-                    async with aiofiles.open(OUTPUT_FILE_SCORED, "a", encoding="utf-8") as f_scored:
-                        await f_scored.write(json.dumps(scored_result, ensure_ascii=False) + "\n")
-                
-                if direct_result['text']:
-                    logger.debug(f"Saved text from {direct_result['url']}")
-                else:
-                    logger.debug(f"Saved blank record from {direct_result['url']}")
-                return True
-        return False
-    except Exception as e:
-        logger.error(f"Error processing record {record.get('url', '')}: {e}")
-        return False
+                await write_queue.put((
+                    url,
+                    json.dumps(direct_result, ensure_ascii=False) + "\n",
+                    json.dumps(scored_result, ensure_ascii=False) + "\n",
+                ))
+        except Exception as e:
+            logger.error(f"Error processing record {url}: {e}")
+
+class ShardWriter:
+    """
+    JSONL output kept open and rotated into numbered shards of about OUTPUT_SHARD_BYTES
+    uncompressed bytes each. A new run starts a new shard instead of appending to old ones.
+    """
+
+    def __init__(self, base_path, max_bytes=OUTPUT_SHARD_BYTES, compression=OUTPUT_COMPRESSION):
+        self.prefix, extension = os.path.splitext(base_path)
+        self.extension = extension + (".zst" if compression == "zstd" else "")
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.index = self.next_index()
+        self.paths = []
+        self.raw = None
+        self.handle = None
+        self.written = 0
+
+    def next_index(self):
+        directory, name = os.path.split(self.prefix)
+        pattern = re.compile(re.escape(name) + r"-(\d+)\.")
+        indexes = [int(match.group(1)) for match in map(pattern.match, os.listdir(directory or "."))
+                   if match]
+        return max(indexes, default=-1) + 1
+
+    def rotate(self):
+        self.close()
+        path = f"{self.prefix}-{self.index:05d}{self.extension}"
+        self.index += 1
+        self.raw = open(path, "wb")
+        if self.compression == "zstd":
+            self.handle = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(self.raw)
+        else:
+            self.handle = self.raw
+        self.paths.append(path)
+        self.written = 0
+
+    def write(self, lines):
+        if self.handle is None or self.written >= self.max_bytes:
+            self.rotate()
+        data = "".join(lines).encode("utf-8")
+        self.handle.write(data)
+        self.written += len(data)
+
+    def flush(self):
+        """Make everything written so far readable from the shard, even if the process dies."""
+        if self.handle is None:
+            return
+        if self.compression == "zstd":
+            self.handle.flush(zstandard.FLUSH_BLOCK)
+        self.raw.flush()
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+            self.raw = None
+
+    def abandon(self):
+        """Drop the current shard after a failed write; the next write starts a new shard."""
+        try:
+            self.close()
+        except Exception as e:
+            logger.warning(f"Error closing {self.paths[-1]} after a failed write: {e}")
+        finally:
+            self.handle = None
+            self.raw = None
+
+def write_batch(direct_writer, scored_writer, batch):
+    """Write one batch of (url, direct line, scored line) to both outputs; runs in a thread."""
+    direct_writer.write([direct for _, direct, _ in batch])
+    scored_writer.write([scored for _, _, scored in batch])
+    direct_writer.flush()
+    scored_writer.flush()
+
+async def output_writer(write_queue, direct_writer, scored_writer, metrics):
+    """
+    Single owner of the output shards: drains the write queue in batches of up to
+    WRITE_BATCH_SIZE and marks URLs as processed only once their batch is flushed.
+    A failed batch is logged and skipped (its URLs are retried on the next run) and the
+    shards are reopened; after WRITE_MAX_FAILURES consecutive failures the writer raises,
+    and main() stops the rest of the pipeline.
+    """
+    try:
+        finished = False
+        failures = 0
+        while not finished:
+            batch = [await write_queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE and not write_queue.empty():
+                batch.append(write_queue.get_nowait())
+            if None in batch:
+                finished = True
+                batch = [item for item in batch if item is not None]
+            if not batch:
+                continue
+            
+            try:
+                await asyncio.to_thread(write_batch, direct_writer, scored_writer, batch)
+            except Exception as e:
+                failures += 1
+                metrics.write_failures += len(batch)
+                logger.error(f"Failed to write {len(batch)} results ({failures}/{WRITE_MAX_FAILURES}): {e}")
+                direct_writer.abandon()
+                scored_writer.abandon()
+                if failures >= WRITE_MAX_FAILURES:
+                    raise RuntimeError(f"Output writer failed {failures} times in a row") from e
+                continue
+            failures = 0
+            for url, _, _ in batch:
+                mark_as_processed(url)
+            metrics.saved += len(batch)
+            logger.debug(f"Saved {len(batch)} results")
+    finally:
+        direct_writer.abandon()
+        scored_writer.abandon()
+
+async def run_pipeline(pool, fetch_queue, extract_queue, write_queue, metrics):
+    """
+    Stream the index through the fetchers and extraction consumers into write_queue and
+    return the number of records queued. Stages are shut down in order with None
+    sentinels; if the pipeline is cancelled, its tasks are cancelled instead.
+    """
+    # Two consumers per worker keep every worker busy while results are being written
+    consumers = [
+        asyncio.create_task(extraction_consumer(pool, extract_queue, write_queue, metrics))
+        for _ in range(2 * EXTRACT_WORKERS)
+    ]
+    fetchers = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            logger.info(f"Streaming index with max concurrency: {MAX_CONCURRENT}, "
+                        f"extraction workers: {EXTRACT_WORKERS}")
+            
+            # Fetchers start right away; the index reader feeds them as batches are decoded
+            fetchers = [
+                asyncio.create_task(range_fetcher(session, fetch_queue, extract_queue, metrics))
+                for _ in range(MAX_CONCURRENT)
+            ]
+            total_processed = await read_parquet(session, fetch_queue, metrics)
+            for _ in fetchers:
+                await fetch_queue.put(None)
+            await asyncio.gather(*fetchers)
+        
+        for _ in consumers:
+            await extract_queue.put(None)
+        await asyncio.gather(*consumers)
+        return total_processed
+    finally:
+        for task in fetchers + consumers:
+            task.cancel()
+        await asyncio.gather(*fetchers, *consumers, return_exceptions=True)
 
 async def main():
     """Main function to process records from parquet file."""
     start_time = datetime.datetime.now()
     logger.info(f"Started at {start_time}")
     
-    # Initialize fasttext model and load processed URLs
-    logger.info("Loading fasttext model and processed URLs...")
-    load_fasttext_model()
+    # Fetch the model once here; each extraction worker then loads its own copy
+    download_fasttext_model()
+    logger.info("Loading processed URLs...")
     load_processed_urls()
     
-    file_lock = asyncio.Lock()
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT)
+    fetch_queue = asyncio.Queue(maxsize=FETCH_QUEUE_SIZE)
+    extract_queue = asyncio.Queue(maxsize=EXTRACT_QUEUE_SIZE)
+    write_queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+    direct_writer = ShardWriter(OUTPUT_FILE)
+    scored_writer = ShardWriter(OUTPUT_FILE_SCORED)
+    metrics = PipelineMetrics()
     success_count = 0
     total_processed = 0
     
     try:
-        async with aiohttp.ClientSession() as session:
-            # Load parquet file
-            records = await read_parquet(session)
-            if not records:
-                logger.error("No records loaded from parquet file. Exiting.")
-                return
-            
-            logger.info(f"Processing {len(records)} records with max concurrency: {MAX_CONCURRENT}")
-            
-            # Process all records
-            tasks = []
-            for record in records:
-                task = process_record(session, record, file_lock, semaphore)
-                tasks.append(task)
-                total_processed += 1
-            
-            # Execute all tasks
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+        with ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, initializer=init_extract_worker) as pool:
+            writer = asyncio.create_task(output_writer(write_queue, direct_writer, scored_writer, metrics))
+            reporter = asyncio.create_task(report_pipeline_metrics(extract_queue, metrics))
+            pipeline = asyncio.create_task(run_pipeline(pool, fetch_queue, extract_queue, write_queue, metrics))
+            try:
+                # The writer only finishes before its sentinel when it cannot continue:
+                # then nothing drains write_queue, so the pipeline is cancelled and the error re-raised
+                await asyncio.wait({pipeline, writer}, return_when=asyncio.FIRST_COMPLETED)
+                if writer.done():
+                    pipeline.cancel()
+                    await asyncio.gather(pipeline, return_exceptions=True)
+                    await writer
+                total_processed = await pipeline
+                if not total_processed:
+                    logger.error("No records loaded from parquet file.")
+            finally:
+                reporter.cancel()
+                if not writer.done():
+                    await write_queue.put(None)
+                    await writer
             
-            # Count successes
-            success_count = sum(1 for result in results 
-                              if result is not None and not isinstance(result, Exception))
+            success_count = metrics.saved
+            logger.info(f"Pipeline: {metrics.summary(extract_queue)}")
             
         end_time = datetime.datetime.now()
         elapsed = end_time - start_time
         
-        # Save processed URLs
-        save_processed_urls()
+        close_processed_urls()
         
         logger.info(f"Finished at {end_time}")
         logger.info(f"Total elapsed time: {elapsed}")
         logger.info(f"Successfully processed {success_count} out of {total_processed} records")
-        logger.info(f"Success rate: {success_count/total_processed*100:.1f}%")
-        logger.info(f"Direct results saved to: {OUTPUT_FILE}")
-        logger.info(f"Scored results saved to: {OUTPUT_FILE_SCORED}")
+        logger.info(f"Success rate: {success_count/max(1, total_processed)*100:.1f}%")
+        logger.info(f"Direct results saved to: {', '.join(direct_writer.paths) or 'no shards'}")
+        logger.info(f"Scored results saved to: {', '.join(scored_writer.paths) or 'no shards'}")
         logger.info(f"Errors logged to: {ERROR_LOG_FILE}")
         logger.info(f"Total processed URLs tracked: {len(processed_urls)}")
         
         # Print some stats
         if success_count > 0:
-            logger.info(f"Check {OUTPUT_FILE} for direct extracted text data")
-            logger.info(f"Check {OUTPUT_FILE_SCORED} for scored text data")
+            logger.info(f"Check {direct_writer.prefix}-*{direct_writer.extension} for direct extracted text data")
+            logger.info(f"Check {scored_writer.prefix}-*{scored_writer.extension} for scored text data")
         
     except Exception as e:
         logger.error(f"Fatal error: {e}")
-        # Save processed URLs even on error
-        save_processed_urls()
+        close_processed_urls()
         raise
 
 if __name__ == "__main__":
@@ -1,31 +1,47 @@
 import argparse
+import gzip
+import hashlib
+import json
 import logging
 import os
 import resource
 import signal
+import shlex
 import subprocess
-import glob
+import time
+import urllib.parse
+import urllib.request
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Dict, List, Optional
 
 from tqdm import tqdm
 
+from streaming_regex import classify_chunk
+from wet_reader import GZIP_BACKEND, WetReader, is_local, local_path, open_segment
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO, 
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-# Update the COMMAND_TEMPLATE to use wget instead of curl
+# Update the COMMAND_TEMPLATE to use wget instead of curl (cat for segments in a local mirror)
 COMMAND_TEMPLATE = """
 bash -c 'set -o pipefail; \
-wget -q -O - {url} | \
+{fetch_command} | \
 pigz -d | \
 python3 streaming_regex.py \
 --output-dir {output_folder} \
 --output-file {output_file}'
 """
 
+# Segment paths in wet.paths.gz are relative to this root; a local/NFS mirror directory or
+# another http(s) base URL with the same layout can be used instead
+DEFAULT_MIRROR_ROOT = "https://data.commoncrawl.org"
+
+# Local copy of the downloaded path list, with its checksum and source in PATH_LIST_CACHE + ".sha256"
+PATH_LIST_CACHE = "wet.paths.gz"
+
 # List of language subfolders
 LANGUAGE_SUBFOLDERS = [
     'tel', 'asm', 'pan', 'ben', 'tam', 'mal', 
@@ -43,49 +59,218 @@ def set_resource_limits():
     # Optional: Set memory limit per process (8GB)
     # resource.setrlimit(resource.RLIMIT_AS, (8 * 1024 * 1024 * 1024, -1))
 
-def check_file_exists(output_folder: str, output_filename: str) -> bool:
+# Decompressed WET text classified per call in the native reader
+NATIVE_BLOCK_SIZE = 4 << 20
+NATIVE_BATCH_SIZE = 10000
+READ_TIMEOUT = 60  # Seconds a segment read may wait for data before failing
+
+def checkpoint_path_for(output_folder: str, output_filename: str) -> str:
+    """Progress file of a segment being processed by the native reader"""
+    return os.path.join(output_folder, ".progress", output_filename + ".json")
+
+def save_checkpoint(path: str, state: Dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def output_filename_for(url: str) -> str:
+    """Name of a segment's output file in every language subfolder"""
+    return f"regex_{url.split('segments')[-1].replace('.ec2.internal.warc.wet.gz', '').replace('/', '_').replace('.','_').replace('-','_')}.txt"
+
+def segment_url(mirror_root: str, path: str) -> str:
+    """Location of a segment path under a mirror root (directory or http(s) base URL)"""
+    if is_local(mirror_root):
+        return os.path.join(local_path(mirror_root), path)
+    return f"{mirror_root.rstrip('/')}/{path}"
+
+def segment_key(url: str, mirror_root: str = DEFAULT_MIRROR_ROOT) -> str:
+    """Ledger key of a segment: its path in the crawl, independent of the mirror it is read from"""
+    if is_local(mirror_root):
+        root = local_path(mirror_root).rstrip('/') + '/'
+        if url.startswith(root):
+            return url[len(root):]
+    elif url.startswith(mirror_root.rstrip('/') + '/'):
+        return url[len(mirror_root.rstrip('/')) + 1:]
+    return urllib.parse.urlparse(url).path.lstrip('/')
+
+class SegmentLedger:
     """
-    Check if the file exists in any of the language subfolders
-    
-    Args:
-        output_folder: Base output folder
-        output_filename: Filename to check
-        
+    Append-only completion ledger of a curation run (manifest.jsonl in the output folder).
+
+    Every finished segment appends one JSON line with its status ("done" or "failed"),
+    output sizes, duration and metrics; the latest line of a segment wins. The ledger is
+    read once at startup, replacing per-segment scans of the language subfolders.
+    """
+
+    FILE = "manifest.jsonl"
+
+    def __init__(self, output_folder: str):
+        self.path = os.path.join(output_folder, self.FILE)
+        self.entries: Dict[str, Dict] = {}
+        self.exists = os.path.exists(self.path)
+        if self.exists:
+            self.load()
+
+    def load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line torn by an interrupted run: that segment is simply redone
+                    continue
+                self.entries[entry['segment']] = entry
+
+    def status(self, segment: str) -> Optional[str]:
+        entry = self.entries.get(segment)
+        return entry['status'] if entry else None
+
+    def record(self, segment: str, status: str, **fields):
+        entry = {'segment': segment, 'status': status, 'finished_at': time.time(), **fields}
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        self.entries[segment] = entry
+
+    def import_existing_outputs(self, output_folder: str, urls: List[str],
+                                mirror_root: str = DEFAULT_MIRROR_ROOT) -> int:
+        """
+        Seed a new ledger from outputs written before it existed: one directory listing per
+        language subfolder instead of a scan per segment. Segments with a native-reader
+        checkpoint are unfinished and are not imported.
+        """
+        existing = set()
+        for lang in LANGUAGE_SUBFOLDERS:
+            lang_path = os.path.join(output_folder, lang)
+            if os.path.isdir(lang_path):
+                existing.update(os.listdir(lang_path))
+        progress_path = os.path.join(output_folder, ".progress")
+        in_progress = set(os.listdir(progress_path)) if os.path.isdir(progress_path) else set()
+
+        imported = 0
+        for url in urls:
+            output_filename = output_filename_for(url)
+            if output_filename in existing and output_filename + ".json" not in in_progress:
+                self.record(segment_key(url, mirror_root), "done", imported=True)
+                imported += 1
+        return imported
+
+    def summary(self) -> Dict:
+        """Crawl-level totals over all segments recorded as done"""
+        done = [e for e in self.entries.values() if e['status'] == 'done' and not e.get('imported')]
+        seconds = sum(e.get('seconds', 0) for e in done)
+        compressed = sum(e.get('metrics', {}).get('compressed_bytes', 0) for e in done)
+        return {
+            'done': sum(1 for e in self.entries.values() if e['status'] == 'done'),
+            'failed': sum(1 for e in self.entries.values() if e['status'] == 'failed'),
+            'output_bytes': sum(sum(e.get('output_bytes', {}).values()) for e in done),
+            'compressed_bytes': compressed,
+            'segment_seconds': seconds,
+            'mb_per_segment_second': compressed / (1 << 20) / seconds if seconds else 0.0,
+        }
+
+def process_url_native(url: str, output_folder: str, output_filename: str, timeout: int = 3600) -> Dict:
+    """
+    Stream a WET segment in-process: gzip members are decompressed as they arrive, the text of
+    conversion records is classified by streaming_regex's script classifier in blocks, and the
+    matches are appended to the per-language outputs.
+
+    Once a block is full the outputs are flushed at the next gzip member boundary and its
+    compressed offset is checkpointed, so an interrupted or timed-out segment resumes from
+    there (outputs are first truncated back to their checkpointed sizes) instead of starting
+    over. The timeout is checked after every member; a stalled download fails after
+    READ_TIMEOUT seconds without data.
+
     Returns:
-        bool: True if file exists in any subfolder, False otherwise
+        Per-segment metrics
     """
-    # First check in the main output folder
-    if os.path.exists(os.path.join(output_folder, output_filename)):
-        return True
-        
-    # Then check in all language subfolders
-    for lang in LANGUAGE_SUBFOLDERS:
-        lang_path = os.path.join(output_folder, lang)
-        if os.path.exists(os.path.join(lang_path, output_filename)):
-            return True
-            
-    # Check if the file exists in any subfolder using glob
-    # This handles cases where files might be in unexpected subfolders
-    glob_pattern = os.path.join(output_folder, "**", output_filename)
-    matching_files = glob.glob(glob_pattern, recursive=True)
-    
-    return len(matching_files) > 0
+    start_time = time.time()
+    checkpoint_path = checkpoint_path_for(output_folder, output_filename)
+    os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+    state = {'offset': 0, 'records': 0, 'lines': {}, 'output_sizes': {}}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            state = json.load(f)
+    resumed_from = state['offset']
+    save_checkpoint(checkpoint_path, state)
+
+    handles = {}
+    try:
+        for lang in LANGUAGE_SUBFOLDERS:
+            path = os.path.join(output_folder, lang, output_filename)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handles[lang] = open(path, "ab")
+            # Drop lines written after the last checkpoint
+            handles[lang].truncate(state['output_sizes'].get(lang, 0))
+            handles[lang].seek(0, os.SEEK_END)
+
+        buffer = []
+        buffered = 0
 
-def process_url(url: str, output_folder: str, timeout: int = 3600) -> Dict:
+        def flush(end_offset: int):
+            if buffer:
+                blocks = classify_chunk((b"".join(buffer), NATIVE_BATCH_SIZE, "jsonl", None))
+                for lang, block in blocks.items():
+                    handles[lang].write(block)
+                    state['lines'][lang] = state['lines'].get(lang, 0) + block.count(b"\n")
+            for handle in handles.values():
+                handle.flush()
+            state['offset'] = end_offset
+            state['output_sizes'] = {lang: handle.tell() for lang, handle in handles.items()}
+            save_checkpoint(checkpoint_path, state)
+            buffer.clear()
+
+        with open_segment(url, resumed_from, timeout=min(timeout, READ_TIMEOUT)) as stream:
+            reader = WetReader(stream, resumed_from)
+            for headers, content, end_offset in reader:
+                state['records'] += 1
+                if headers.get('warc-type') == 'conversion':
+                    buffer.append(content if content.endswith(b"\n") else content + b"\n")
+                    buffered += len(content)
+                # Only member boundaries are safe resume points
+                if end_offset is None:
+                    continue
+                timed_out = time.time() - start_time > timeout
+                if buffered >= NATIVE_BLOCK_SIZE or timed_out:
+                    flush(end_offset)
+                    buffered = 0
+                if timed_out:
+                    raise TimeoutError(f"Timed out after {timeout} seconds at offset {end_offset}; progress saved")
+            flush(reader.compressed_bytes)
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    os.remove(checkpoint_path)
+    seconds = time.time() - start_time
+    return {
+        'compressed_bytes': reader.compressed_bytes - resumed_from,
+        'uncompressed_bytes': reader.uncompressed_bytes,
+        'records': state['records'],
+        'lines': state['lines'],
+        'resumed_from': resumed_from,
+        'seconds': seconds,
+        'mb_per_second': (reader.compressed_bytes - resumed_from) / (1 << 20) / seconds if seconds else 0.0,
+        'decompressor': GZIP_BACKEND,
+    }
+
+def process_url(url: str, output_folder: str, timeout: int = 3600, reader: str = "native") -> Dict:
     """
     Process a single URL with proper resource management and error handling.
-    Skip processing if output file already exists in any language subfolder.
+    Which segments still need processing is decided by the caller from the SegmentLedger.
     
     Args:
         url: The URL to process
         output_folder: Where to save the output
         timeout: Maximum seconds to allow for processing
+        reader: "native" streams the segment in-process; "shell" runs the wget | pigz | streaming_regex.py pipeline
         
     Returns:
         Dictionary containing status and details
     """
     # Create a cleaner filename from the URL
-    output_filename = f"regex_{url.split('segments')[-1].replace('.ec2.internal.warc.wet.gz', '').replace('/', '_').replace('.','_').replace('-','_')}.txt"
+    output_filename = output_filename_for(url)
+    start_time = time.time()
     
     result = {
         'url': url,
@@ -94,12 +279,6 @@ def process_url(url: str, output_folder: str, timeout: int = 3600) -> Dict:
         'output_file': output_filename
     }
 
-    # Check if the file already exists in any of the language subfolders
-    if check_file_exists(output_folder, output_filename):
-        result['success'] = True
-        result['error'] = "File already exists in one of the language subfolders, skipping"
-        return result
-
     # Ensure process is None initially for safe cleanup
     process = None
     
@@ -109,10 +288,26 @@ def process_url(url: str, output_folder: str, timeout: int = 3600) -> Dict:
         
         # Ensure output directory exists
         os.makedirs(output_folder, exist_ok=True)
+
+        if reader == "native":
+            # Resumes from the segment's checkpoint when a previous attempt was interrupted
+            result['metrics'] = process_url_native(url, output_folder, output_filename, timeout)
+            result['success'] = True
+            return result
+
+        # The shell pipeline appends, so drop the partial outputs of a failed earlier attempt
+        for lang in LANGUAGE_SUBFOLDERS:
+            partial_path = os.path.join(output_folder, lang, output_filename)
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
         
         # Prepare command with proper argument formatting
+        if is_local(url):
+            fetch_command = f"cat {shlex.quote(local_path(url))}"
+        else:
+            fetch_command = f"wget -q -O - {url}"
         command = COMMAND_TEMPLATE.format(
-            url=url,
+            fetch_command=fetch_command,
             output_folder=output_folder,
             output_file=output_filename
         )
@@ -149,52 +344,83 @@ def process_url(url: str, output_folder: str, timeout: int = 3600) -> Dict:
                 os.killpg(os.getpgid(process.pid), signal.SIGTERM)
             except (ProcessLookupError, OSError):
                 pass
+        result['seconds'] = time.time() - start_time
+        if result['success']:
+            result['output_bytes'] = {
+                lang: os.path.getsize(path)
+                for lang in LANGUAGE_SUBFOLDERS
+                for path in [os.path.join(output_folder, lang, output_filename)]
+                if os.path.exists(path)
+            }
     
     return result
 
-def fetch_url_list(input_url: str, output_folder: str) -> Optional[List[str]]:
-    """Download and parse the URL list in a streaming manner using wget."""
+def read_path_list(input_url: str, output_folder: str, refresh: bool = False) -> bytes:
+    """
+    Return the gzip-compressed wet.paths list. A local file is read directly; a downloaded
+    list is cached in the output folder and reused as long as its SHA-256 and source URL match.
+    """
+    if is_local(input_url):
+        with open(local_path(input_url), "rb") as f:
+            return f.read()
+
+    cache_path = os.path.join(output_folder, PATH_LIST_CACHE)
+    checksum_path = cache_path + ".sha256"
+    if not refresh and os.path.exists(cache_path) and os.path.exists(checksum_path):
+        with open(checksum_path, "r") as f:
+            checksum, _, source = f.read().strip().partition("  ")
+        with open(cache_path, "rb") as f:
+            data = f.read()
+        if source == input_url and hashlib.sha256(data).hexdigest() == checksum:
+            logging.info(f"Using cached URL list {cache_path} (sha256 {checksum[:12]})")
+            return data
+        logging.warning(f"Cached URL list {cache_path} does not match {input_url}; downloading again")
+
+    with urllib.request.urlopen(input_url, timeout=300) as response:
+        data = response.read()
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, cache_path)
+    with open(checksum_path, "w") as f:
+        f.write(f"{hashlib.sha256(data).hexdigest()}  {input_url}\n")
+    return data
+
+def fetch_url_list(input_url: str, output_folder: str, mirror_root: str = DEFAULT_MIRROR_ROOT,
+                   refresh: bool = False) -> Optional[List[str]]:
+    """Read the segment path list (cached locally) and resolve every path under the mirror root."""
     logging.info("Fetching URL list...")
-    version = input_url.split('/')[5]
-    wet_urls = []
     
     try:
-        # Stream download and process the URL list without saving to disk, using wget
-        process = subprocess.Popen(
-            f"wget -q -O - {input_url} | gunzip",
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True
-        )
-        
-        stdout, stderr = process.communicate()
-        
-        if process.returncode != 0:
-            logging.error(f"Failed to download URL list: {stderr}")
-            return None
-            
-        # Process each line and add prefix
-        for line in stdout.splitlines():
-            if line.strip():
-                wet_urls.append(f"https://data.commoncrawl.org/{line.strip()}")
-                
-        logging.info(f"Found {len(wet_urls)} URLs to process")
+        data = read_path_list(input_url, output_folder, refresh)
+        wet_urls = [
+            segment_url(mirror_root, line.strip())
+            for line in gzip.decompress(data).decode("utf-8").splitlines()
+            if line.strip()
+        ]
+        logging.info(f"Found {len(wet_urls)} URLs to process under {mirror_root}")
         return wet_urls
         
     except Exception as e:
         logging.error(f"Error downloading URL list: {e}")
         return None
 
-def parallel_processing(input_url: str, output_folder: str, num_workers: int, batch_size: int = 20):
+def parallel_processing(input_url: str, output_folder: str, num_workers: int, batch_size: int = 20,
+                        timeout: int = 3600, reader: str = "native", retry_failed: bool = False,
+                        mirror_root: str = DEFAULT_MIRROR_ROOT, refresh_paths: bool = False):
     """
     Main processing function with improved resource management and progress tracking.
     
     Args:
-        input_url: URL to the list of files to process
+        input_url: URL or local path of the list of files to process
         output_folder: Where to save output files
         num_workers: Number of parallel workers
         batch_size: Number of URLs to process in each batch
+        timeout: Maximum seconds per URL
+        reader: "native" (in-process WET reader) or "shell" (subprocess pipeline)
+        retry_failed: Only process the segments the ledger records as failed
+        mirror_root: Directory or base URL the segment paths are resolved against
+        refresh_paths: Download the path list again even if a valid cached copy exists
     """
     logging.info('Starting parallel processing...')
     os.makedirs(output_folder, exist_ok=True)
@@ -206,17 +432,32 @@ def parallel_processing(input_url: str, output_folder: str, num_workers: int, ba
         logging.info(f"Ensured language folder exists: {lang_path}")
 
     # Get URL list in a streaming manner
-    wet_urls = fetch_url_list(input_url, output_folder)
+    wet_urls = fetch_url_list(input_url, output_folder, mirror_root, refresh_paths)
     if not wet_urls:
         return
 
-    total_urls = len(wet_urls)
-    logging.info(f"Processing {total_urls} URLs with {num_workers} workers...")
+    # Decide what to process from the completion ledger, read once
+    ledger = SegmentLedger(output_folder)
+    if not ledger.exists:
+        imported = ledger.import_existing_outputs(output_folder, wet_urls, mirror_root)
+        if imported:
+            logging.info(f"Recorded {imported} segments with existing outputs in {ledger.path}")
+    if retry_failed:
+        todo = [url for url in wet_urls if ledger.status(segment_key(url, mirror_root)) == "failed"]
+    else:
+        todo = [url for url in wet_urls if ledger.status(segment_key(url, mirror_root)) != "done"]
+    skipped = [url for url in wet_urls if ledger.status(segment_key(url, mirror_root)) == "done"]
+
+    total_urls = len(todo)
+    logging.info(f"Processing {total_urls} of {len(wet_urls)} URLs with {num_workers} workers...")
+    if not todo:
+        return
 
     # Track results
     successful = []
-    skipped = []
     failed = []
+    totals = {'compressed_bytes': 0, 'uncompressed_bytes': 0, 'records': 0}
+    start_time = time.time()
     
     # Create progress bar
     pbar = tqdm(total=total_urls, desc="Processing files", unit="file")
@@ -226,19 +467,29 @@ def parallel_processing(input_url: str, output_folder: str, num_workers: int, ba
     
     with ProcessPoolExecutor(max_workers=num_workers) as executor:
         for i in range(0, total_urls, batch_size):
-            batch = wet_urls[i:i + batch_size]
-            futures = [executor.submit(process_url, url, output_folder) for url in batch]
+            batch = todo[i:i + batch_size]
+            futures = [executor.submit(process_url, url, output_folder, timeout, reader) for url in batch]
             
             for future in as_completed(futures):
                 try:
                     result = future.result()
                     if result['success']:
-                        if result['error'] and "already exists" in result['error']:
-                            skipped.append(result['url'])
-                            logging.info(f"Skipped {result['url']}: {result['error']}")
-                        else:
-                            successful.append(result['url'])
+                        successful.append(result['url'])
+                        ledger.record(segment_key(result['url'], mirror_root), "done", seconds=result['seconds'],
+                                      output_bytes=result['output_bytes'], metrics=result.get('metrics'))
+                        metrics = result.get('metrics')
+                        if metrics:
+                            for key in totals:
+                                totals[key] += metrics[key]
+                            logging.info(
+                                f"Processed {result['url']}: {metrics['records']} records, "
+                                f"{metrics['compressed_bytes'] / (1 << 20):.1f} MB compressed in "
+                                f"{metrics['seconds']:.1f}s ({metrics['mb_per_second']:.1f} MB/s), lines {metrics['lines']}"
+                                + (f", resumed from byte {metrics['resumed_from']}" if metrics['resumed_from'] else "")
+                            )
                     else:
+                        ledger.record(segment_key(result['url'], mirror_root), "failed", seconds=result.get('seconds'),
+                                      error=result['error'])
                         failed.append((result['url'], result['error']))
                         logging.error(f"Failed to process {result['url']}: {result['error']}")
                 except Exception as e:
@@ -259,12 +510,21 @@ def parallel_processing(input_url: str, output_folder: str, num_workers: int, ba
 
     # Final report
     logging.info("\nProcessing completed:")
-    logging.info(f"- Total URLs: {total_urls}")
+    logging.info(f"- Total URLs: {len(wet_urls)}")
     logging.info(f"- Successfully processed: {len(successful)}")
-    logging.info(f"- Skipped (already exist): {len(skipped)}")
+    logging.info(f"- Skipped (already done): {len(skipped)}")
     logging.info(f"- Failed: {len(failed)}")
+    if totals['records']:
+        elapsed = time.time() - start_time
+        logging.info(f"- Records read: {totals['records']:,}")
+        logging.info(f"- Compressed input: {totals['compressed_bytes'] / (1 << 30):.2f} GB "
+                     f"({totals['compressed_bytes'] / (1 << 20) / elapsed:.1f} MB/s overall)")
+    crawl = ledger.summary()
+    logging.info(f"- Crawl so far: {crawl['done']} segments done, {crawl['failed']} failed, "
+                 f"{crawl['output_bytes'] / (1 << 30):.2f} GB written, "
+                 f"{crawl['mb_per_segment_second']:.1f} MB/s per worker")
     
-    # Write failed URLs to file for potential retry
+    # Write failed URLs to file for inspection (rerun with --retry-failed to retry them)
     if failed:
         failed_file = os.path.join(output_folder, "failed_urls.txt")
         with open(failed_file, 'w') as f:
@@ -276,13 +536,23 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Extract pure Hindi lines by streaming zip files for unzipping then to regex for Hindi identification."
     )
-    parser.add_argument("url", type=str, help="URL for wet.paths.gz file")
+    parser.add_argument("url", type=str, help="URL or local path of the wet.paths.gz file")
     parser.add_argument("output_folder", type=str, help="Path to the output folder")
     parser.add_argument("--workers", type=int, default=8, help="Number of worker processes")
     parser.add_argument("--batch-size", type=int, default=20, help="Batch size for processing")
     parser.add_argument("--timeout", type=int, default=3600, help="Timeout per URL in seconds")
+    parser.add_argument("--reader", choices=["native", "shell"], default="native",
+                        help="native streams WET segments in-process (resumable); shell runs wget | pigz | streaming_regex.py")
+    parser.add_argument("--mirror-root", type=str, default=DEFAULT_MIRROR_ROOT,
+                        help="Root the segment paths are resolved against: a local/NFS mirror directory or an http(s) base URL")
+    parser.add_argument("--refresh-paths", action="store_true",
+                        help="Download the path list again instead of using the cached copy")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Only process segments recorded as failed in the output folder's manifest.jsonl")
 
     args = parser.parse_args()
-    parallel_processing(args.url, args.output_folder, num_workers=args.workers, batch_size=args.batch_size)
+    parallel_processing(args.url, args.output_folder, num_workers=args.workers, batch_size=args.batch_size,
+                        timeout=args.timeout, reader=args.reader, retry_failed=args.retry_failed,
+                        mirror_root=args.mirror_root, refresh_paths=args.refresh_paths)
 
     # python3 process_final.py https://data.commoncrawl.org/wet.paths.gz /nfs/shyam.pawar/cc_download/CC-MAIN-2025-08/
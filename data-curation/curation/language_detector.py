@@ -1,9 +1,20 @@
 import fasttext
 import os
+import re
 import sys
+import shutil
+import numpy as np
+from multiprocessing import Pool
 from tqdm import tqdm
 import argparse
 
+BATCH_SIZE = 4096
+CONFIDENCE_THRESHOLD = 0.5
+
+# Model shared by the worker processes of the multiprocess mode: loaded once in the parent and
+# inherited copy-on-write on fork, or loaded once per worker by the pool initializer otherwise
+_worker_model = None
+
 LANGUAGE_MAP = {
     "hindi": "hi",
     "devanagari": "hi", 
@@ -43,15 +54,42 @@ SCRIPT_MAP = {
     "limbu": "Limbu"
 }
 
-def count_lines_in_file(file_path):
-    """Count the number of lines in a given file."""
+def estimate_lines_in_file(file_path, sample_bytes=16 << 20):
+    """Estimate the number of lines in a file from the average line length of its first sample_bytes."""
     try:
-        with open(file_path, "r", encoding="utf-8", errors="ignore") as file:
-            return sum(1 for _ in file)
+        file_size = os.path.getsize(file_path)
+        with open(file_path, "rb") as file:
+            sample = file.read(sample_bytes)
+        sample_lines = sample.count(b"\n")
+        if not sample_lines or len(sample) == file_size:
+            return sample_lines + (1 if sample and not sample.endswith(b"\n") else 0)
+        return int(file_size * sample_lines / len(sample))
     except Exception as e:
-        print(f"Error counting lines in {file_path}: {e}")
+        print(f"Error estimating lines in {file_path}: {e}")
         return 0
 
+SCRIPT_RANGES = {
+    "Devanagari": ((0x0900, 0x097F), (0xA8E0, 0xA8FF), (0x1CD0, 0x1CFF)),
+    "Bengali": ((0x0980, 0x09FF),),
+    "Gujarati": ((0x0A80, 0x0AFF),),
+    "Gurmukhi": ((0x0A00, 0x0A7F),),
+    "Kannada": ((0x0C80, 0x0CFF),),
+    "Malayalam": ((0x0D00, 0x0D7F),),
+    "Oriya": ((0x0B00, 0x0B7F),),
+    "Tamil": ((0x0B80, 0x0BFF),),
+    "Telugu": ((0x0C00, 0x0C7F),),
+    "Arabic": ((0x0600, 0x06FF), (0x0750, 0x077F), (0x08A0, 0x08FF)),
+    "Tibetan": ((0x0F00, 0x0FFF),),
+    "Limbu": ((0x1900, 0x194F),)
+}
+
+# One compiled character class per script, so script checks run in C instead of per-character ord() loops
+SCRIPT_PATTERNS = {
+    script: re.compile("[" + "".join(f"\\u{start:04x}-\\u{end:04x}" for start, end in ranges) + "]")
+    for script, ranges in SCRIPT_RANGES.items()
+}
+LETTER_PATTERN = re.compile(r"[^\W\d_]")
+
 def load_fasttext_model(model_path):
     """Load the FastText model from the specified path."""
     if not os.path.exists(model_path):
@@ -78,44 +116,163 @@ def detect_language(model, text):
         confidence = scores[0] if scores else 0
         
         
-        if confidence > 0.5:
+        if confidence > CONFIDENCE_THRESHOLD:
             return lang_code
         return "unknown"
     except Exception:
         return "unknown"
 
-def contains_script_characters(text, language):
-    lang_lower = language.lower()
-    
-    script_ranges = {
-        "Devanagari": ((0x0900, 0x097F), (0xA8E0, 0xA8FF), (0x1CD0, 0x1CFF)),
-        "Bengali": ((0x0980, 0x09FF),),
-        "Gujarati": ((0x0A80, 0x0AFF),),
-        "Gurmukhi": ((0x0A00, 0x0A7F),),
-        "Kannada": ((0x0C80, 0x0CFF),),
-        "Malayalam": ((0x0D00, 0x0D7F),),
-        "Oriya": ((0x0B00, 0x0B7F),),
-        "Tamil": ((0x0B80, 0x0BFF),),
-        "Telugu": ((0x0C00, 0x0C7F),),
-        "Arabic": ((0x0600, 0x06FF), (0x0750, 0x077F), (0x08A0, 0x08FF)),
-        "Tibetan": ((0x0F00, 0x0FFF),),
-        "Limbu": ((0x1900, 0x194F),)
-    }
-    
-    script = SCRIPT_MAP.get(lang_lower)
-    if not script or script not in script_ranges:
-        return True 
-    
-    ranges = script_ranges[script]
-    for char in text:
-        code = ord(char)
-        for start, end in ranges:
-            if start <= code <= end:
-                return True
-    
-    return False
+def detect_languages(model, texts, threshold=CONFIDENCE_THRESHOLD):
+    """
+    Batched detect_language: one predict call for a list of stripped, non-empty lines,
+    with the confidence threshold applied to the whole batch at once.
+    """
+    if not texts:
+        return []
+    try:
+        labels, scores = model.predict(texts, k=1)
+    except Exception:
+        return [detect_language(model, text) for text in texts]
+
+    confidences = np.fromiter((s[0] if len(s) else 0.0 for s in scores), dtype=np.float64, count=len(texts))
+    confident = np.flatnonzero(confidences > threshold)
+    lang_codes = ["unknown"] * len(texts)
+    for i in confident:
+        lang_codes[i] = labels[i][0].replace("__label__", "")
+    return lang_codes
 
-def extract_language_lines(input_file, output_file, model_path, languages, min_chars=5, strict_mode=False):
+def script_coverage(text, language):
+    """
+    Fraction of the letters in text (including the script's combining signs) that belong to the
+    script of language, or None when the language has no known script.
+    """
+    pattern = SCRIPT_PATTERNS.get(SCRIPT_MAP.get(language.lower()))
+    if pattern is None:
+        return None
+
+    other = pattern.sub("", text)
+    script_chars = len(text) - len(other)
+    if not script_chars:
+        return 0.0
+    other_letters = len(other) - len(LETTER_PATTERN.sub("", other))
+    return script_chars / (script_chars + other_letters)
+
+def contains_script_characters(text, language, min_coverage=0.0):
+    """
+    Check that text is written in the script of language: with min_coverage 0 any character of
+    the script is enough, otherwise at least that fraction of its letters must be in the script.
+    Languages without a known script always pass.
+    """
+    coverage = script_coverage(text, language)
+    if coverage is None:
+        return True
+    if min_coverage <= 0:
+        return coverage > 0
+    return coverage >= min_coverage
+
+def plan_chunks(input_file, num_chunks):
+    """Split a file into about num_chunks byte ranges that start and end on line boundaries"""
+    file_size = os.path.getsize(input_file)
+    chunk_size = max(1, file_size // max(1, num_chunks))
+    ranges = []
+    with open(input_file, "rb") as f:
+        start = 0
+        while start < file_size:
+            f.seek(min(start + chunk_size, file_size) - 1)
+            f.readline()
+            end = min(f.tell(), file_size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+def read_lines(input_file, byte_range=None, progress=None):
+    """
+    Yield the decoded lines of a file, or of a line-aligned byte range of it.
+    progress, when given, is advanced by the number of bytes consumed.
+    """
+    with open(input_file, "rb", buffering=1 << 20) as infile:
+        start, end = byte_range if byte_range else (0, None)
+        infile.seek(start)
+        consumed = 0
+        while end is None or infile.tell() < end:
+            line = infile.readline()
+            if not line:
+                break
+            if progress is not None:
+                consumed += len(line)
+                if consumed >= 1 << 20:
+                    progress.update(consumed)
+                    consumed = 0
+            yield line.decode("utf-8", errors="ignore")
+        if progress is not None and consumed:
+            progress.update(consumed)
+
+def split_lines(model, lines, lang_codes, output_files, min_chars=5, strict_mode=False,
+                batch_size=BATCH_SIZE, min_coverage=0.0):
+    """
+    Detect the language of lines in batches of batch_size and append the lines of the
+    requested languages to their output files. Returns (lines_processed, language_counts).
+    Each output file is opened once, on its first line, and kept open until the input ends.
+    """
+    language_counts = {code: 0 for code in lang_codes}
+    handles = {}
+    lines_processed = 0
+    batch = []
+
+    def route(batch):
+        for line, lang_code in zip(batch, detect_languages(model, batch)):
+            if lang_code not in lang_codes:
+                continue
+            if strict_mode and not contains_script_characters(line, lang_codes[lang_code], min_coverage):
+                continue
+
+            outfile = handles.get(lang_code)
+            if outfile is None:
+                outfile = handles[lang_code] = open(output_files[lang_code], "a", encoding="utf-8",
+                                                    buffering=1 << 20)
+            outfile.write(line + "\n")
+            language_counts[lang_code] += 1
+
+    try:
+        for line in lines:
+            line = line.strip()
+            lines_processed += 1
+
+            if len(line) < min_chars:
+                continue
+
+            batch.append(line)
+            if len(batch) >= batch_size:
+                route(batch)
+                batch = []
+
+        route(batch)
+    finally:
+        for outfile in handles.values():
+            outfile.close()
+
+    return lines_processed, language_counts
+
+def _init_worker(model_path):
+    """Pool initializer: load the model once per worker unless inherited via fork"""
+    global _worker_model
+    if _worker_model is None:
+        _worker_model = fasttext.load_model(model_path)
+
+def _split_chunk(task):
+    input_file, byte_range, part, lang_codes, output_files, min_chars, strict_mode, batch_size, min_coverage = task
+    part_files = {code: f"{path}.part{part:05d}" for code, path in output_files.items()}
+    for path in part_files.values():
+        open(path, "w").close()
+    lines_processed, language_counts = split_lines(
+        _worker_model, read_lines(input_file, byte_range), lang_codes, part_files,
+        min_chars, strict_mode, batch_size, min_coverage
+    )
+    return part, lines_processed, language_counts
+
+def extract_language_lines(input_file, output_file, model_path, languages, min_chars=5, strict_mode=False,
+                           batch_size=BATCH_SIZE, workers=1, estimate_lines=False, min_coverage=0.0):
+    global _worker_model
     model = load_fasttext_model(model_path)
     
     lang_codes = {}
@@ -141,41 +298,55 @@ def extract_language_lines(input_file, output_file, model_path, languages, min_c
     
     os.makedirs(os.path.dirname(os.path.abspath(list(output_files.values())[0])), exist_ok=True)
     
-    language_counts = {code: 0 for code in lang_codes}
-    language_buffers = {code: [] for code in lang_codes}
-    buffer_size = 1000 
-    
-    total_lines = count_lines_in_file(input_file)
-    lines_processed = 0
-    
-    print(f"Processing {total_lines} lines from {input_file}")
-    
-    with open(input_file, "r", encoding="utf-8", errors="ignore") as infile:
-        for line in tqdm(infile, desc="Processing lines", total=total_lines):
-            line = line.strip()
-            lines_processed += 1
-            
-            if len(line) < min_chars:
-                continue
-                
-            lang_code = detect_language(model, line)
-            
-            if lang_code in lang_codes:
-                if strict_mode and not contains_script_characters(line, lang_codes[lang_code]):
-                    continue
-                
-                language_buffers[lang_code].append(line)
-                language_counts[lang_code] += 1
-                
-                if len(language_buffers[lang_code]) >= buffer_size:
-                    with open(output_files[lang_code], "a", encoding="utf-8") as outfile:
-                        outfile.write("\n".join(language_buffers[lang_code]) + "\n")
-                    language_buffers[lang_code] = []
-    
-    for lang_code, buffer in language_buffers.items():
-        if buffer:
-            with open(output_files[lang_code], "a", encoding="utf-8") as outfile:
-                outfile.write("\n".join(buffer) + "\n")
+    # Progress is reported in bytes against the file size, so the input is only read once
+    file_size = os.path.getsize(input_file)
+    if estimate_lines:
+        print(f"Processing ~{estimate_lines_in_file(input_file):,} lines ({file_size / (1 << 30):.2f} GB) from {input_file}")
+    else:
+        print(f"Processing {file_size / (1 << 30):.2f} GB from {input_file}")
+
+    if workers > 1:
+        # Each worker splits a line-aligned byte range into its own part files, which are
+        # appended to the outputs in input order so the result matches the serial mode
+        ranges = plan_chunks(input_file, workers * 4)
+        tasks = [(input_file, byte_range, part, lang_codes, output_files, min_chars, strict_mode, batch_size,
+                  min_coverage)
+                 for part, byte_range in enumerate(ranges)]
+        print(f"Splitting into {len(tasks)} chunks across {workers} processes")
+
+        _worker_model = model
+        lines_processed = 0
+        language_counts = {code: 0 for code in lang_codes}
+        part_paths = {code: [f"{out_path}.part{part:05d}" for part in range(len(tasks))]
+                      for code, out_path in output_files.items()}
+        try:
+            with Pool(processes=workers, initializer=_init_worker, initargs=(model_path,)) as pool, \
+                    tqdm(desc="Processing", total=file_size, unit="B", unit_scale=True) as progress:
+                for part, chunk_lines, chunk_counts in pool.imap_unordered(_split_chunk, tasks):
+                    start, end = ranges[part]
+                    progress.update(end - start)
+                    lines_processed += chunk_lines
+                    for code, count in chunk_counts.items():
+                        language_counts[code] += count
+
+            for code, out_path in output_files.items():
+                if language_counts[code]:
+                    with open(out_path, "ab") as outfile:
+                        for part_path in part_paths[code]:
+                            with open(part_path, "rb") as f:
+                                shutil.copyfileobj(f, outfile, 16 << 20)
+        finally:
+            # Also drop the parts a failed chunk or an interrupted merge left behind
+            for paths in part_paths.values():
+                for part_path in paths:
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+    else:
+        with tqdm(desc="Processing", total=file_size, unit="B", unit_scale=True) as progress:
+            lines_processed, language_counts = split_lines(
+                model, read_lines(input_file, progress=progress), lang_codes, output_files,
+                min_chars, strict_mode, batch_size, min_coverage
+            )
     
     print("\nDetection completed:")
     print(f"Total lines processed: {lines_processed}")
@@ -218,6 +389,15 @@ if __name__ == "__main__":
                         help="Minimum characters for a valid line")
     parser.add_argument("--strict", action="store_true",
                         help="Enable strict mode with additional script verification")
+    parser.add_argument("--min-script-coverage", type=float, default=0.0,
+                        help="Strict mode: minimum fraction of a line's letters in the language's script "
+                             "(0 accepts any line with a single character of the script)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="Lines passed to each FastText predict call")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes; each one splits a byte range of the input")
+    parser.add_argument("--estimate-lines", action="store_true",
+                        help="Print a line count estimated from a sample of the input")
     
     args = parser.parse_args()
     
@@ -232,5 +412,9 @@ if __name__ == "__main__":
         args.model, 
         args.languages, 
         args.min_chars,
-        args.strict
+        args.strict,
+        args.batch_size,
+        args.workers,
+        args.estimate_lines,
+        args.min_script_coverage
     )
@@ -1,96 +1,228 @@
 import os
-import re
 import sys
-import time
 import queue
 import json
 import threading
 import argparse
+import collections
+import unicodedata
 import concurrent.futures
-from typing import Dict, List, Pattern, Set, Tuple
-
-# Define a worker class for handling pattern matching in parallel
-class PatternMatcher:
-    def __init__(self, patterns: Dict[str, Pattern], batch_size: int = 1000):
-        self.patterns = patterns
-        self.batch_size = batch_size
-        self.result_queues: Dict[str, queue.Queue] = {}
-        
-    def initialize_queues(self):
-        """Initialize result queues for each language"""
-        for lang in self.patterns.keys():
-            self.result_queues[lang] = queue.Queue()
-        return self.result_queues
-        
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Unicode blocks of the supported languages. Languages sharing a block (Assamese and Bengali)
+# receive the same lines, as with the one-regex-per-language matcher this replaces.
+LANGUAGE_BLOCKS = {
+    "hin": (0x0900, 0x097F),  # Hindi/Devanagari
+    "ben": (0x0980, 0x09FF),  # Bengali
+    "asm": (0x0980, 0x09FF),  # Assamese (same as Bengali)
+    "guj": (0x0A80, 0x0AFF),  # Gujarati
+    "kan": (0x0C80, 0x0CFF),  # Kannada
+    "mal": (0x0D00, 0x0D7F),  # Malayalam
+    "ori": (0x0B00, 0x0B7F),  # Oriya/Odia
+    "pan": (0x0A00, 0x0A7F),  # Punjabi (Gurmukhi)
+    "tam": (0x0B80, 0x0BFF),  # Tamil
+    "tel": (0x0C00, 0x0C7F),  # Telugu
+    "urd": (0x0600, 0x06FF),  # Urdu
+    "bod": (0x0F00, 0x0FFF),  # Tibetan
+}
+
+# Output bucket of code-mixed lines in the mixed routing mode
+MIXED_BUCKET = "mixed"
+
+@dataclass
+class MixedRouting:
+    """
+    Thresholds of the mixed routing mode. Digits, punctuation and symbols are neutral; the
+    script fraction of a line is its share of the remaining (letter) characters. A line goes to
+    a language when that language's block reaches its threshold, otherwise to the mixed bucket
+    when the supported scripts together reach mixed_min_fraction, otherwise it is dropped.
+    """
+    default_threshold: float = 0.8
+    thresholds: Dict[str, float] = field(default_factory=dict)
+    mixed_min_fraction: float = 0.2
+
+    def threshold(self, lang: str) -> float:
+        return self.thresholds.get(lang, self.default_threshold)
+
+class ScriptClassifier:
+    """
+    Assigns lines to languages from a per-line histogram of Unicode blocks.
+
+    A batch of lines is encoded once to UTF-32 codepoints, every codepoint is mapped to a
+    histogram bin through a lookup table, and the histogram of all lines is built with a
+    single bincount. In the default strict mode a line belongs to a language when it
+    consists only of that language's block plus whitespace, which is what the former
+    fullmatch regexes accepted; route_mixed() applies script-fraction thresholds instead.
+    """
+
+    WHITESPACE = 0
+    NEUTRAL = 1  # digits, punctuation, symbols and format characters outside the blocks
+    LATIN = 2
+    OTHER = 3
+    FIRST_BLOCK = 4
+
+    def __init__(self, language_blocks: Dict[str, Tuple[int, int]] = LANGUAGE_BLOCKS):
+        blocks = sorted(set(language_blocks.values()))
+        block_bin = {block: i + self.FIRST_BLOCK for i, block in enumerate(blocks)}
+        self.num_bins = len(blocks) + self.FIRST_BLOCK
+        self.language_bins = {lang: block_bin[block] for lang, block in language_blocks.items()}
+        self.bin_languages: Dict[int, List[str]] = {}
+        for lang, bin_index in self.language_bins.items():
+            self.bin_languages.setdefault(bin_index, []).append(lang)
+        self.bin_names = {bin_index: "/".join(langs) for bin_index, langs in self.bin_languages.items()}
+        self.bin_names.update({self.LATIN: "latin", self.OTHER: "other"})
+
+        # Bin of every BMP codepoint; codepoints above the BMP fall in OTHER
+        self.table = np.full(0x10000, self.OTHER, dtype=np.uint8)
+        for cp in range(0x10000):
+            char = chr(cp)
+            if char.isspace():
+                self.table[cp] = self.WHITESPACE
+                continue
+            category = unicodedata.category(char)
+            if category[0] in "NPS" or category == "Cf":
+                self.table[cp] = self.NEUTRAL
+            elif category[0] == "L" and "LATIN" in unicodedata.name(char, ""):
+                self.table[cp] = self.LATIN
+        for (start, end), bin_index in block_bin.items():
+            self.table[start:end + 1] = bin_index
+
+    def histogram(self, batch: List[str]) -> np.ndarray:
+        """Block histogram of each line, shape (len(batch), num_bins)"""
+        codepoints = np.frombuffer("\n".join(batch).encode("utf-32-le"), dtype=np.uint32)
+        newlines = codepoints == 0x0A
+        line_ids = np.cumsum(newlines) - newlines
+        bins = np.where(codepoints < 0x10000, self.table[np.minimum(codepoints, 0xFFFF)], self.OTHER)
+        bins[newlines] = self.WHITESPACE
+        counts = np.bincount(line_ids * self.num_bins + bins, minlength=len(batch) * self.num_bins)
+        return counts.reshape(len(batch), self.num_bins)
+
     def process_batch(self, batch: List[str]) -> Dict[str, List[str]]:
         """Process a batch of lines and return matches by language"""
-        results: Dict[str, List[str]] = {lang: [] for lang in self.patterns.keys()}
-        
-        for line in batch:
-            for lang, pattern in self.patterns.items():
-                if pattern.fullmatch(line):
-                    results[lang].append(line)
-                    # Uncomment this if you want exclusive matching (one language per line)
-                    # break
-        
+        results: Dict[str, List[str]] = {lang: [] for lang in self.language_bins}
+        if not batch:
+            return results
+
+        counts = self.histogram(batch)
+        script_counts = counts[:, self.FIRST_BLOCK:]
+        # A line is monolingual when every non-whitespace character falls in one block
+        dominant = np.argmax(script_counts, axis=1)
+        lengths = counts.sum(axis=1) - counts[:, self.WHITESPACE]
+        matched = script_counts[np.arange(len(batch)), dominant] == lengths
+        matched &= lengths > 0
+
+        for i in np.flatnonzero(matched):
+            for lang in self.bin_languages[dominant[i] + self.FIRST_BLOCK]:
+                results[lang].append(batch[i])
         return results
-    
-    def matcher_worker(self, input_queue: queue.Queue):
-        """Worker function that processes batches from input queue"""
-        batch = []
-        while True:
-            try:
-                line = input_queue.get(timeout=1)
-                if line is None:
-                    break
-                
-                batch.append(line)
-                if len(batch) >= self.batch_size:
-                    self._process_and_distribute(batch)
-                    batch = []
-                    
-            except queue.Empty:
-                if batch:  # Process remaining items in batch
-                    self._process_and_distribute(batch)
-                    batch = []
-            finally:
-                if line is not None:
-                    input_queue.task_done()
-        
-        # Process any remaining items
-        if batch:
-            self._process_and_distribute(batch)
-        
-        # Signal completion to all result queues
-        for q in self.result_queues.values():
-            q.put(None)
-            
-        input_queue.task_done()
-    
-    def _process_and_distribute(self, batch: List[str]):
-        """Process a batch and put results in appropriate queues"""
-        results = self.process_batch(batch)
-        for lang, items in results.items():
-            for item in items:
-                self.result_queues[lang].put(item)
+
+    def route_mixed(self, batch: List[str], routing: MixedRouting) -> Dict[str, list]:
+        """
+        Route a batch by script fraction (see MixedRouting). Language buckets hold lines; the
+        mixed bucket holds (line, composition) pairs, composition being the fraction of the
+        line's letters in each script.
+        """
+        results: Dict[str, list] = {lang: [] for lang in self.language_bins}
+        results[MIXED_BUCKET] = []
+        if not batch:
+            return results
+
+        counts = self.histogram(batch)
+        letters = counts.sum(axis=1) - counts[:, self.WHITESPACE] - counts[:, self.NEUTRAL]
+        script_counts = counts[:, self.FIRST_BLOCK:]
+        dominant = np.argmax(script_counts, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dominant_fraction = script_counts[np.arange(len(batch)), dominant] / letters
+            supported_fraction = script_counts.sum(axis=1) / letters
+
+        candidates = np.flatnonzero((letters > 0) & (supported_fraction >= routing.mixed_min_fraction))
+        for i in candidates:
+            matched = False
+            for lang in self.bin_languages[dominant[i] + self.FIRST_BLOCK]:
+                if dominant_fraction[i] >= routing.threshold(lang):
+                    results[lang].append(batch[i])
+                    matched = True
+            if not matched:
+                composition = {
+                    self.bin_names[b]: round(int(counts[i, b]) / int(letters[i]), 4)
+                    for b in range(self.LATIN, self.num_bins) if counts[i, b]
+                }
+                results[MIXED_BUCKET].append((batch[i], composition))
+        return results
+
+_classifier: Optional[ScriptClassifier] = None
+
+def encode_lines(lines: List[str], output_format: str = "jsonl") -> bytes:
+    """Encode the lines of one language as a single block: JSON strings per line, or the raw text"""
+    if output_format == "text":
+        return ("\n".join(lines) + "\n").encode("utf-8")
+    return ("\n".join(json.dumps(line, ensure_ascii=False) for line in lines) + "\n").encode("utf-8")
+
+def encode_mixed(entries: List[Tuple[str, Dict[str, float]]]) -> bytes:
+    """Encode code-mixed lines as JSONL records with their script composition, in either output format"""
+    return ("\n".join(json.dumps({"text": line, "scripts": composition}, ensure_ascii=False)
+                      for line, composition in entries) + "\n").encode("utf-8")
+
+def classify_chunk(args: Tuple[bytes, int, str, Optional[MixedRouting]]) -> Dict[str, bytes]:
+    """
+    Worker task: split a block of stdin into lines, classify them in batches and return
+    one encoded output block per language that matched any line
+    """
+    global _classifier
+    if _classifier is None:
+        _classifier = ScriptClassifier()
+    data, batch_size, output_format, routing = args
+
+    lines = [line for line in (raw.strip() for raw in data.decode("utf-8", errors="ignore").split("\n")) if line]
+    results: Dict[str, list] = {}
+    for start in range(0, len(lines), batch_size):
+        batch = lines[start:start + batch_size]
+        if routing is None:
+            batch_results = _classifier.process_batch(batch)
+        else:
+            batch_results = _classifier.route_mixed(batch, routing)
+        for lang, items in batch_results.items():
+            results.setdefault(lang, []).extend(items)
+
+    blocks = {}
+    for lang, items in results.items():
+        if items:
+            blocks[lang] = encode_mixed(items) if lang == MIXED_BUCKET else encode_lines(items, output_format)
+    return blocks
+
+def read_chunks(stream, chunk_size: int):
+    """Read a binary stream in blocks of about chunk_size bytes that end on a line boundary"""
+    remainder = b""
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        data = remainder + data
+        cut = data.rfind(b"\n") + 1
+        if cut == 0:
+            remainder = data
+            continue
+        remainder = data[cut:]
+        yield data[:cut]
+    if remainder:
+        yield remainder
 
 def writer_thread_func(output_queue: queue.Queue, output_path: str):
-    """Continuously reads items from the queue and writes them to a file in JSONL format"""
+    """Continuously reads encoded blocks from the queue and writes each one with a single write"""
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    count = 0
     
-    with open(output_path, "a", encoding="utf-8") as f:
+    with open(output_path, "ab", buffering=1 << 20) as f:
         while True:
-            item = output_queue.get()
-            if item is None:
+            block = output_queue.get()
+            if block is None:
                 output_queue.task_done()
                 break
             
-            f.write(json.dumps(item, ensure_ascii=False) + "\n")
-            count += 1
+            f.write(block)
             output_queue.task_done()
-    
-    # print(f"Writer thread for {output_path}: finished writing {count} items.")
 
 def main():
     parser = argparse.ArgumentParser(description='Process text and separate by language with parallel processing')
@@ -99,43 +231,42 @@ def main():
     parser.add_argument('--output-file', type=str, required=True,
                         help='Name of output file in each language directory')
     parser.add_argument('--workers', type=int, default=max(1, os.cpu_count() - 1),
-                        help='Number of worker threads for pattern matching')
-    parser.add_argument('--batch-size', type=int, default=1000,
-                        help='Number of lines to process in a batch')
+                        help='Number of worker processes for script classification')
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help='Number of lines classified per vectorised batch')
+    parser.add_argument('--chunk-size-mb', type=float, default=4,
+                        help='Size of the stdin blocks handed to each worker process')
+    parser.add_argument('--output-format', choices=['jsonl', 'text'], default='jsonl',
+                        help='jsonl writes each line as a JSON string; text writes the raw lines')
+    parser.add_argument('--routing', choices=['strict', 'mixed'], default='strict',
+                        help='strict keeps lines made only of one script; mixed routes by script fraction '
+                             'and writes code-mixed lines to a mixed/ bucket')
+    parser.add_argument('--min-script-fraction', type=float, default=0.8,
+                        help='Mixed routing: fraction of letters a language\'s script needs')
+    parser.add_argument('--language-threshold', action='append', default=[], metavar='LANG=FRACTION',
+                        help='Mixed routing: per-language override of --min-script-fraction (repeatable)')
+    parser.add_argument('--mixed-min-fraction', type=float, default=0.2,
+                        help='Mixed routing: minimum fraction of supported-script letters kept in mixed/')
     args = parser.parse_args()
+
+    routing = None
+    buckets = list(LANGUAGE_BLOCKS)
+    if args.routing == 'mixed':
+        thresholds = {}
+        for spec in args.language_threshold:
+            lang, _, value = spec.partition('=')
+            if lang not in LANGUAGE_BLOCKS or not value:
+                parser.error(f"Invalid --language-threshold {spec!r}; expected LANG=FRACTION with LANG in {', '.join(LANGUAGE_BLOCKS)}")
+            thresholds[lang] = float(value)
+        routing = MixedRouting(args.min_script_fraction, thresholds, args.mixed_min_fraction)
+        buckets.append(MIXED_BUCKET)
     
-    # Define patterns for all supported languages
-    patterns = {
-        "hin": re.compile(r"^[\u0900-\u097F\s]+$"),  # Hindi/Devanagari
-        "ben": re.compile(r"^[\u0980-\u09FF\s]+$"),  # Bengali
-        "asm": re.compile(r"^[\u0980-\u09FF\s]+$"),  # Assamese (same as Bengali)
-        "guj": re.compile(r"^[\u0A80-\u0AFF\s]+$"),  # Gujarati
-        "kan": re.compile(r"^[\u0C80-\u0CFF\s]+$"),  # Kannada
-        "mal": re.compile(r"^[\u0D00-\u0D7F\s]+$"),  # Malayalam
-        "ori": re.compile(r"^[\u0B00-\u0B7F\s]+$"),  # Oriya/Odia
-        "pan": re.compile(r"^[\u0A00-\u0A7F\s]+$"),  # Punjabi (Gurmukhi)
-        "tam": re.compile(r"^[\u0B80-\u0BFF\s]+$"),  # Tamil
-        "tel": re.compile(r"^[\u0C00-\u0C7F\s]+$"),  # Telugu
-        "urd": re.compile(r"^[\u0600-\u06FF\s]+$"),  # Urdu
-        "bod": re.compile(r"^[\u0F00-\u0FFF\s]+$"),  # Tibetan
-    }
-    
-    # Initialize input queue and pattern matcher
-    input_queue = queue.Queue(maxsize=args.batch_size * 10)  # Buffer some batches
-    matcher = PatternMatcher(patterns, batch_size=args.batch_size)
-    result_queues = matcher.initialize_queues()
-    
-    # Create and start matcher worker threads
-    matcher_threads = []
-    for _ in range(args.workers):
-        thread = threading.Thread(target=matcher.matcher_worker, args=(input_queue,))
-        thread.daemon = True
-        thread.start()
-        matcher_threads.append(thread)
+    # Queues carry one encoded block per language and stdin block; bounded for backpressure
+    result_queues = {lang: queue.Queue(maxsize=64) for lang in buckets}
     
     # Create and start writer threads for each language
     writer_threads = {}
-    for lang in patterns.keys():
+    for lang in buckets:
         output_path = os.path.join(args.output_dir, lang, args.output_file)
         thread = threading.Thread(
             target=writer_thread_func,
@@ -144,34 +275,39 @@ def main():
         thread.daemon = True
         thread.start()
         writer_threads[lang] = thread
+
+    def distribute(results: Dict[str, bytes]):
+        for lang, block in results.items():
+            result_queues[lang].put(block)
     
-    # Process input from stdin
-    try:
-        for line in sys.stdin.buffer:
-            try:
-                decoded_line = line.decode('utf-8', errors='ignore').strip()
-                if decoded_line:
-                    input_queue.put(decoded_line)
-            except Exception as e:
-                sys.stderr.write(f"Error processing line: {e}\n")
-                sys.stderr.flush()
-    except KeyboardInterrupt:
-        sys.stderr.write("Interrupted by user. Finishing processing...\n")
-    except Exception as e:
-        sys.stderr.write(f"Error reading from stdin: {e}\n")
-        sys.stderr.flush()
-    finally:
-        # Signal matcher threads to finish
-        for _ in range(args.workers):
-            input_queue.put(None)
-        
-        # Wait for all matcher threads to finish
-        for thread in matcher_threads:
-            thread.join()
-        
-        # Wait for all writer threads to finish
-        for thread in writer_threads.values():
-            thread.join()
+    # Process input from stdin: blocks are classified in worker processes, at most two per
+    # worker in flight, and results are handed to the writers in input order
+    chunk_size = max(1, int(args.chunk_size_mb * (1 << 20)))
+    pending = collections.deque()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        try:
+            for data in read_chunks(sys.stdin.buffer, chunk_size):
+                pending.append(executor.submit(classify_chunk, (data, args.batch_size, args.output_format, routing)))
+                if len(pending) >= 2 * args.workers:
+                    distribute(pending.popleft().result())
+        except KeyboardInterrupt:
+            sys.stderr.write("Interrupted by user. Finishing processing...\n")
+        except Exception as e:
+            sys.stderr.write(f"Error reading from stdin: {e}\n")
+            sys.stderr.flush()
+        finally:
+            while pending:
+                try:
+                    distribute(pending.popleft().result())
+                except Exception as e:
+                    sys.stderr.write(f"Error processing block: {e}\n")
+                    sys.stderr.flush()
+
+            # Signal writer threads to finish and wait for them
+            for q in result_queues.values():
+                q.put(None)
+            for thread in writer_threads.values():
+                thread.join()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,124 @@
+import urllib.parse
+import urllib.request
+from typing import Dict, Iterator, Optional, Tuple
+
+# Fastest available zlib-compatible decompressor: ISA-L, then zlib-ng, then the standard library
+try:
+    from isal import isal_zlib as gzip_backend
+    GZIP_BACKEND = "isal"
+except ImportError:
+    try:
+        from zlib_ng import zlib_ng as gzip_backend
+        GZIP_BACKEND = "zlib-ng"
+    except ImportError:
+        import zlib as gzip_backend
+        GZIP_BACKEND = "zlib"
+
+GZIP_WBITS = 31
+READ_SIZE = 1 << 20
+
+
+def is_local(url: str) -> bool:
+    """True for local or NFS paths and file:// URLs"""
+    return urllib.parse.urlparse(url).scheme in ("", "file")
+
+
+def local_path(url: str) -> str:
+    parsed = urllib.parse.urlparse(url)
+    return urllib.parse.unquote(parsed.path) if parsed.scheme == "file" else url
+
+
+def open_segment(url: str, offset: int = 0, timeout: int = 60):
+    """
+    Open a WET segment as a binary stream, starting at a compressed byte offset.
+    Local paths (a mirrored crawl) are read directly; http(s) URLs use a range request.
+    """
+    if is_local(url):
+        stream = open(local_path(url), "rb", buffering=READ_SIZE)
+        stream.seek(offset)
+        return stream
+    request = urllib.request.Request(url)
+    if offset:
+        request.add_header("Range", f"bytes={offset}-")
+    response = urllib.request.urlopen(request, timeout=timeout)
+    if offset and response.status != 206:
+        response.close()
+        raise IOError(f"Server ignored the range request for {url}")
+    return response
+
+
+class WetReader:
+    """
+    Streaming reader of gzip-compressed WARC/WET files.
+
+    Common Crawl compresses every record as its own gzip member, so each member is
+    decompressed and parsed on its own. The last record of a member is yielded together
+    with the compressed offset at which the member ends, which is a safe resume point;
+    other records of a multi-record member get None, as resuming after them would skip
+    the rest of their member.
+    """
+
+    def __init__(self, stream, start_offset: int = 0):
+        self.stream = stream
+        self.compressed_bytes = start_offset
+        self.uncompressed_bytes = 0
+        self.records = 0
+
+    def members(self) -> Iterator[Tuple[bytes, int]]:
+        """Yield (decompressed member, compressed offset of its end)"""
+        decompressor = gzip_backend.decompressobj(GZIP_WBITS)
+        parts = []
+        consumed = self.compressed_bytes
+        pending = b""
+        while True:
+            data = pending or self.stream.read(READ_SIZE)
+            pending = b""
+            if not data:
+                break
+            parts.append(decompressor.decompress(data))
+            if decompressor.eof:
+                unused = decompressor.unused_data
+                consumed += len(data) - len(unused)
+                self.compressed_bytes = consumed
+                yield b"".join(parts), consumed
+                parts = []
+                pending = unused
+                decompressor = gzip_backend.decompressobj(GZIP_WBITS)
+            else:
+                consumed += len(data)
+        if parts and any(parts):
+            raise IOError("Truncated gzip member at end of stream")
+
+    def __iter__(self) -> Iterator[Tuple[Dict[str, str], bytes, Optional[int]]]:
+        """Yield (headers, content, resume offset after the record, or None inside a member)"""
+        for member, end_offset in self.members():
+            self.uncompressed_bytes += len(member)
+            records = list(split_records(member))
+            for i, (headers, content) in enumerate(records):
+                self.records += 1
+                yield headers, content, end_offset if i == len(records) - 1 else None
+
+
+def split_records(member: bytes) -> Iterator[Tuple[Dict[str, str], bytes]]:
+    """Yield (headers, content) for every WARC record in a decompressed member"""
+    position = 0
+    while position < len(member):
+        header_end = member.find(b"\r\n\r\n", position)
+        if header_end == -1:
+            break
+        headers = parse_headers(member[position:header_end])
+        content_start = header_end + 4
+        content_end = content_start + int(headers.get("content-length", 0))
+        yield headers, member[content_start:content_end]
+        # Records are terminated by an empty line
+        position = content_end + 4
+
+
+def parse_headers(block: bytes) -> Dict[str, str]:
+    """Parse a WARC header block into a dict with lower-case names"""
+    headers = {}
+    for line in block.decode("utf-8", errors="replace").split("\r\n")[1:]:
+        name, _, value = line.partition(":")
+        if value:
+            headers[name.strip().lower()] = value.strip()
+    return headers
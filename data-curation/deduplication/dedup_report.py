@@ -0,0 +1,157 @@
+import json
+import os
+import random
+import time
+from collections import defaultdict
+from pathlib import Path
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+REPORT_FILE = 'report.json'
+FILES_TABLE = 'files.parquet'
+
+
+def record_source(record, input_file, source_field='source'):
+    """
+    Source of a record: its source field when present, otherwise the parent directory
+    of the input file (the same name create_output_path keeps in the output tree).
+    """
+    source = record.get(source_field) if isinstance(record, dict) else None
+    return str(source) if source else Path(input_file).parent.name
+
+
+def _hash_label(record_hash):
+    return record_hash.hex() if isinstance(record_hash, bytes) else record_hash
+
+
+class DedupReport:
+    """
+    Collects per-file and per-source duplicate rates, the largest duplicate clusters,
+    a sample of duplicate pairs and per-stage timings for one deduplication run.
+    Memory stays bounded: clusters are tracked in a pruned heavy-hitter table and
+    pairs are reservoir-sampled.
+    """
+
+    def __init__(self, top_k=100, sample_size=100, max_tracked_clusters=200_000, text_preview=200, seed=0):
+        self.top_k = top_k
+        self.sample_size = sample_size
+        self.max_tracked_clusters = max_tracked_clusters
+        self.text_preview = text_preview
+        self.rng = random.Random(seed)
+        self.started = time.time()
+        self.files = []
+        self.sources = defaultdict(lambda: {'unique': 0, 'duplicates': 0})
+        self.timings = defaultdict(float)
+        self.shards = []
+        # hash -> [duplicates seen in this run, location of the last one]
+        self.clusters = {}
+        self.pairs = []
+        self.duplicates_seen = 0
+
+    def add_timings(self, timings):
+        for stage, seconds in timings.items():
+            self.timings[stage] += seconds
+
+    def record_file(self, input_file, unique, duplicates, invalid=0, sources=None, timings=None):
+        total = unique + duplicates
+        self.files.append({
+            'file': input_file,
+            'unique': unique,
+            'duplicates': duplicates,
+            'invalid': invalid,
+            'duplicate_rate': duplicates / total if total else 0.0,
+        })
+        for source, counts in (sources or {}).items():
+            self.sources[source]['unique'] += counts['unique']
+            self.sources[source]['duplicates'] += counts['duplicates']
+        if timings:
+            self.add_timings(timings)
+
+    def record_shard(self, shard, hashes, kept):
+        self.shards.append({'shard': shard, 'hashes': hashes, 'kept': kept})
+
+    def observe_duplicate(self, record_hash, input_file, line_num, text=''):
+        """
+        Count a duplicate record towards its cluster and offer it to the pair sample.
+        The pair's earlier side is the previous duplicate of the same text in this run,
+        or None when only the kept original (or a prior run) holds it.
+        """
+        self.duplicates_seen += 1
+        location = {'file': input_file, 'line': line_num}
+        cluster = self.clusters.get(record_hash)
+        previous = cluster[1] if cluster else None
+        if cluster:
+            cluster[0] += 1
+            cluster[1] = location
+        else:
+            self.clusters[record_hash] = [1, location]
+            if len(self.clusters) > self.max_tracked_clusters:
+                self._prune_clusters()
+        pair = {'hash': _hash_label(record_hash), 'duplicate': location, 'previous': previous,
+                'text': text[:self.text_preview]}
+        self._sample_pair(pair)
+
+    def add_cluster(self, record_hash, size, first, duplicate):
+        """
+        Record an exactly known cluster (parallel mode): size counts every occurrence in the run.
+        """
+        if size < 2:
+            return
+        self.clusters[record_hash] = [size - 1, duplicate]
+        if len(self.clusters) > self.max_tracked_clusters:
+            self._prune_clusters()
+        self.duplicates_seen += 1
+        self._sample_pair({'hash': _hash_label(record_hash), 'duplicate': duplicate, 'previous': first, 'text': ''})
+
+    def _sample_pair(self, pair):
+        if len(self.pairs) < self.sample_size:
+            self.pairs.append(pair)
+        else:
+            slot = self.rng.randrange(self.duplicates_seen)
+            if slot < self.sample_size:
+                self.pairs[slot] = pair
+
+    def _prune_clusters(self):
+        keep = sorted(self.clusters.items(), key=lambda item: item[1][0], reverse=True)
+        self.clusters = dict(keep[:self.max_tracked_clusters // 2])
+
+    def summary(self):
+        unique = sum(f['unique'] for f in self.files)
+        duplicates = sum(f['duplicates'] for f in self.files)
+        top_clusters = sorted(self.clusters.items(), key=lambda item: item[1][0], reverse=True)[:self.top_k]
+        return {
+            'wall_time_seconds': time.time() - self.started,
+            'files': len(self.files),
+            'unique': unique,
+            'duplicates': duplicates,
+            'duplicate_rate': duplicates / (unique + duplicates) if unique + duplicates else 0.0,
+            'stage_seconds': dict(self.timings),
+            'sources': {
+                source: dict(counts, duplicate_rate=counts['duplicates'] / max(1, counts['unique'] + counts['duplicates']))
+                for source, counts in sorted(self.sources.items())
+            },
+            'top_clusters': [
+                {'hash': _hash_label(h), 'size': count + 1, 'example_duplicate': location}
+                for h, (count, location) in top_clusters
+            ],
+            'duplicate_pairs': self.pairs,
+            'shards': self.shards,
+            'per_file': self.files,
+        }
+
+    def write(self, report_dir):
+        """
+        Write report.json, plus files.parquet when pandas with a Parquet engine is installed.
+        """
+        os.makedirs(report_dir, exist_ok=True)
+        with open(os.path.join(report_dir, REPORT_FILE), 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        if pd is not None and self.files:
+            try:
+                pd.DataFrame(self.files).to_parquet(os.path.join(report_dir, FILES_TABLE), index=False)
+            except ImportError as e:
+                print(f"Warning: Skipping Parquet report ({e})")
+        print(f"Dedup report written to {report_dir}")
@@ -0,0 +1,390 @@
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+
+from hash_index import DigestSet, ShardedDigestIndex
+
+OP_CHECK_AND_ADD = 1
+OP_QUERY = 2
+OP_STATS = 3
+OP_HELLO = 4
+
+REQUEST_HEADER = struct.Struct('<BI')
+LENGTH_PREFIX = struct.Struct('<I')
+
+BLOOM_FILE = 'bloom.npz'
+
+
+def digest_words(data, digest_size):
+    """
+    View concatenated raw digests as two uint64 hash values per digest for Bloom probing.
+    Digests are already uniformly distributed, so no further hashing is needed.
+    """
+    words = np.frombuffer(data, dtype='<u8').reshape(-1, digest_size // 8)
+    h1 = words[:, 0]
+    h2 = words[:, -1] if digest_size > 8 else (h1 * np.uint64(0x9E3779B97F4A7C15)) ^ (h1 >> np.uint64(29))
+    return h1, h2 | np.uint64(1)
+
+
+class BloomFilter:
+    """
+    Fixed-capacity Bloom filter over raw digests, stored as a NumPy bit array
+    and probed with double hashing.
+    """
+
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = int(capacity)
+        self.error_rate = error_rate
+        num_bits = max(64, int(-self.capacity * np.log(error_rate) / (np.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(num_bits / self.capacity * np.log(2))))
+        self.bits = bits if bits is not None else np.zeros((num_bits + 63) // 64, dtype=np.uint64)
+        self.num_bits = np.uint64(len(self.bits) * 64)
+        self.count = count
+
+    def _positions(self, h1, h2):
+        probes = np.arange(self.num_hashes, dtype=np.uint64)
+        return (h1[:, None] + probes[None, :] * h2[:, None]) % self.num_bits
+
+    def add_many(self, h1, h2):
+        positions = self._positions(h1, h2).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(6), np.uint64(1) << (positions & np.uint64(63)))
+        self.count += len(h1)
+
+    def contains_many(self, h1, h2):
+        positions = self._positions(h1, h2)
+        words = self.bits[positions >> np.uint64(6)]
+        return ((words >> (positions & np.uint64(63))) & np.uint64(1)).all(axis=1)
+
+
+class ScalableBloomFilter:
+    """
+    Bloom filter that grows by chaining filters of increasing capacity and
+    tightening error rate, so the overall false-positive rate stays bounded
+    without knowing the corpus size in advance.
+    """
+
+    def __init__(self, initial_capacity=10_000_000, error_rate=0.001, growth=2, tightening=0.5):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters = []
+
+    def __len__(self):
+        return sum(f.count for f in self.filters)
+
+    def _new_filter(self):
+        depth = len(self.filters)
+        bloom = BloomFilter(
+            self.initial_capacity * self.growth ** depth,
+            self.error_rate * (1 - self.tightening) * self.tightening ** depth
+        )
+        self.filters.append(bloom)
+        return bloom
+
+    def add_many(self, h1, h2):
+        start = 0
+        while start < len(h1):
+            bloom = self.filters[-1] if self.filters and self.filters[-1].count < self.filters[-1].capacity \
+                else self._new_filter()
+            end = min(len(h1), start + bloom.capacity - bloom.count)
+            bloom.add_many(h1[start:end], h2[start:end])
+            start = end
+
+    def contains_many(self, h1, h2):
+        found = np.zeros(len(h1), dtype=bool)
+        for bloom in self.filters:
+            found |= bloom.contains_many(h1, h2)
+        return found
+
+    def save(self, path):
+        arrays = {f'bits_{i}': bloom.bits for i, bloom in enumerate(self.filters)}
+        meta = {
+            'initial_capacity': self.initial_capacity, 'error_rate': self.error_rate,
+            'growth': self.growth, 'tightening': self.tightening,
+            'filters': [[bloom.capacity, bloom.error_rate, bloom.count] for bloom in self.filters],
+        }
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, meta=np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(data['meta'].tobytes().decode('utf-8'))
+            bloom = cls(meta['initial_capacity'], meta['error_rate'], meta['growth'], meta['tightening'])
+            for i, (capacity, error_rate, count) in enumerate(meta['filters']):
+                bloom.filters.append(BloomFilter(capacity, error_rate, bits=data[f'bits_{i}'].copy(), count=count))
+        return bloom
+
+
+class GlobalDedupIndex:
+    """
+    Exact digest store (sorted on-disk shards plus delta log) behind a scalable Bloom filter.
+    A Bloom miss proves a digest is new without touching the exact store;
+    only Bloom hits are confirmed against the shards.
+    """
+
+    def __init__(self, index_dir, num_shards=64, digest_size=16, initial_capacity=10_000_000,
+                 error_rate=0.001, compact_every=5_000_000):
+        self.index = ShardedDigestIndex(index_dir, num_shards, digest_size)
+        self.digest_size = self.index.digest_size
+        self.digests = DigestSet(self.index).load()
+        self.compact_every = compact_every
+        self.bloom_path = os.path.join(index_dir, BLOOM_FILE)
+        self.lock = threading.Lock()
+        self.compaction = None
+        self.stats = {'queries': 0, 'bloom_negatives': 0, 'seen': 0, 'added': 0}
+
+        if os.path.exists(self.bloom_path):
+            self.bloom = ScalableBloomFilter.load(self.bloom_path)
+        else:
+            self.bloom = ScalableBloomFilter(initial_capacity, error_rate)
+        if len(self.bloom) != len(self.digests):
+            self._rebuild_bloom(initial_capacity, error_rate)
+
+    def _rebuild_bloom(self, initial_capacity, error_rate, chunk_size=1_000_000):
+        print(f"Building Bloom filter over {len(self.digests)} existing digests...")
+        self.bloom = ScalableBloomFilter(initial_capacity, error_rate)
+        for shard in self.digests.shards:
+            for start in range(0, len(shard), chunk_size):
+                chunk = shard._digests[start:start + chunk_size]
+                self.bloom.add_many(*digest_words(chunk.tobytes(), self.digest_size))
+        if self.digests.delta:
+            self.bloom.add_many(*digest_words(b''.join(self.digests.delta), self.digest_size))
+
+    def lookup(self, digests, add=True):
+        """
+        Return a boolean array marking digests seen before (by any run). With add=True,
+        unseen digests are recorded, so the first caller to present a digest keeps it.
+        Duplicates within one batch are reported as seen after their first occurrence.
+        """
+        with self.lock:
+            h1, h2 = digest_words(b''.join(digests), self.digest_size)
+            maybe_seen = self.bloom.contains_many(h1, h2)
+            seen = np.zeros(len(digests), dtype=bool)
+            batch_new = set()
+            new_digests = []
+            for i, digest in enumerate(digests):
+                if digest in batch_new or (maybe_seen[i] and digest in self.digests):
+                    seen[i] = True
+                elif add:
+                    batch_new.add(digest)
+                    new_digests.append(digest)
+
+            self.stats['queries'] += len(digests)
+            self.stats['bloom_negatives'] += int(len(digests) - maybe_seen.sum())
+            self.stats['seen'] += int(seen.sum())
+            if new_digests:
+                for digest in new_digests:
+                    self.digests.add(digest)
+                self.digests.append(new_digests)
+                new_h1, new_h2 = digest_words(b''.join(new_digests), self.digest_size)
+                self.bloom.add_many(new_h1, new_h2)
+                self.stats['added'] += len(new_digests)
+                if len(self.digests.delta) >= self.compact_every and self.compaction is None:
+                    # Merge in the background; lookups keep using the current shards meanwhile
+                    self.digests.begin_compaction()
+                    self.compaction = threading.Thread(target=self._compact, daemon=True)
+                    self.compaction.start()
+            return seen
+
+    def _compact(self):
+        try:
+            shards = self.digests.build_compacted()
+        except Exception as e:
+            print(f"Error compacting the delta log: {e}")
+            shards = None
+        with self.lock:
+            if shards is not None:
+                self.digests.finish_compaction(shards)
+            else:
+                self.digests.abort_compaction()
+            self.compaction = None
+
+    def summary(self):
+        with self.lock:
+            return dict(self.stats, digests=len(self.digests), bloom_filters=len(self.bloom.filters))
+
+    def save(self):
+        while True:
+            with self.lock:
+                compaction = self.compaction
+                if compaction is None:
+                    self.digests.compact()
+                    self.bloom.save(self.bloom_path)
+                    return
+            compaction.join()
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed mid-message")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+class DedupRequestHandler(socketserver.BaseRequestHandler):
+    """
+    Serves length-prefixed batches of raw digests over a local socket.
+    Request: op (u8), count (u32), count * digest_size bytes.
+    Reply: count bytes (1 = seen before) or, for OP_STATS, a length-prefixed JSON document.
+    Every connection starts with OP_HELLO carrying the client's digest size in place of
+    count; the server replies with its own (u32) and closes the connection on a mismatch.
+    """
+
+    def handle(self):
+        index = self.server.dedup_index
+        verified = False
+        while True:
+            header = self.request.recv(REQUEST_HEADER.size, socket.MSG_WAITALL)
+            if len(header) < REQUEST_HEADER.size:
+                return
+            op, count = REQUEST_HEADER.unpack(header)
+            if op == OP_HELLO:
+                self.request.sendall(LENGTH_PREFIX.pack(index.digest_size))
+                verified = count == index.digest_size
+                if not verified:
+                    print(f"Warning: Rejected a client using {count}-byte digests "
+                          f"(index uses {index.digest_size}-byte digests)")
+                    return
+                continue
+            if not verified:
+                print("Warning: Closing a connection that skipped the digest size handshake")
+                return
+            if op == OP_STATS:
+                payload = json.dumps(index.summary()).encode('utf-8')
+                self.request.sendall(LENGTH_PREFIX.pack(len(payload)) + payload)
+                continue
+            data = _recv_exact(self.request, count * index.digest_size)
+            digests = [data[i:i + index.digest_size] for i in range(0, len(data), index.digest_size)]
+            seen = index.lookup(digests, add=(op == OP_CHECK_AND_ADD)) if digests else np.zeros(0, dtype=bool)
+            self.request.sendall(seen.astype(np.uint8).tobytes())
+
+
+class DedupServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, dedup_index):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.dedup_index = dedup_index
+        super().__init__(socket_path, DedupRequestHandler)
+
+
+class DedupClient:
+    """
+    Client for a running dedup service. Safe to use from several processes,
+    each with its own connection.
+    """
+
+    def __init__(self, socket_path, digest_size=16):
+        self.digest_size = digest_size
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self._handshake()
+
+    def _handshake(self):
+        """
+        Fail fast when the service was started with a different digest size, which
+        would otherwise desync the fixed-size protocol.
+        """
+        self.sock.sendall(REQUEST_HEADER.pack(OP_HELLO, self.digest_size))
+        (server_digest_size,) = LENGTH_PREFIX.unpack(_recv_exact(self.sock, LENGTH_PREFIX.size))
+        if server_digest_size != self.digest_size:
+            self.sock.close()
+            raise ValueError(f"Dedup service uses {server_digest_size}-byte digests but this run "
+                             f"uses {self.digest_size}-byte digests; match --digest-size to the service index")
+
+    def _lookup(self, op, digests):
+        if not digests:
+            return []
+        if any(len(digest) != self.digest_size for digest in digests):
+            raise ValueError(f"Dedup service expects {self.digest_size}-byte digests")
+        self.sock.sendall(REQUEST_HEADER.pack(op, len(digests)) + b''.join(digests))
+        return [flag == 1 for flag in _recv_exact(self.sock, len(digests))]
+
+    def check_and_add(self, digests):
+        """
+        Return one flag per digest (True = seen before) and record the unseen ones.
+        """
+        return self._lookup(OP_CHECK_AND_ADD, digests)
+
+    def query(self, digests):
+        return self._lookup(OP_QUERY, digests)
+
+    def stats(self):
+        self.sock.sendall(REQUEST_HEADER.pack(OP_STATS, 0))
+        (length,) = LENGTH_PREFIX.unpack(_recv_exact(self.sock, LENGTH_PREFIX.size))
+        return json.loads(_recv_exact(self.sock, length).decode('utf-8'))
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def serve(args):
+    t0 = time.time()
+    dedup_index = GlobalDedupIndex(
+        args.index_dir, args.num_shards, args.digest_size,
+        args.bloom_capacity, args.bloom_error_rate, args.compact_every
+    )
+    print(f"Loaded global dedup index {args.index_dir} with {len(dedup_index.digests)} digests "
+          f"in {time.time() - t0:.2f} seconds")
+
+    server = DedupServer(args.socket, dedup_index)
+
+    def shutdown(signum, frame):
+        print("Shutting down dedup service...")
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    print(f"Serving dedup queries on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+        print("Persisting index and Bloom filter...")
+        dedup_index.save()
+        print(f"Final stats: {dedup_index.summary()}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Shared global dedup index served over a local socket to concurrent deduplication.py runs",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--index-dir', required=True, help="Binary sharded index directory (see hash_index.py)")
+    parser.add_argument('--socket', required=True, help="Unix socket path to listen on")
+    parser.add_argument('--num-shards', type=int, default=64, help="Number of shards for a new index")
+    parser.add_argument('--digest-size', type=int, default=16, choices=[8, 16], help="Bytes per digest for a new index")
+    parser.add_argument('--bloom-capacity', type=int, default=10_000_000,
+                        help="Capacity of the first Bloom filter; later filters grow geometrically")
+    parser.add_argument('--bloom-error-rate', type=float, default=0.001, help="Target Bloom false-positive rate")
+    parser.add_argument('--compact-every', type=int, default=5_000_000,
+                        help="Merge the delta log into the sorted shards once it holds this many digests")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    serve(parse_args())
@@ -4,7 +4,30 @@ import hashlib
 import json
 import os
 import codecs
+import shutil
+import tempfile
+import unicodedata
+from collections import defaultdict
+from multiprocessing import Pool
 from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import orjson
+    load_json = orjson.loads
+except ImportError:
+    load_json = json.loads
+
+from dedup_report import DedupReport, record_source
+from dedup_service import DedupClient
+from hash_index import DigestSet, ShardedDigestIndex, convert_hex_hash_file, digest_dtype, shard_of
 
 # Remove GPU environment variable if not needed for processing
 # os.environ["CUDA_VISIBLE_DEVICES"] = "0,1,2,3,4,5,6,7"
@@ -35,23 +58,69 @@ def load_file_paths_from_txt(file_list_path):
                 print(f"Warning: File not found: {file_path}")
     return file_paths
 
-def compute_hash(record, hash_algorithm='md5'):
+XXHASH_ALGORITHMS = ('xxh3_64', 'xxh3_128')
+
+def build_hash_key(record, key_fields=('text',), unicode_normalization=None, collapse_whitespace=False):
+    """
+    Build the bytes that identify a record for deduplication from the chosen fields only,
+    so records with identical content but different metadata (url, id, timestamp) collide.
+    Returns None if every key field is missing or empty.
+    """
+    parts = []
+    for field in key_fields:
+        value = record.get(field, '')
+        if not isinstance(value, str):
+            value = json.dumps(value, ensure_ascii=False, sort_keys=True)
+        if unicode_normalization:
+            value = unicodedata.normalize(unicode_normalization, value)
+        # Normalize Hindi text: strip, or collapse every whitespace run to one space
+        value = ' '.join(value.split()) if collapse_whitespace else value.strip()
+        parts.append(value)
+    if not any(parts):
+        return None
+    # Using UTF-8 encoding to preserve Hindi characters
+    return '\x1f'.join(parts).encode('utf-8')
+
+def hash_bytes(key, hash_algorithm='md5'):
+    """
+    Hash key bytes with a hashlib algorithm or a fast non-cryptographic xxh3 variant.
+    """
+    if hash_algorithm in XXHASH_ALGORITHMS:
+        if xxhash is None:
+            raise ImportError(f"{hash_algorithm} requires the xxhash package (pip install xxhash)")
+        return getattr(xxhash, hash_algorithm)(key)
+    return hashlib.new(hash_algorithm, key)
+
+def compute_hash(record, hash_algorithm='md5', **key_options):
     """
-    Compute the hash of the 'text' attribute of the given record (JSON-like dict).
+    Compute the hash of the key fields ('text' by default) of the given record (JSON-like dict).
     Ensures proper handling of Hindi text.
     """
-    # Extract the 'text' attribute from the record
-    text = record.get('text', '')  # Default to empty string if 'text' is not found
-    if not text:
+    key = build_hash_key(record, **key_options)
+    if key is None:
         print(f"Warning: Missing 'text' attribute in record, skipping hash computation.")
         return None
+    return hash_bytes(key, hash_algorithm).hexdigest()
 
-    # Normalize Hindi text and compute hash
-    # Using UTF-8 encoding to preserve Hindi characters
-    normalized_text = text.strip()  # Remove leading/trailing whitespace
-    hash_object = hashlib.new(hash_algorithm, normalized_text.encode('utf-8'))
-    record_hash = hash_object.hexdigest()
-    return record_hash
+def compute_digest(record, hash_algorithm='md5', digest_size=16, **key_options):
+    """
+    Raw-bytes variant of compute_hash used by the sharded on-disk index.
+    The digest is truncated to digest_size bytes so every index entry has a fixed width.
+    """
+    key = build_hash_key(record, **key_options)
+    if key is None:
+        return None
+    return hash_bytes(key, hash_algorithm).digest()[:digest_size]
+
+def hash_key_options(args):
+    """
+    Keyword arguments for build_hash_key taken from the command line.
+    """
+    return {
+        'key_fields': tuple(args.hash_fields),
+        'unicode_normalization': None if args.unicode_normalization == 'none' else args.unicode_normalization,
+        'collapse_whitespace': args.collapse_whitespace,
+    }
 
 def create_output_path(input_file, output_base_dir, use_flat_structure=False):
     """
@@ -68,16 +137,33 @@ def create_output_path(input_file, output_base_dir, use_flat_structure=False):
         parent_name = input_path.parent.name
         return str(Path(output_base_dir) / parent_name / input_path.name)
 
-def process_file(input_file, output_base_dir, processed_hashes_file, existing_hashes, output_batch_size=10000, hash_batch_size=5000, hash_algorithm='md5', use_flat_structure=False):
+def write_hash_batch(processed_hashes_file, hash_batch):
+    """
+    Persist a batch of new hashes, either as hex lines or to the delta log of a binary DigestSet.
+    """
+    if isinstance(processed_hashes_file, DigestSet):
+        processed_hashes_file.append(hash_batch)
+    else:
+        processed_hashes_file.write('\n'.join(hash_batch) + '\n')
+        processed_hashes_file.flush()
+
+def process_file(input_file, output_base_dir, processed_hashes_file, existing_hashes, output_batch_size=10000, hash_batch_size=5000, hash_algorithm='md5', use_flat_structure=False, digest_size=None, key_options=None, report=None, source_field='source'):
     """
     Process each JSONL file and write non-duplicate records to output in batches.
     Ensures Hindi text is properly handled.
+    With digest_size set, raw binary digests are used instead of hex strings.
+    key_options selects and normalizes the hashed fields (see build_hash_key).
+    With a DedupReport, per-source counts, duplicates and stage timings are recorded.
     """
+    key_options = key_options or {}
     print(f"Processing file: {input_file}")
     processed_count = 0
     duplicate_count = 0
+    invalid_count = 0
     batch_records = []
     hash_batch = []
+    sources = defaultdict(lambda: {'unique': 0, 'duplicates': 0})
+    timings = {'parse': 0.0, 'hash': 0.0, 'lookup': 0.0, 'write': 0.0}
     
     # Create output file path
     output_file_path = create_output_path(input_file, output_base_dir, use_flat_structure)
@@ -90,21 +176,31 @@ def process_file(input_file, output_base_dir, processed_hashes_file, existing_ha
          codecs.open(output_file_path, 'w', encoding='utf-8') as outfile:
         
         for line_num, line in enumerate(infile, 1):
+            t_start = perf_counter()
             try:
                 # Attempt to parse the JSON line
                 record = json.loads(line.strip())
             except json.JSONDecodeError as e:
                 # Skip problematic lines and log the issue
                 print(f"Error decoding JSON on line {line_num} in {input_file}: {e}. Skipping this line.")
+                invalid_count += 1
                 continue
+            t_parsed = perf_counter()
 
             # Compute hash and process the record
-            record_hash = compute_hash(record, hash_algorithm)
+            if digest_size:
+                record_hash = compute_digest(record, hash_algorithm, digest_size, **key_options)
+            else:
+                record_hash = compute_hash(record, hash_algorithm, **key_options)
+            t_hashed = perf_counter()
 
-            if record_hash and record_hash not in existing_hashes:
+            is_unique = bool(record_hash) and record_hash not in existing_hashes
+            if is_unique:
                 # If hash is unique, add it to the existing_hashes set and add the record to the batch
                 existing_hashes.add(record_hash)
-                
+            t_looked_up = perf_counter()
+
+            if is_unique:
                 # Preserve original record with all attributes intact
                 batch_records.append(json.dumps(record, ensure_ascii=False))  # Preserve non-ASCII characters
                 hash_batch.append(record_hash)
@@ -112,11 +208,14 @@ def process_file(input_file, output_base_dir, processed_hashes_file, existing_ha
                 processed_count += 1
             else:
                 duplicate_count += 1
+                if report is not None and record_hash:
+                    report.observe_duplicate(record_hash, input_file, line_num, str(record.get('text', '')))
+            if report is not None:
+                sources[record_source(record, input_file, source_field)]['unique' if is_unique else 'duplicates'] += 1
 
             # Write hash batch when batch size is reached
             if len(hash_batch) >= hash_batch_size:
-                processed_hashes_file.write('\n'.join(hash_batch) + '\n')
-                processed_hashes_file.flush()
+                write_hash_batch(processed_hashes_file, hash_batch)
                 hash_batch = []
 
             # Write output batch when batch size is reached
@@ -124,6 +223,12 @@ def process_file(input_file, output_base_dir, processed_hashes_file, existing_ha
                 outfile.write('\n'.join(batch_records) + '\n')
                 outfile.flush()
                 batch_records = []
+            t_written = perf_counter()
+
+            timings['parse'] += t_parsed - t_start
+            timings['hash'] += t_hashed - t_parsed
+            timings['lookup'] += t_looked_up - t_hashed
+            timings['write'] += t_written - t_looked_up
 
             # Print progress for every 100000 records processed
             if line_num % 100000 == 0:
@@ -135,17 +240,516 @@ def process_file(input_file, output_base_dir, processed_hashes_file, existing_ha
             outfile.flush()
             
         if hash_batch:
-            processed_hashes_file.write('\n'.join(hash_batch) + '\n')
-            processed_hashes_file.flush()
+            write_hash_batch(processed_hashes_file, hash_batch)
+
+    if report is not None:
+        report.record_file(input_file, processed_count, duplicate_count, invalid_count, sources, timings)
+    print(f"Finished processing {input_file}. {processed_count} unique records written to {output_file_path}. {duplicate_count} duplicates found.\n")
+    return processed_count, duplicate_count
+
+def process_file_passthrough(input_file, output_base_dir, processed_hashes_file, existing_hashes, write_buffer_size=8 << 20, hash_batch_size=5000, hash_algorithm='md5', use_flat_structure=False, digest_size=None, key_options=None, report=None, source_field='source'):
+    """
+    Variant of process_file that never re-serialises kept records.
+    Lines are read as bytes, parsed with orjson (when installed) only to build the hash key,
+    and unique lines are copied unchanged to a large buffered binary writer.
+    """
+    key_options = key_options or {}
+    print(f"Processing file: {input_file}")
+    processed_count = 0
+    duplicate_count = 0
+    invalid_count = 0
+    hash_batch = []
+    sources = defaultdict(lambda: {'unique': 0, 'duplicates': 0})
+    timings = {'parse': 0.0, 'hash': 0.0, 'lookup': 0.0, 'write': 0.0}
+
+    output_file_path = create_output_path(input_file, output_base_dir, use_flat_structure)
+    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+
+    with open(input_file, 'rb', buffering=write_buffer_size) as infile, \
+         open(output_file_path, 'wb', buffering=write_buffer_size) as outfile:
+
+        for line_num, line in enumerate(infile, 1):
+            t_start = perf_counter()
+            try:
+                record = load_json(line)
+            except ValueError as e:
+                print(f"Error decoding JSON on line {line_num} in {input_file}: {e}. Skipping this line.")
+                invalid_count += 1
+                continue
+            t_parsed = perf_counter()
+
+            if digest_size:
+                record_hash = compute_digest(record, hash_algorithm, digest_size, **key_options)
+            else:
+                record_hash = compute_hash(record, hash_algorithm, **key_options)
+            t_hashed = perf_counter()
+
+            is_unique = bool(record_hash) and record_hash not in existing_hashes
+            if is_unique:
+                existing_hashes.add(record_hash)
+            t_looked_up = perf_counter()
+
+            if is_unique:
+                # Original bytes, only completing a missing final newline
+                outfile.write(line if line.endswith(b'\n') else line + b'\n')
+                hash_batch.append(record_hash)
+                processed_count += 1
+            else:
+                duplicate_count += 1
+                if report is not None and record_hash:
+                    report.observe_duplicate(record_hash, input_file, line_num, str(record.get('text', '')))
+            if report is not None:
+                sources[record_source(record, input_file, source_field)]['unique' if is_unique else 'duplicates'] += 1
+            t_written = perf_counter()
+
+            timings['parse'] += t_parsed - t_start
+            timings['hash'] += t_hashed - t_parsed
+            timings['lookup'] += t_looked_up - t_hashed
+            timings['write'] += t_written - t_looked_up
+
+            if len(hash_batch) >= hash_batch_size:
+                write_hash_batch(processed_hashes_file, hash_batch)
+                hash_batch = []
+
+            if line_num % 100000 == 0:
+                print(f"Processed {line_num} records in {input_file} ({processed_count} unique, {duplicate_count} duplicates).")
+
+        if hash_batch:
+            write_hash_batch(processed_hashes_file, hash_batch)
 
+    if report is not None:
+        report.record_file(input_file, processed_count, duplicate_count, invalid_count, sources, timings)
     print(f"Finished processing {input_file}. {processed_count} unique records written to {output_file_path}. {duplicate_count} duplicates found.\n")
     return processed_count, duplicate_count
 
+def spill_record_dtype(digest_size):
+    """
+    Layout of the per-shard spill entries written by the parallel scan phase.
+    """
+    return np.dtype([('digest', digest_dtype(digest_size)), ('file', '<u4'), ('line', '<u8')])
+
+def _spill_paths(work_dir, file_idx):
+    base = os.path.join(work_dir, 'spill', f'file-{file_idx:07d}')
+    return base + '.records.npy', base + '.offsets.npy'
+
+def _keep_paths(work_dir, shard):
+    base = os.path.join(work_dir, 'keep', f'shard-{shard:05d}')
+    return base + '.lines.npy', base + '.offsets.npy'
+
+def scan_file_to_shards(task):
+    """
+    Parallel phase 1: hash every record of one input file and spill
+    (digest, file, line) entries grouped by the shard that owns each digest.
+    """
+    file_idx, input_file, work_dir, num_shards, hash_algorithm, digest_size, key_options = task
+    try:
+        per_shard = [[] for _ in range(num_shards)]
+        missing_count = 0
+        invalid_count = 0
+        # Binary lines split only on b'\n', so phase 3 sees exactly the same line numbers
+        with open(input_file, 'rb') as infile:
+            for line_num, line in enumerate(infile, 1):
+                try:
+                    record = load_json(line)
+                except ValueError as e:
+                    print(f"Error decoding JSON on line {line_num} in {input_file}: {e}. Skipping this line.")
+                    invalid_count += 1
+                    continue
+                digest = compute_digest(record, hash_algorithm, digest_size, **key_options)
+                if digest is None:
+                    missing_count += 1
+                    continue
+                per_shard[shard_of(digest, num_shards)].append((digest, file_idx, line_num))
+
+        offsets = np.zeros(num_shards + 1, dtype='<u8')
+        offsets[1:] = np.cumsum([len(entries) for entries in per_shard])
+        records = np.array(
+            [entry for entries in per_shard for entry in entries],
+            dtype=spill_record_dtype(digest_size)
+        )
+        records_path, offsets_path = _spill_paths(work_dir, file_idx)
+        np.save(records_path, records)
+        np.save(offsets_path, offsets)
+        return file_idx, len(records), missing_count, invalid_count, None
+    except Exception as e:
+        return file_idx, 0, 0, 0, str(e)
+
+def resolve_shard(task):
+    """
+    Parallel phase 2: for one shard, collect the spilled entries of every file,
+    keep the first occurrence of each digest that is not already in the on-disk
+    index, and merge the new digests into the index.
+    Memory use is bounded by the size of a single shard.
+    """
+    shard, work_dir, file_indices, index_dir, num_shards, digest_size, top_k = task
+    dtype = spill_record_dtype(digest_size)
+    parts = []
+    for file_idx in file_indices:
+        records_path, offsets_path = _spill_paths(work_dir, file_idx)
+        offsets = np.load(offsets_path)
+        start, end = int(offsets[shard]), int(offsets[shard + 1])
+        if end > start:
+            parts.append(np.load(records_path, mmap_mode='r')[start:end])
+    entries = np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    # Entries arrive in (file, line) order, so a stable sort by digest puts the
+    # first occurrence of each digest at the head of its run
+    entries = entries[np.argsort(entries['digest'], kind='stable')]
+    first = np.ones(len(entries), dtype=bool)
+    first[1:] = entries['digest'][1:] != entries['digest'][:-1]
+    candidates = entries[first]
+
+    # Largest in-run duplicate clusters of this shard, with their first two occurrences
+    starts = np.flatnonzero(first)
+    sizes = np.diff(np.append(starts, len(entries)))
+    top = np.argsort(sizes, kind='stable')[::-1][:top_k] if top_k else []
+    clusters = [
+        (bytes(entries['digest'][starts[c]]).ljust(digest_size, b'\0'), int(sizes[c]),
+         {'file': int(entries['file'][starts[c]]), 'line': int(entries['line'][starts[c]])},
+         {'file': int(entries['file'][starts[c] + 1]), 'line': int(entries['line'][starts[c] + 1])})
+        for c in top if sizes[c] > 1
+    ]
+
+    shard_index = ShardedDigestIndex(index_dir, num_shards, digest_size).shard(shard).open()
+    fresh = candidates[~shard_index.contains_many(candidates['digest'])]
+
+    keep = fresh[np.lexsort((fresh['line'], fresh['file']))]
+    lines_path, offsets_path = _keep_paths(work_dir, shard)
+    np.save(lines_path, keep['line'])
+    np.save(offsets_path, np.searchsorted(keep['file'], np.arange(max(file_indices, default=0) + 2)))
+
+    # Update the index only after the keep list is on disk
+    shard_index.merge(fresh['digest'])
+    shard_index.close()
+    return shard, len(entries), len(keep), clusters
+
+def write_kept_records(task):
+    """
+    Parallel phase 3: rewrite one input file keeping only the lines selected by the shard owners.
+    """
+    file_idx, input_file, output_file_path, work_dir, num_shards, output_batch_size, passthrough, write_buffer_size = task
+    try:
+        parts = []
+        for shard in range(num_shards):
+            lines_path, offsets_path = _keep_paths(work_dir, shard)
+            offsets = np.load(offsets_path)
+            start, end = int(offsets[file_idx]), int(offsets[file_idx + 1])
+            if end > start:
+                parts.append(np.load(lines_path, mmap_mode='r')[start:end])
+        keep_lines = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype='<u8')
+
+        os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+        kept_count = 0
+        batch_records = []
+        with open(input_file, 'rb', buffering=write_buffer_size) as infile, \
+             open(output_file_path, 'wb', buffering=write_buffer_size) as outfile:
+            for line_num, line in enumerate(infile, 1):
+                if kept_count == len(keep_lines):
+                    break
+                if keep_lines[kept_count] != line_num:
+                    continue
+                kept_count += 1
+                if passthrough:
+                    outfile.write(line if line.endswith(b'\n') else line + b'\n')
+                    continue
+                batch_records.append(json.dumps(load_json(line), ensure_ascii=False).encode('utf-8'))
+                if len(batch_records) >= output_batch_size:
+                    outfile.write(b'\n'.join(batch_records) + b'\n')
+                    batch_records = []
+            if batch_records:
+                outfile.write(b'\n'.join(batch_records) + b'\n')
+        return file_idx, kept_count, None
+    except Exception as e:
+        return file_idx, 0, str(e)
+
+def import_hex_hash_file(hash_file, index):
+    """
+    Seed an empty binary index with the hex hash file of earlier serial runs, so switching
+    to --workers N or --hash-format binary keeps every previously seen hash.
+    From then on the state lives in the index only; the hex file is not updated.
+    """
+    if not os.path.exists(hash_file) or os.path.getsize(hash_file) == 0:
+        return
+    if len(DigestSet(index).load()) > 0:
+        return
+    with open(hash_file, 'r', encoding='utf-8') as f:
+        first_hash = next((line.strip() for line in f if line.strip()), '')
+    if len(first_hash) // 2 < index.digest_size:
+        raise ValueError(f"Hashes in {hash_file} are {len(first_hash) // 2} bytes, shorter than the "
+                         f"{index.digest_size}-byte digests of {index.directory}; rerun with a matching --digest-size")
+    print(f"Importing existing hex hashes from {hash_file} into {index.directory} "
+          f"({hash_file} is not updated by this mode)...")
+    convert_hex_hash_file(hash_file, index.directory, index.num_shards, index.digest_size)
+
+def run_parallel(all_files, args, skipped_files_log, report=None):
+    """
+    Multi-process deduplication over a hash-partitioned, disk-backed digest index.
+
+    Phase 1 hashes the input files in parallel and spills digests per shard,
+    phase 2 lets one worker own each shard and decide which records are new,
+    and phase 3 rewrites the input files with the kept records in parallel.
+    Output matches the serial mode: the first occurrence of each text in input order is kept.
+    A DedupReport receives phase timings, per-shard counts and exact cluster sizes;
+    sources are attributed per file (parent directory) rather than per record.
+    """
+    index_dir = args.index_dir or args.hash_file + '.index'
+    index = ShardedDigestIndex(index_dir, args.num_shards, args.digest_size)
+    import_hex_hash_file(args.hash_file, index)
+    print(f"Using sharded index {index_dir} ({index.num_shards} shards, {index.digest_size}-byte digests, "
+          f"{len(index)} existing hashes)")
+
+    # Fold in hashes left in the delta log by a binary-format serial run
+    DigestSet(index).load().compact()
+
+    work_dir = tempfile.mkdtemp(prefix='dedup-work-', dir=args.work_dir or args.output_dir)
+    os.makedirs(os.path.join(work_dir, 'spill'))
+    os.makedirs(os.path.join(work_dir, 'keep'))
+
+    t0 = time.time()
+    try:
+        with Pool(processes=args.workers) as pool:
+            print(f"Phase 1/3: hashing {len(all_files)} files with {args.workers} workers...")
+            scan_tasks = [
+                (file_idx, input_file, work_dir, index.num_shards, args.hash_algorithm, index.digest_size,
+                 hash_key_options(args))
+                for file_idx, input_file in enumerate(all_files)
+            ]
+            scanned = {}
+            invalid = {}
+            for file_idx, hashed_count, missing_count, invalid_count, error in pool.imap_unordered(scan_file_to_shards, scan_tasks):
+                if error:
+                    skipped_files_log.write(f"Skipped file {all_files[file_idx]} due to error: {error}\n")
+                    skipped_files_log.flush()
+                    print(f"Error processing file {all_files[file_idx]}: {error}. Skipping this file.")
+                    continue
+                scanned[file_idx] = hashed_count + missing_count
+                invalid[file_idx] = invalid_count
+            file_indices = sorted(scanned)
+            t_scan = time.time()
+            print(f"Phase 1/3 done in {t_scan - t0:.2f} seconds")
+
+            print(f"Phase 2/3: resolving {index.num_shards} shards...")
+            shard_tasks = [
+                (shard, work_dir, file_indices, index_dir, index.num_shards, index.digest_size,
+                 report.top_k if report else 0)
+                for shard in range(index.num_shards)
+            ]
+            for shard, entry_count, kept_count, clusters in pool.imap_unordered(resolve_shard, shard_tasks):
+                if (shard + 1) % 16 == 0:
+                    print(f"Resolved shard {shard}: {entry_count} hashes, {kept_count} new")
+                if report is not None:
+                    report.record_shard(shard, entry_count, kept_count)
+                    for digest, size, first, duplicate in clusters:
+                        first['file'] = all_files[first['file']]
+                        duplicate['file'] = all_files[duplicate['file']]
+                        report.add_cluster(digest, size, first, duplicate)
+            t_resolve = time.time()
+            print(f"Phase 2/3 done in {t_resolve - t0:.2f} seconds")
+
+            print("Phase 3/3: writing deduplicated files...")
+            write_tasks = [
+                (file_idx, all_files[file_idx],
+                 create_output_path(all_files[file_idx], args.output_dir, args.flat_structure),
+                 work_dir, index.num_shards, args.output_batch_size, args.passthrough, args.write_buffer_size)
+                for file_idx in file_indices
+            ]
+            total_unique = 0
+            total_duplicates = 0
+            for file_idx, kept_count, error in pool.imap_unordered(write_kept_records, write_tasks):
+                if error:
+                    skipped_files_log.write(f"Skipped file {all_files[file_idx]} due to error: {error}\n")
+                    skipped_files_log.flush()
+                    print(f"Error writing output for {all_files[file_idx]}: {error}.")
+                    continue
+                duplicate_count = scanned[file_idx] - kept_count
+                total_unique += kept_count
+                total_duplicates += duplicate_count
+                print(f"Finished {all_files[file_idx]}: {kept_count} unique, {duplicate_count} duplicates")
+                if report is not None:
+                    source = record_source(None, all_files[file_idx])
+                    report.record_file(all_files[file_idx], kept_count, duplicate_count, invalid[file_idx],
+                                       {source: {'unique': kept_count, 'duplicates': duplicate_count}})
+            if report is not None:
+                report.add_timings({'scan': t_scan - t0, 'resolve': t_resolve - t_scan, 'write': time.time() - t_resolve})
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{'='*60}")
+    print("DEDUPLICATION COMPLETED")
+    print(f"{'='*60}")
+    print(f"Total files processed: {len(file_indices)}")
+    print(f"Total processing time: {time.time() - t0:.2f} seconds")
+    print(f"Total records processed: {total_unique + total_duplicates}")
+    print(f"Total duplicates found: {total_duplicates}")
+    print(f"Total unique records: {len(index)}")
+    print(f"Output directory: {args.output_dir}")
+
+def process_file_with_service(task):
+    """
+    Deduplicate one file against a shared dedup_service.py index.
+    Digests are sent in batches of hash_batch_size; the service records unseen
+    digests atomically, so concurrent runs and workers never keep the same text twice.
+    """
+    (input_file, output_file_path, socket_path, hash_algorithm, digest_size, key_options,
+     hash_batch_size, passthrough, write_buffer_size) = task
+    processed_count = 0
+    duplicate_count = 0
+    try:
+        os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+        with DedupClient(socket_path, digest_size) as client, \
+             open(input_file, 'rb', buffering=write_buffer_size) as infile, \
+             open(output_file_path, 'wb', buffering=write_buffer_size) as outfile:
+
+            def flush(lines, digests):
+                seen = client.check_and_add(digests)
+                for line, is_duplicate in zip(lines, seen):
+                    if not is_duplicate:
+                        outfile.write(line)
+                return seen.count(False), seen.count(True)
+
+            lines, digests = [], []
+            for line_num, line in enumerate(infile, 1):
+                try:
+                    record = load_json(line)
+                except ValueError as e:
+                    print(f"Error decoding JSON on line {line_num} in {input_file}: {e}. Skipping this line.")
+                    continue
+                digest = compute_digest(record, hash_algorithm, digest_size, **key_options)
+                if digest is None:
+                    duplicate_count += 1
+                    continue
+                if passthrough:
+                    lines.append(line if line.endswith(b'\n') else line + b'\n')
+                else:
+                    lines.append(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+                digests.append(digest)
+                if len(digests) >= hash_batch_size:
+                    unique, duplicates = flush(lines, digests)
+                    processed_count += unique
+                    duplicate_count += duplicates
+                    lines, digests = [], []
+            if digests:
+                unique, duplicates = flush(lines, digests)
+                processed_count += unique
+                duplicate_count += duplicates
+        return input_file, processed_count, duplicate_count, None
+    except Exception as e:
+        return input_file, processed_count, duplicate_count, str(e)
+
+def run_with_service(all_files, args, skipped_files_log, report=None):
+    """
+    Deduplicate against a global index shared by every run connected to the same dedup service.
+    """
+    with DedupClient(args.dedup_service, args.digest_size) as client:
+        print(f"Connected to dedup service {args.dedup_service}: {client.stats()}")
+
+    tasks = [
+        (input_file, create_output_path(input_file, args.output_dir, args.flat_structure), args.dedup_service,
+         args.hash_algorithm, args.digest_size, hash_key_options(args), args.hash_batch_size,
+         args.passthrough, args.write_buffer_size)
+        for input_file in all_files
+    ]
+    t0 = time.time()
+    total_unique = 0
+    total_duplicates = 0
+    with Pool(processes=args.workers) as pool:
+        for input_file, processed_count, duplicate_count, error in pool.imap_unordered(process_file_with_service, tasks):
+            if error:
+                skipped_files_log.write(f"Skipped file {input_file} due to error: {error}\n")
+                skipped_files_log.flush()
+                print(f"Error processing file {input_file}: {error}. Skipping this file.")
+                continue
+            total_unique += processed_count
+            total_duplicates += duplicate_count
+            print(f"Finished {input_file}: {processed_count} unique, {duplicate_count} duplicates")
+            if report is not None:
+                report.record_file(input_file, processed_count, duplicate_count,
+                                   sources={record_source(None, input_file): {'unique': processed_count, 'duplicates': duplicate_count}})
+
+    with DedupClient(args.dedup_service, args.digest_size) as client:
+        stats = client.stats()
+
+    print(f"\n{'='*60}")
+    print("DEDUPLICATION COMPLETED")
+    print(f"{'='*60}")
+    print(f"Total files processed: {len(all_files)}")
+    print(f"Total processing time: {time.time() - t0:.2f} seconds")
+    print(f"Total records processed: {total_unique + total_duplicates}")
+    print(f"Total duplicates found: {total_duplicates}")
+    print(f"Total unique records in global index: {stats['digests']}")
+    print(f"Output directory: {args.output_dir}")
+
+def deduplicate_files(all_files, args, processed_hashes_file, existing_hashes, skipped_files_log, report=None):
+    """
+    Serial deduplication loop shared by the hex and binary hash formats.
+    """
+    output_base_dir = args.output_dir
+    digest_size = args.digest_size if args.hash_format == 'binary' else None
+    t0 = time.time()
+    total_processed = 0
+    total_duplicates = 0
+    total_files_processed = 0
+
+    # Process all files
+    for input_file in all_files:
+        try:
+            total_files_processed += 1
+            print(f"Processing file {total_files_processed}/{len(all_files)}: {input_file}")
+            
+            process = process_file_passthrough if args.passthrough else process_file
+            processed_count, duplicate_count = process(
+                input_file, 
+                output_base_dir, 
+                processed_hashes_file, 
+                existing_hashes,
+                args.write_buffer_size if args.passthrough else args.output_batch_size,
+                args.hash_batch_size,
+                args.hash_algorithm,
+                args.flat_structure,
+                digest_size,
+                hash_key_options(args),
+                report,
+                args.report_source_field
+            )
+
+            # Keep the in-memory delta of the binary index bounded
+            if digest_size and len(existing_hashes.delta) >= args.compact_every:
+                print(f"Compacting {len(existing_hashes.delta)} new hashes into the binary index...")
+                existing_hashes.compact()
+
+            # Update total counts
+            total_processed += processed_count + duplicate_count
+            total_duplicates += duplicate_count
+
+            # Print progress
+            print(f"File {total_files_processed} completed:")
+            print(f"  - Unique records in this file: {processed_count}")
+            print(f"  - Duplicates in this file: {duplicate_count}")
+            print(f"  - Total records processed so far: {total_processed}")
+            print(f"  - Total duplicates found so far: {total_duplicates}")
+            print(f"  - Total unique records in dataset: {len(existing_hashes)}")
+            print("-" * 50)
+            
+        except Exception as e:
+            # Log skipped file with error message
+            error_msg = f"Skipped file {input_file} due to error: {e}\n"
+            skipped_files_log.write(error_msg)
+            skipped_files_log.flush()
+            print(f"Error processing file {input_file}: {e}. Skipping this file.")
+
+    print(f"\n{'='*60}")
+    print("DEDUPLICATION COMPLETED")
+    print(f"{'='*60}")
+    print(f"Total files processed: {total_files_processed}")
+    print(f"Total processing time: {time.time() - t0:.2f} seconds")
+    print(f"Total records processed: {total_processed}")
+    print(f"Total duplicates found: {total_duplicates}")
+    print(f"Total unique records: {len(existing_hashes)}")
+    print(f"Output directory: {output_base_dir}")
+
 def main(args):
     
     output_base_dir = args.output_dir
-    processed_hashes_file_path = args.hash_file
-    skipped_files_log_path = args.log_file
     
     print("Starting deduplication.....")
     
@@ -178,10 +782,56 @@ def main(args):
         return
     
     print(f"Total files to process: {len(all_files)}")
+
+    if args.hash_algorithm in XXHASH_ALGORITHMS and xxhash is None:
+        print(f"Error: --hash-algorithm {args.hash_algorithm} requires the xxhash package (pip install xxhash)")
+        return
+    if args.hash_algorithm == 'xxh3_64' and args.digest_size > 8 and (args.workers > 1 or args.hash_format == 'binary' or args.dedup_service):
+        print("Error: xxh3_64 produces 8-byte digests; use --digest-size 8 with the binary index")
+        return
     
     # Create output base directory if it doesn't exist
     os.makedirs(output_base_dir, exist_ok=True)
 
+    report = DedupReport(args.report_top_k, args.report_sample_size) if args.report_dir else None
+    try:
+        run_deduplication(all_files, args, report)
+    finally:
+        if report is not None:
+            report.write(args.report_dir)
+
+def run_deduplication(all_files, args, report=None):
+    """
+    Dispatch to the service, parallel, binary or hex deduplication mode.
+    """
+    processed_hashes_file_path = args.hash_file
+    skipped_files_log_path = args.log_file
+
+    if args.dedup_service:
+        with codecs.open(skipped_files_log_path, 'a+', encoding='utf-8') as skipped_files_log:
+            run_with_service(all_files, args, skipped_files_log, report)
+        return
+
+    if args.workers > 1:
+        with codecs.open(skipped_files_log_path, 'a+', encoding='utf-8') as skipped_files_log:
+            run_parallel(all_files, args, skipped_files_log, report)
+        return
+
+    if args.hash_format == 'binary':
+        index_dir = args.index_dir or processed_hashes_file_path + '.index'
+        index = ShardedDigestIndex(index_dir, args.num_shards, args.digest_size)
+        import_hex_hash_file(processed_hashes_file_path, index)
+        print(f"Loading existing hashes from binary index {index_dir}...")
+        existing_hashes = DigestSet(index).load()
+        print(f"Loaded {len(existing_hashes)} existing hashes ({len(existing_hashes.delta)} from the delta log)")
+        with codecs.open(skipped_files_log_path, 'a+', encoding='utf-8') as skipped_files_log:
+            try:
+                deduplicate_files(all_files, args, existing_hashes, existing_hashes, skipped_files_log, report)
+            finally:
+                print("Compacting binary hash index...")
+                existing_hashes.compact()
+        return
+
     # Open files with explicit UTF-8 encoding to support Hindi characters
     with codecs.open(processed_hashes_file_path, 'a+', encoding='utf-8') as processed_hashes_file, \
          codecs.open(skipped_files_log_path, 'a+', encoding='utf-8') as skipped_files_log:
@@ -202,57 +852,7 @@ def main(args):
 
         print(f"Loaded {hash_count} existing hashes into memory")
 
-        t0 = time.time()
-        total_processed = 0
-        total_duplicates = 0
-        total_files_processed = 0
-
-        # Process all files
-        for input_file in all_files:
-            try:
-                total_files_processed += 1
-                print(f"Processing file {total_files_processed}/{len(all_files)}: {input_file}")
-                
-                processed_count, duplicate_count = process_file(
-                    input_file, 
-                    output_base_dir, 
-                    processed_hashes_file, 
-                    existing_hashes,
-                    args.output_batch_size,
-                    args.hash_batch_size,
-                    args.hash_algorithm,
-                    args.flat_structure
-                )
-
-                # Update total counts
-                total_processed += processed_count + duplicate_count
-                total_duplicates += duplicate_count
-
-                # Print progress
-                print(f"File {total_files_processed} completed:")
-                print(f"  - Unique records in this file: {processed_count}")
-                print(f"  - Duplicates in this file: {duplicate_count}")
-                print(f"  - Total records processed so far: {total_processed}")
-                print(f"  - Total duplicates found so far: {total_duplicates}")
-                print(f"  - Total unique records in dataset: {len(existing_hashes)}")
-                print("-" * 50)
-                
-            except Exception as e:
-                # Log skipped file with error message
-                error_msg = f"Skipped file {input_file} due to error: {e}\n"
-                skipped_files_log.write(error_msg)
-                skipped_files_log.flush()
-                print(f"Error processing file {input_file}: {e}. Skipping this file.")
-
-        print(f"\n{'='*60}")
-        print(f"DEDUPLICATION COMPLETED")
-        print(f"{'='*60}")
-        print(f"Total files processed: {total_files_processed}")
-        print(f"Total processing time: {time.time() - t0:.2f} seconds")
-        print(f"Total records processed: {total_processed}")
-        print(f"Total duplicates found: {total_duplicates}")
-        print(f"Total unique records: {len(existing_hashes)}")
-        print(f"Output directory: {output_base_dir}")
+        deduplicate_files(all_files, args, processed_hashes_file, existing_hashes, skipped_files_log, report)
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -276,7 +876,8 @@ def parse_args():
     parser.add_argument(
         '--hash-file', 
         required=True,
-        help="File to store/load processed hashes for deduplication"
+        help="File to store/load processed hashes for deduplication. The parallel and binary modes "
+             "import it once into an empty --index-dir and then keep their state only in the index"
     )
     
     parser.add_argument(
@@ -302,8 +903,78 @@ def parse_args():
     parser.add_argument(
         '--hash-algorithm', 
         default='md5',
-        choices=['md5', 'sha1', 'sha256'],
-        help="Hash algorithm to use for deduplication"
+        choices=['md5', 'sha1', 'sha256', 'xxh3_64', 'xxh3_128'],
+        help="Hash algorithm to use for deduplication. The xxh3 variants are much faster but "
+             "produce hashes incompatible with an existing md5 hash file"
+    )
+
+    parser.add_argument(
+        '--hash-fields',
+        nargs='+',
+        default=['text'],
+        help="Record fields that make up the dedup key; metadata such as url, id or timestamp "
+             "should be left out so identical content collides"
+    )
+
+    parser.add_argument(
+        '--unicode-normalization',
+        default='none',
+        choices=['none', 'NFC', 'NFKC'],
+        help="Unicode normalization applied to key fields before hashing"
+    )
+
+    parser.add_argument(
+        '--collapse-whitespace',
+        action='store_true',
+        help="Collapse every whitespace run in key fields to a single space before hashing"
+    )
+
+    parser.add_argument(
+        '--dedup-service',
+        default=None,
+        help="Unix socket of a running dedup_service.py; dedups against the global index shared by all "
+             "connected runs instead of --hash-file (--workers sets the number of files processed at once)"
+    )
+
+    parser.add_argument(
+        '--report-dir',
+        default=None,
+        help="Write a dedup report (report.json, plus files.parquet when pandas is installed) with duplicate "
+             "rates per file and source, top duplicate clusters, sampled duplicate pairs and stage timings"
+    )
+
+    parser.add_argument(
+        '--report-source-field',
+        default='source',
+        help="Record field used to attribute duplicates to a source (falls back to the input file's parent directory)"
+    )
+
+    parser.add_argument(
+        '--report-top-k',
+        type=int,
+        default=100,
+        help="Number of largest duplicate clusters listed in the report"
+    )
+
+    parser.add_argument(
+        '--report-sample-size',
+        type=int,
+        default=100,
+        help="Number of duplicate pairs sampled into the report"
+    )
+
+    parser.add_argument(
+        '--passthrough',
+        action='store_true',
+        help="Copy the original bytes of kept lines to the output instead of re-serialising "
+             "each record with json.dumps (parsing uses orjson when installed)"
+    )
+
+    parser.add_argument(
+        '--write-buffer-size',
+        type=int,
+        default=8 << 20,
+        help="Buffer size in bytes for the binary reader/writer used by --passthrough and the parallel mode"
     )
     
     parser.add_argument(
@@ -311,6 +982,58 @@ def parse_args():
         action='store_true',
         help="Use flat directory structure for output (all files in output root)"
     )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help="Number of worker processes. Values above 1 enable the sharded parallel mode, "
+             "which keeps hashes in an on-disk index instead of an in-memory set"
+    )
+
+    parser.add_argument(
+        '--index-dir',
+        default=None,
+        help="Directory of the sharded on-disk hash index used by the parallel mode "
+             "(defaults to <hash-file>.index)"
+    )
+
+    parser.add_argument(
+        '--num-shards',
+        type=int,
+        default=64,
+        help="Number of hash-partitioned index shards for a new index; "
+             "raise it to bound per-worker memory on very large corpora"
+    )
+
+    parser.add_argument(
+        '--digest-size',
+        type=int,
+        default=16,
+        choices=[8, 16],
+        help="Bytes of each digest stored in the on-disk index"
+    )
+
+    parser.add_argument(
+        '--hash-format',
+        default='hex',
+        choices=['hex', 'binary'],
+        help="Serial-mode hash state: newline-separated hex in --hash-file, or the binary sharded "
+             "index in --index-dir (convert an existing hex file with hash_index.py)"
+    )
+
+    parser.add_argument(
+        '--compact-every',
+        type=int,
+        default=5_000_000,
+        help="In binary format, merge the delta log into the sorted index once it holds this many hashes"
+    )
+
+    parser.add_argument(
+        '--work-dir',
+        default=None,
+        help="Directory for temporary spill files of the parallel mode (defaults to the output directory)"
+    )
     
     return parser.parse_args()
 
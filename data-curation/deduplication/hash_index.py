@@ -0,0 +1,306 @@
+import json
+import os
+
+import numpy as np
+
+INDEX_META_FILE = 'index.json'
+
+
+def digest_dtype(digest_size):
+    """
+    Numpy dtype used for fixed-width binary digests.
+    Fixed-width bytes compare lexicographically, so sorting and binary search
+    work directly on the raw digest bytes.
+    """
+    return np.dtype(f'S{digest_size}')
+
+
+def shard_of(digest, num_shards):
+    """
+    Route a raw digest to its hash-partitioned shard.
+    """
+    return int.from_bytes(digest[-4:], 'little') % num_shards
+
+
+class DigestIndex:
+    """
+    A set of fixed-width binary digests stored on disk as one sorted array.
+    The array is memory-mapped for lookups, so only the pages touched by
+    binary search are resident. New digests are merged into a fresh sorted
+    run that atomically replaces the old one.
+    """
+
+    def __init__(self, path, digest_size=16):
+        self.path = path
+        self.digest_size = digest_size
+        self.dtype = digest_dtype(digest_size)
+        self._digests = None
+
+    def open(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            if os.path.getsize(self.path) % self.digest_size:
+                raise ValueError(f"Corrupt digest index {self.path}: size is not a multiple of {self.digest_size}")
+            self._digests = np.memmap(self.path, dtype=self.dtype, mode='r')
+        else:
+            self._digests = np.empty(0, dtype=self.dtype)
+        return self
+
+    def close(self):
+        self._digests = None
+
+    def __len__(self):
+        return 0 if self._digests is None else len(self._digests)
+
+    def contains_many(self, digests):
+        """
+        Vectorised membership test. Returns a boolean array aligned with `digests`.
+        """
+        digests = np.asarray(digests, dtype=self.dtype)
+        if self._digests is None or len(self._digests) == 0 or len(digests) == 0:
+            return np.zeros(len(digests), dtype=bool)
+        positions = np.searchsorted(self._digests, digests)
+        positions[positions == len(self._digests)] = 0
+        return self._digests[positions] == digests
+
+    def merge(self, new_digests):
+        """
+        Merge digests (assumed unique and absent from the index) into the sorted run.
+        """
+        new_digests = np.sort(np.asarray(new_digests, dtype=self.dtype))
+        if len(new_digests) == 0:
+            return
+        current = self._digests if self._digests is not None else np.empty(0, dtype=self.dtype)
+        merged = np.empty(len(current) + len(new_digests), dtype=self.dtype)
+        # Positions of the new digests in the merged output, computed without re-sorting the base run
+        new_positions = np.searchsorted(current, new_digests) + np.arange(len(new_digests))
+        mask = np.zeros(len(merged), dtype=bool)
+        mask[new_positions] = True
+        merged[mask] = new_digests
+        merged[~mask] = current
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            merged.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        self._digests = None
+        os.replace(tmp_path, self.path)
+        self.open()
+
+
+class ShardedDigestIndex:
+    """
+    A directory of DigestIndex shards partitioned by digest value.
+    Each shard can be owned by a separate worker process, so lookups and merges
+    scale across cores while every shard stays small enough to process in memory.
+    """
+
+    def __init__(self, directory, num_shards=64, digest_size=16):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, INDEX_META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta['num_shards'] != num_shards or meta['digest_size'] != digest_size:
+                print(f"Warning: Index {directory} was created with {meta['num_shards']} shards and "
+                      f"{meta['digest_size']}-byte digests; using those settings.")
+            num_shards = meta['num_shards']
+            digest_size = meta['digest_size']
+        else:
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'num_shards': num_shards, 'digest_size': digest_size}, f)
+        self.num_shards = num_shards
+        self.digest_size = digest_size
+
+    def shard_path(self, shard):
+        return os.path.join(self.directory, f'shard-{shard:05d}.bin')
+
+    def shard(self, shard):
+        return DigestIndex(self.shard_path(shard), self.digest_size)
+
+    def __len__(self):
+        return sum(
+            os.path.getsize(self.shard_path(s)) // self.digest_size
+            for s in range(self.num_shards)
+            if os.path.exists(self.shard_path(s))
+        )
+
+
+class DigestSet:
+    """
+    Resumable set of digests backed by a ShardedDigestIndex plus an unsorted delta log.
+
+    Loading memory-maps the sorted shards instead of parsing them, and only the
+    delta log (digests added since the last compaction) is read into memory.
+    compact() folds the delta log into the sorted shards. A compaction can also run in
+    the background: begin_compaction() freezes the delta, build_compacted() merges it
+    into fresh shard runs while the current ones stay readable, and finish_compaction()
+    swaps them in.
+    """
+
+    DELTA_FILE = 'delta.bin'
+    COMPACTING_FILE = 'delta.compacting.bin'
+
+    def __init__(self, index):
+        self.index = index
+        self.digest_size = index.digest_size
+        self.delta_path = os.path.join(index.directory, self.DELTA_FILE)
+        self.compacting_path = os.path.join(index.directory, self.COMPACTING_FILE)
+        self.shards = []
+        self.delta = set()
+        self.frozen = set()
+        self._base_count = 0
+
+    def load(self):
+        self.shards = [self.index.shard(s).open() for s in range(self.index.num_shards)]
+        self._base_count = sum(len(shard) for shard in self.shards)
+        # A log left by an interrupted compaction is folded back into the delta
+        self.delta = self._read_log(self.delta_path) | self._read_log(self.compacting_path)
+        self.frozen = set()
+        return self
+
+    def _read_log(self, path):
+        if not os.path.exists(path):
+            return set()
+        size = os.path.getsize(path)
+        if size % self.digest_size:
+            # Drop a digest torn by an interrupted append
+            print(f"Warning: Truncating {size % self.digest_size} trailing bytes from {path}")
+            with open(path, 'r+b') as f:
+                f.truncate(size - size % self.digest_size)
+        with open(path, 'rb') as f:
+            data = f.read()
+        width = self.digest_size
+        return {data[i:i + width] for i in range(0, len(data), width)}
+
+    def __len__(self):
+        return self._base_count + len(self.delta) + len(self.frozen)
+
+    def __contains__(self, digest):
+        if digest in self.delta or digest in self.frozen:
+            return True
+        shard = self.shards[shard_of(digest, self.index.num_shards)]
+        return bool(shard.contains_many([digest])[0])
+
+    def add(self, digest):
+        self.delta.add(digest)
+
+    def append(self, digests):
+        """
+        Persist a batch of newly added digests to the delta log.
+        """
+        with open(self.delta_path, 'ab') as f:
+            f.write(b''.join(digests))
+
+    def compact(self):
+        """
+        Merge the delta log into the sorted shards and truncate it.
+        Safe to rerun after an interruption: digests already merged are skipped.
+        """
+        if not self.delta:
+            return
+        self.begin_compaction()
+        self.finish_compaction(self.build_compacted())
+
+    def begin_compaction(self):
+        """
+        Freeze the current delta for merging. Lookups keep seeing the frozen digests,
+        and digests added from now on go to a fresh delta log.
+        """
+        if self.frozen:
+            raise RuntimeError("A compaction is already in progress")
+        self.frozen, self.delta = self.delta, set()
+        if not os.path.exists(self.delta_path):
+            return
+        if os.path.exists(self.compacting_path):
+            with open(self.delta_path, 'rb') as src, open(self.compacting_path, 'ab') as dst:
+                dst.write(src.read())
+            open(self.delta_path, 'wb').close()
+        else:
+            os.replace(self.delta_path, self.compacting_path)
+
+    def build_compacted(self):
+        """
+        Merge the frozen digests into fresh sorted runs and return the new shard list.
+        The current shards are not modified, so lookups can continue meanwhile.
+        """
+        num_shards = self.index.num_shards
+        shards = list(self.shards)
+        if not self.frozen:
+            return shards
+        # Route from the Python bytes: numpy drops trailing NUL bytes when converting back
+        owners = np.array([shard_of(d, num_shards) for d in self.frozen], dtype=np.int64)
+        frozen = np.array(list(self.frozen), dtype=digest_dtype(self.digest_size))
+        for s in np.unique(owners):
+            digests = frozen[owners == s]
+            shard = self.index.shard(s).open()
+            shard.merge(digests[~shard.contains_many(digests)])
+            shards[s] = shard
+        return shards
+
+    def finish_compaction(self, shards):
+        """
+        Swap in the shards returned by build_compacted() and drop the frozen log.
+        """
+        self.shards = shards
+        self._base_count = sum(len(shard) for shard in self.shards)
+        self.frozen = set()
+        if os.path.exists(self.compacting_path):
+            os.remove(self.compacting_path)
+
+    def abort_compaction(self):
+        """
+        Return the frozen digests to the delta after a failed build_compacted().
+        Their log stays on disk and is folded back in by the next load().
+        """
+        self.delta |= self.frozen
+        self.frozen = set()
+
+
+def convert_hex_hash_file(hex_path, index_dir, num_shards=64, digest_size=16, chunk_size=10_000_000):
+    """
+    One-off converter from the newline-separated hex hash file written by the
+    serial mode of deduplication.py to a sharded binary index.
+    Hashes are converted in chunks so memory stays bounded by chunk_size.
+    """
+    index = ShardedDigestIndex(index_dir, num_shards, digest_size)
+    digest_set = DigestSet(index).load()
+    total = 0
+    chunk = []
+
+    def flush_chunk():
+        digest_set.delta.update(chunk)
+        digest_set.compact()
+        chunk.clear()
+
+    with open(hex_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            hash_value = line.strip()
+            if not hash_value:
+                continue
+            chunk.append(bytes.fromhex(hash_value)[:index.digest_size])
+            total += 1
+            if len(chunk) >= chunk_size:
+                flush_chunk()
+                print(f"Converted {total} hashes...")
+    flush_chunk()
+    print(f"Converted {total} hashes from {hex_path} into {index_dir} ({len(digest_set)} unique)")
+    return len(digest_set)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convert a hex hash file from deduplication.py into the binary sharded index format",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--hash-file', required=True, help="Existing newline-separated hex hash file")
+    parser.add_argument('--index-dir', required=True, help="Output directory of the binary index")
+    parser.add_argument('--num-shards', type=int, default=64, help="Number of index shards")
+    parser.add_argument('--digest-size', type=int, default=16, choices=[8, 16], help="Bytes kept per digest")
+    parser.add_argument('--chunk-size', type=int, default=10_000_000, help="Hashes converted per merge")
+    args = parser.parse_args()
+
+    convert_hex_hash_file(args.hash_file, args.index_dir, args.num_shards, args.digest_size, args.chunk_size)
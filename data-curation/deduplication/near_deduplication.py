@@ -0,0 +1,399 @@
+import argparse
+import codecs
+import os
+import shutil
+import tempfile
+import time
+import unicodedata
+import zlib
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from deduplication import create_output_path, get_all_files_paths_under, load_file_paths_from_txt, load_json
+
+# Multiplier of the polynomial rolling hash used to combine codepoints / words into shingles
+SHINGLE_BASE = np.uint64(0x100000001B3)
+ROW_MASK = np.uint64(0xFFFFFFFF)
+
+BUCKET_DTYPE = np.dtype([('band', '<u2'), ('key', '<u8'), ('doc', '<u8')])
+
+
+def minhash_permutations(num_perm, seed=42):
+    """
+    Parameters of the multiply-shift hash family used as MinHash permutations.
+    Every worker derives the same parameters from the seed.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def normalize_text(text):
+    """
+    NFC-normalize, lowercase and collapse whitespace, so that Indic texts differing only in
+    combining-mark encoding or spacing produce identical shingles.
+    """
+    return ' '.join(unicodedata.normalize('NFC', text).lower().split())
+
+
+def shingle_hashes(text, shingle_type='char', shingle_size=5):
+    """
+    Unique 64-bit hashes of the shingles of a normalized text.
+
+    Character shingles run over Unicode codepoints, which suits Indic scripts where
+    whitespace tokenization is unreliable; word shingles run over whitespace tokens.
+    Texts shorter than one shingle hash to a single shingle.
+    """
+    if shingle_type == 'word':
+        units = np.array([zlib.crc32(w.encode('utf-8')) for w in text.split(' ')], dtype=np.uint64)
+    else:
+        units = np.frombuffer(text.encode('utf-32-le'), dtype='<u4').astype(np.uint64)
+    if len(units) == 0:
+        return units
+    width = min(shingle_size, len(units))
+    powers = SHINGLE_BASE ** np.arange(width - 1, -1, -1, dtype=np.uint64)
+    windows = sliding_window_view(units, width)
+    hashes = (windows * powers).sum(axis=1, dtype=np.uint64)
+    # Final avalanche so nearby shingles do not map to nearby values
+    hashes ^= hashes >> np.uint64(31)
+    hashes *= np.uint64(0x9E3779B97F4A7C15)
+    return np.unique(hashes)
+
+
+def minhash_signature(hashes, perm_a, perm_b, block_size=4096):
+    """
+    MinHash signature (uint32 per permutation) of a set of shingle hashes,
+    computed in blocks to bound the size of the permutation matrix.
+    """
+    signature = np.full(len(perm_a), np.iinfo(np.uint32).max, dtype=np.uint64)
+    for start in range(0, len(hashes), block_size):
+        block = hashes[start:start + block_size]
+        permuted = (perm_a[:, None] * block[None, :] + perm_b[:, None]) >> np.uint64(32)
+        np.minimum(signature, permuted.min(axis=1), out=signature)
+    return signature.astype(np.uint32)
+
+
+def band_keys(signatures, bands):
+    """
+    Collapse each band of rows of the (docs, num_perm) signature matrix into a 64-bit bucket key.
+    """
+    rows = signatures.shape[1] // bands
+    banded = signatures[:, :bands * rows].reshape(len(signatures), bands, rows).astype(np.uint64)
+    powers = SHINGLE_BASE ** np.arange(rows, dtype=np.uint64)
+    keys = (banded * powers).sum(axis=2, dtype=np.uint64)
+    keys ^= keys >> np.uint64(29)
+    return keys
+
+
+def _file_paths(work_dir, file_idx):
+    base = os.path.join(work_dir, 'files', f'file-{file_idx:07d}')
+    return {
+        'signatures': base + '.signatures.npy',
+        'lines': base + '.lines.npy',
+        'passthrough': base + '.passthrough.npy',
+        'buckets': base + '.buckets.npy',
+        'offsets': base + '.offsets.npy',
+    }
+
+
+def _edges_path(work_dir, shard):
+    return os.path.join(work_dir, 'edges', f'shard-{shard:05d}.npy')
+
+
+def signature_file(task):
+    """
+    Phase 1: MinHash every record of one input file, write its signatures and
+    spill its LSH band buckets grouped by bucket shard. Records without text get no
+    signature; their line numbers are saved so phase 4 passes them through unchanged.
+    """
+    (file_idx, input_file, work_dir, text_field, shingle_type, shingle_size,
+     num_perm, bands, num_bucket_shards, seed) = task
+    try:
+        perm_a, perm_b = minhash_permutations(num_perm, seed)
+        signatures = []
+        lines = []
+        passthrough = []
+        with open(input_file, 'rb') as infile:
+            for line_num, line in enumerate(infile, 1):
+                try:
+                    text = load_json(line).get(text_field, '')
+                except (ValueError, AttributeError) as e:
+                    print(f"Error decoding JSON on line {line_num} in {input_file}: {e}. Skipping this line.")
+                    continue
+                if not isinstance(text, str) or not text.strip():
+                    passthrough.append(line_num)
+                    continue
+                hashes = shingle_hashes(normalize_text(text), shingle_type, shingle_size)
+                signatures.append(minhash_signature(hashes, perm_a, perm_b))
+                lines.append(line_num)
+
+        paths = _file_paths(work_dir, file_idx)
+        signatures = np.array(signatures, dtype=np.uint32).reshape(len(lines), num_perm)
+        np.save(paths['signatures'], signatures)
+        np.save(paths['lines'], np.array(lines, dtype='<u8'))
+        np.save(paths['passthrough'], np.array(passthrough, dtype='<u8'))
+
+        keys = band_keys(signatures, bands)
+        buckets = np.empty(keys.size, dtype=BUCKET_DTYPE)
+        buckets['band'] = np.tile(np.arange(bands, dtype='<u2'), len(lines))
+        buckets['key'] = keys.ravel()
+        buckets['doc'] = (np.uint64(file_idx) << np.uint64(32)) | np.repeat(np.arange(len(lines), dtype=np.uint64), bands)
+        shards = (buckets['key'] % np.uint64(num_bucket_shards)).astype(np.int64)
+        order = np.argsort(shards, kind='stable')
+        np.save(paths['buckets'], buckets[order])
+        np.save(paths['offsets'], np.searchsorted(shards[order], np.arange(num_bucket_shards + 1)))
+        return file_idx, len(lines), len(passthrough), None
+    except Exception as e:
+        return file_idx, 0, 0, str(e)
+
+
+def bucket_shard_edges(task):
+    """
+    Phase 2: group the band buckets of one shard and emit candidate duplicate edges
+    from the first document of each bucket to every other member. With a Jaccard
+    threshold, edges are kept only when the signatures agree on enough permutations.
+    """
+    shard, work_dir, file_indices, doc_offsets, jaccard_threshold = task
+    parts = []
+    for file_idx in file_indices:
+        paths = _file_paths(work_dir, file_idx)
+        offsets = np.load(paths['offsets'])
+        start, end = int(offsets[shard]), int(offsets[shard + 1])
+        if end > start:
+            parts.append(np.load(paths['buckets'], mmap_mode='r')[start:end])
+    if not parts:
+        np.save(_edges_path(work_dir, shard), np.empty((0, 2), dtype=np.uint64))
+        return shard, 0
+
+    buckets = np.concatenate(parts)
+    buckets = buckets[np.lexsort((buckets['doc'], buckets['key'], buckets['band']))]
+    new_group = np.ones(len(buckets), dtype=bool)
+    new_group[1:] = (buckets['band'][1:] != buckets['band'][:-1]) | (buckets['key'][1:] != buckets['key'][:-1])
+    group_first = buckets['doc'][np.flatnonzero(new_group)[np.cumsum(new_group) - 1]]
+    members = ~new_group
+    sources, targets = group_first[members], buckets['doc'][members]
+
+    if jaccard_threshold > 0 and len(sources):
+        signatures = {}
+        for file_idx in np.unique(np.concatenate([sources, targets]) >> np.uint64(32)):
+            signatures[int(file_idx)] = np.load(_file_paths(work_dir, int(file_idx))['signatures'], mmap_mode='r')
+
+        def gather(docs):
+            rows = np.empty((len(docs), next(iter(signatures.values())).shape[1]), dtype=np.uint32)
+            files = docs >> np.uint64(32)
+            for file_idx, file_signatures in signatures.items():
+                mask = files == file_idx
+                if mask.any():
+                    rows[mask] = file_signatures[(docs[mask] & ROW_MASK).astype(np.int64)]
+            return rows
+
+        similarity = (gather(sources) == gather(targets)).mean(axis=1)
+        sources, targets = sources[similarity >= jaccard_threshold], targets[similarity >= jaccard_threshold]
+
+    def dense(docs):
+        return doc_offsets[(docs >> np.uint64(32)).astype(np.int64)] + (docs & ROW_MASK)
+
+    edges = np.unique(np.stack([dense(sources), dense(targets)], axis=1), axis=0) if len(sources) else \
+        np.empty((0, 2), dtype=np.uint64)
+    np.save(_edges_path(work_dir, shard), edges)
+    return shard, len(edges)
+
+
+def connected_components(num_docs, edges):
+    """
+    Label every document with the smallest document id of its connected component,
+    by min-label propagation with pointer jumping. The smallest id is the first
+    occurrence in input order, which becomes the cluster representative.
+    Iterates until no label changes; labels only decrease, so this terminates.
+    """
+    labels = np.arange(num_docs, dtype=np.uint64)
+    if len(edges) == 0:
+        return labels
+    u, v = edges[:, 0].astype(np.int64), edges[:, 1].astype(np.int64)
+    while True:
+        previous = labels.copy()
+        smallest = np.minimum(labels[u], labels[v])
+        np.minimum.at(labels, u, smallest)
+        np.minimum.at(labels, v, smallest)
+        labels = labels[labels.astype(np.int64)]
+        if np.array_equal(labels, previous):
+            break
+    return labels
+
+
+def write_representatives(task):
+    """
+    Phase 4: copy the original bytes of the cluster representatives of one input file,
+    together with its records without text.
+    """
+    file_idx, input_file, output_file_path, work_dir, doc_offset, write_buffer_size = task
+    try:
+        paths = _file_paths(work_dir, file_idx)
+        lines = np.load(paths['lines'])
+        labels = np.load(os.path.join(work_dir, 'labels.npy'), mmap_mode='r')[doc_offset:doc_offset + len(lines)]
+        keep_lines = lines[labels == np.arange(doc_offset, doc_offset + len(lines), dtype=np.uint64)]
+        keep_lines = np.union1d(keep_lines, np.load(paths['passthrough']))
+
+        os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+        kept_count = 0
+        with open(input_file, 'rb', buffering=write_buffer_size) as infile, \
+             open(output_file_path, 'wb', buffering=write_buffer_size) as outfile:
+            for line_num, line in enumerate(infile, 1):
+                if kept_count == len(keep_lines):
+                    break
+                if keep_lines[kept_count] != line_num:
+                    continue
+                outfile.write(line if line.endswith(b'\n') else line + b'\n')
+                kept_count += 1
+        return file_idx, kept_count, None
+    except Exception as e:
+        return file_idx, 0, str(e)
+
+
+def collect_input_files(file_list):
+    """
+    Resolve files, directories and text files listing paths, as deduplication.py does.
+    """
+    all_files = []
+    for file_path in file_list:
+        if os.path.isfile(file_path):
+            if file_path.endswith('.jsonl') or file_path.endswith('.json'):
+                all_files.append(file_path)
+            else:
+                all_files.extend(load_file_paths_from_txt(file_path))
+        elif os.path.isdir(file_path):
+            all_files.extend(get_all_files_paths_under(file_path))
+        else:
+            print(f"Warning: Path not found or invalid: {file_path}")
+    return all_files
+
+
+def main(args):
+    print("Starting near-duplicate detection.....")
+    all_files = collect_input_files(args.file_list)
+    if not all_files:
+        print("Error: No input files found. Please provide valid file paths or directories")
+        return
+    if args.num_perm % args.bands:
+        print(f"Error: --num-perm ({args.num_perm}) must be a multiple of --bands ({args.bands})")
+        return
+    rows = args.num_perm // args.bands
+    print(f"Total files to process: {len(all_files)}")
+    print(f"MinHash: {args.num_perm} permutations, {args.bands} bands x {rows} rows "
+          f"(~{(1 / args.bands) ** (1 / rows):.2f} Jaccard threshold), {args.shingle_type} shingles of {args.shingle_size}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix='near-dedup-work-', dir=args.work_dir or args.output_dir)
+    for sub_dir in ('files', 'edges'):
+        os.makedirs(os.path.join(work_dir, sub_dir))
+
+    t0 = time.time()
+    try:
+        with Pool(processes=args.workers) as pool, \
+             codecs.open(args.log_file, 'a+', encoding='utf-8') as skipped_files_log:
+            print(f"Phase 1/4: MinHash signatures for {len(all_files)} files with {args.workers} workers...")
+            tasks = [
+                (file_idx, input_file, work_dir, args.text_field, args.shingle_type, args.shingle_size,
+                 args.num_perm, args.bands, args.num_bucket_shards, args.seed)
+                for file_idx, input_file in enumerate(all_files)
+            ]
+            doc_counts = {}
+            passthrough_counts = {}
+            for file_idx, doc_count, passthrough_count, error in pool.imap_unordered(signature_file, tasks):
+                if error:
+                    skipped_files_log.write(f"Skipped file {all_files[file_idx]} due to error: {error}\n")
+                    skipped_files_log.flush()
+                    print(f"Error processing file {all_files[file_idx]}: {error}. Skipping this file.")
+                    continue
+                doc_counts[file_idx] = doc_count
+                passthrough_counts[file_idx] = passthrough_count
+            file_indices = sorted(doc_counts)
+            doc_offsets = np.zeros(len(all_files) + 1, dtype=np.uint64)
+            for file_idx in file_indices:
+                doc_offsets[file_idx + 1] = doc_counts[file_idx]
+            doc_offsets = np.cumsum(doc_offsets, dtype=np.uint64)
+            num_docs = int(doc_offsets[-1])
+            num_passthrough = sum(passthrough_counts.values())
+            print(f"Phase 1/4 done in {time.time() - t0:.2f} seconds ({num_docs} documents, "
+                  f"{num_passthrough} without text passed through)")
+
+            print(f"Phase 2/4: grouping LSH buckets in {args.num_bucket_shards} shards...")
+            tasks = [
+                (shard, work_dir, file_indices, doc_offsets, args.jaccard_threshold)
+                for shard in range(args.num_bucket_shards)
+            ]
+            total_edges = sum(edge_count for _, edge_count in pool.imap_unordered(bucket_shard_edges, tasks))
+            print(f"Phase 2/4 done in {time.time() - t0:.2f} seconds ({total_edges} candidate edges)")
+
+            print("Phase 3/4: connected components...")
+            edges = [np.load(_edges_path(work_dir, shard)) for shard in range(args.num_bucket_shards)]
+            edges = np.concatenate(edges) if edges else np.empty((0, 2), dtype=np.uint64)
+            labels = connected_components(num_docs, edges)
+            np.save(os.path.join(work_dir, 'labels.npy'), labels)
+            num_clusters = int(np.count_nonzero(labels == np.arange(num_docs, dtype=np.uint64)))
+            print(f"Phase 3/4 done in {time.time() - t0:.2f} seconds ({num_clusters} clusters)")
+
+            print("Phase 4/4: writing cluster representatives...")
+            tasks = [
+                (file_idx, all_files[file_idx],
+                 create_output_path(all_files[file_idx], args.output_dir, args.flat_structure),
+                 work_dir, int(doc_offsets[file_idx]), args.write_buffer_size)
+                for file_idx in file_indices
+            ]
+            for file_idx, kept_count, error in pool.imap_unordered(write_representatives, tasks):
+                if error:
+                    skipped_files_log.write(f"Skipped file {all_files[file_idx]} due to error: {error}\n")
+                    skipped_files_log.flush()
+                    print(f"Error writing output for {all_files[file_idx]}: {error}.")
+                    continue
+                print(f"Finished {all_files[file_idx]}: {kept_count} kept, "
+                      f"{doc_counts[file_idx] + passthrough_counts[file_idx] - kept_count} near-duplicates removed")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{'='*60}")
+    print("NEAR-DUPLICATE DETECTION COMPLETED")
+    print(f"{'='*60}")
+    print(f"Total processing time: {time.time() - t0:.2f} seconds")
+    print(f"Total documents: {num_docs}")
+    print(f"Near-duplicates removed: {num_docs - num_clusters}")
+    print(f"Documents kept: {num_clusters}")
+    print(f"Records without text passed through: {num_passthrough}")
+    print(f"Output directory: {args.output_dir}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="CPU MinHash-LSH near-duplicate removal for JSONL files",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--file-list', nargs='+', required=True,
+                        help="Input file paths, directories, or text files containing file paths")
+    parser.add_argument('--output-dir', required=True, help="Output directory for the deduplicated files")
+    parser.add_argument('--log-file', required=True, help="Log file for skipped files and errors")
+    parser.add_argument('--text-field', default='text', help="Record field to compare")
+    parser.add_argument('--workers', type=int, default=cpu_count(), help="Number of worker processes")
+    parser.add_argument('--shingle-type', default='char', choices=['char', 'word'],
+                        help="Character shingles (robust for Indic scripts) or word shingles")
+    parser.add_argument('--shingle-size', type=int, default=5, help="Characters or words per shingle")
+    parser.add_argument('--num-perm', type=int, default=128, help="Number of MinHash permutations")
+    parser.add_argument('--bands', type=int, default=16, help="Number of LSH bands (must divide --num-perm)")
+    parser.add_argument('--jaccard-threshold', type=float, default=0.8,
+                        help="Minimum signature agreement for a candidate pair; 0 keeps every LSH candidate")
+    parser.add_argument('--num-bucket-shards', type=int, default=64,
+                        help="Number of LSH bucket shards; raise it to bound per-worker memory")
+    parser.add_argument('--seed', type=int, default=42, help="Seed of the MinHash permutations")
+    parser.add_argument('--work-dir', default=None,
+                        help="Directory for temporary signature and bucket files (defaults to the output directory)")
+    parser.add_argument('--write-buffer-size', type=int, default=8 << 20, help="Output buffer size in bytes")
+    parser.add_argument('--flat-structure', action='store_true',
+                        help="Use flat directory structure for output (all files in output root)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -1,5 +1,8 @@
 import os
-import json
+import argparse
+import orjson
+from collections import OrderedDict
+from multiprocessing import Pool
 
 def get_directory_size_gb(directory):
     """Returns the size of a directory in GB."""
@@ -11,107 +14,162 @@ def get_directory_size_gb(directory):
                 total_size += os.path.getsize(fp)
     return total_size / (1024 ** 3)  # Convert bytes to GB
 
-# List of input directories
-input_dirs = [
-# paths here
-]  # Add more directories as needed
-
-# Define output directories
-match_base_dir = "matches"
-non_match_dir = "non_matches"
-
-# Ensure output directories exist
-os.makedirs(match_base_dir, exist_ok=True)
-os.makedirs(non_match_dir, exist_ok=True)
-
-# Load toxic words from file
-toxic_word_file = "toxic_2.txt"
-
-if not os.path.exists(toxic_word_file):
-    raise FileNotFoundError(f"Toxic words file '{toxic_word_file}' not found.")
-
-with open(toxic_word_file, "r", encoding="utf-8") as f:
-    toxic_words = {line.strip().lower() for line in f if line.strip()}  # Convert to lowercase and remove blanks
-
-print(f"✅ Loaded {len(toxic_words)} toxic words from '{toxic_word_file}'")
-
-# Processing starts
-total_files = 0
-total_matches = 0
-total_non_matches = 0
-
-for input_dir in input_dirs:
+class WriterPool:
+    """
+    Per-word output files kept open in an LRU cache of at most max_open handles.
+    A file is truncated the first time this pool opens it, so a rerun replaces earlier
+    output; only files reopened after eviction are appended to. Each word directory
+    is created once.
+    """
+
+    def __init__(self, match_base_dir, max_open=256, buffer_size=1 << 20):
+        self.match_base_dir = match_base_dir
+        self.max_open = max_open
+        self.buffer_size = buffer_size
+        self.handles = OrderedDict()
+        self.created_dirs = set()
+        self.opened = set()
+
+    def write(self, toxic_word, filename, line):
+        key = (toxic_word, filename)
+        handle = self.handles.get(key)
+        if handle is None:
+            toxic_word_dir = os.path.join(self.match_base_dir, toxic_word)
+            if toxic_word not in self.created_dirs:
+                os.makedirs(toxic_word_dir, exist_ok=True)
+                self.created_dirs.add(toxic_word)
+            if len(self.handles) >= self.max_open:
+                _, oldest = self.handles.popitem(last=False)
+                oldest.close()
+            mode = "ab" if key in self.opened else "wb"
+            handle = open(os.path.join(toxic_word_dir, filename), mode, buffering=self.buffer_size)
+            self.opened.add(key)
+            self.handles[key] = handle
+        else:
+            self.handles.move_to_end(key)
+        handle.write(line)
+
+    def close(self):
+        for handle in self.handles.values():
+            handle.close()
+        self.handles.clear()
+
+def route_file(input_path, writers, toxic_words, non_match_path=None):
+    """
+    Stream one JSONL file and fan each line out to the file of its toxic_word.
+    Lines without a known toxic word go to non_match_path (dropped when it is None).
+    Returns (matched, non_matched, invalid) counts.
+    """
+    filename = os.path.basename(input_path)
+    match_count = 0
+    non_match_count = 0
+    invalid_count = 0
+
+    non_match_file = open(non_match_path, "wb", buffering=1 << 20) if non_match_path else None
+    try:
+        with open(input_path, "rb", buffering=1 << 20) as infile:
+            for line in infile:
+                try:
+                    data = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    invalid_count += 1
+                    continue
+                toxic_word = str(data.get("toxic_word") or "").strip().lower()  # Normalize case
+
+                if toxic_word in toxic_words:
+                    writers.write(toxic_word, filename, line if line.endswith(b"\n") else line + b"\n")
+                    match_count += 1
+                else:
+                    if non_match_file is not None:
+                        non_match_file.write(line)
+                    non_match_count += 1
+    finally:
+        if non_match_file is not None:
+            non_match_file.close()
+
+    return match_count, non_match_count, invalid_count
+
+def route_directory(task):
+    """Route every .jsonl file of one input directory; run in a worker process per directory."""
+    input_dir, match_base_dir, non_match_dir, toxic_words, max_open = task
+    totals = [0, 0, 0, 0]  # files, matched, non-matched, invalid
     if not os.path.exists(input_dir):
         print(f"⚠️ Warning: Directory {input_dir} does not exist. Skipping.")
-        continue
+        return input_dir, totals
 
     print(f"\n📂 Processing directory: {input_dir}")
-
-    for filename in os.listdir(input_dir):
-        if filename.endswith(".jsonl"):
-            total_files += 1
-            input_path = os.path.join(input_dir, filename)
-            non_match_path = os.path.join(non_match_dir, filename)
-
-            print(f"  🔍 Processing file: {filename}")
-
-            match_count = 0
-            non_match_count = 0
-            invalid_count = 0
-
-            # Dictionary to store file handles for matched words
-            match_file_handles = {}
-
-            with open(input_path, "r", encoding="utf-8") as infile, \
-                 open(non_match_path, "w", encoding="utf-8") as non_match_file:
-
-                for line in infile:
-                    try:
-                        data = json.loads(line)
-                        toxic_word = data.get("toxic_word", "").strip().lower()  # Normalize case
-                        
-                        if toxic_word in toxic_words:
-                            # Create a subdirectory for the toxic word if not exists
-                            toxic_word_dir = os.path.join(match_base_dir, toxic_word)
-                            os.makedirs(toxic_word_dir, exist_ok=True)
-
-                            # Open the corresponding toxic word file only once and store the handle
-                            if toxic_word not in match_file_handles:
-                                match_file_handles[toxic_word] = open(
-                                    os.path.join(toxic_word_dir, filename),
-                                    "a",
-                                    encoding="utf-8"
-                                )
-
-                            # Write the matching JSON object to its respective toxic word file
-                            match_file_handles[toxic_word].write(line)
-                            match_count += 1
-                        else:
-                            non_match_file.write(line)
-                            non_match_count += 1
-                    except json.JSONDecodeError:
-                        print(f"    ⚠️ Skipping invalid JSON in {filename}")
-                        invalid_count += 1
-
-            # Close all open file handles for matched toxic words
-            for handle in match_file_handles.values():
-                handle.close()
-
-            total_matches += match_count
-            total_non_matches += non_match_count
-
-            # Get sizes of match and non-match directories
-            match_size_gb = get_directory_size_gb(match_base_dir)
-            non_match_size_gb = get_directory_size_gb(non_match_dir)
-
-            print(f"    ✅ Matched: {match_count}, ❌ Non-Matched: {non_match_count}, ⚠️ Invalid: {invalid_count}")
-            print(f"    📁 Size of 'matches/' directory: {match_size_gb:.3f} GB")
-            print(f"    📁 Size of 'non_matches/' directory: {non_match_size_gb:.3f} GB")
-
-# Final Summary
-print("\n🎯 Processing complete!")
-print(f"📄 Total files processed: {total_files}")
-print(f"✅ Total matched entries: {total_matches}")
-print(f"❌ Total non-matched entries: {total_non_matches}")
-print(f"📁 Final size of 'matches/' directory: {get_directory_size_gb(match_base_dir):.3f} GB")
-print(f"📁 Final size of 'non_matches/' directory: {get_directory_size_gb(non_match_dir):.3f} GB")
+    writers = WriterPool(match_base_dir, max_open)
+    try:
+        for filename in sorted(os.listdir(input_dir)):
+            if not filename.endswith(".jsonl"):
+                continue
+            counts = route_file(os.path.join(input_dir, filename), writers, toxic_words,
+                                os.path.join(non_match_dir, filename))
+            totals[0] += 1
+            for i, count in enumerate(counts, start=1):
+                totals[i] += count
+            print(f"  🔍 {filename}: ✅ Matched: {counts[0]}, ❌ Non-Matched: {counts[1]}, ⚠️ Invalid: {counts[2]}")
+    finally:
+        writers.close()
+    return input_dir, totals
+
+def load_toxic_words(toxic_word_file):
+    if not os.path.exists(toxic_word_file):
+        raise FileNotFoundError(f"Toxic words file '{toxic_word_file}' not found.")
+    with open(toxic_word_file, "r", encoding="utf-8") as f:
+        # Convert to lowercase and remove blanks; a tab-separated category column is ignored
+        return {line.split("\t")[0].strip().lower() for line in f if line.strip()}
+
+def find_filename_collisions(input_dirs):
+    """Map each .jsonl filename found in more than one input directory to those directories."""
+    seen = {}
+    for input_dir in input_dirs:
+        if os.path.isdir(input_dir):
+            for filename in os.listdir(input_dir):
+                if filename.endswith(".jsonl"):
+                    seen.setdefault(filename, []).append(input_dir)
+    return {filename: dirs for filename, dirs in seen.items() if len(dirs) > 1}
+
+def main():
+    parser = argparse.ArgumentParser(description="Split toxic filter output into one file per toxic word")
+    parser.add_argument("input_dirs", nargs="+", help="Directories of toxic JSONL files with a toxic_word field")
+    parser.add_argument("--toxic-words", default="toxic_2.txt", help="Toxic words file")
+    parser.add_argument("--match-dir", default="matches", help="Output directory of the per-word files")
+    parser.add_argument("--non-match-dir", default="non_matches", help="Output directory of lines without a known word")
+    parser.add_argument("--workers", type=int, default=None, help="Directories processed in parallel")
+    parser.add_argument("--max-open-files", type=int, default=256, help="Per-word files kept open per worker")
+    args = parser.parse_args()
+
+    # Directories run in parallel and share the output directories, so file names must be unique across them
+    collisions = find_filename_collisions(args.input_dirs)
+    if collisions:
+        details = "; ".join(f"{name} in {', '.join(dirs)}" for name, dirs in sorted(collisions.items())[:5])
+        parser.error(f"{len(collisions)} file names appear in several input directories ({details}). "
+                     f"Run those directories separately with different output directories.")
+
+    # Ensure output directories exist
+    os.makedirs(args.match_dir, exist_ok=True)
+    os.makedirs(args.non_match_dir, exist_ok=True)
+
+    toxic_words = load_toxic_words(args.toxic_words)
+    print(f"✅ Loaded {len(toxic_words)} toxic words from '{args.toxic_words}'")
+
+    tasks = [(d, args.match_dir, args.non_match_dir, toxic_words, args.max_open_files) for d in args.input_dirs]
+    num_workers = args.workers or min(len(tasks), os.cpu_count() or 1)
+    totals = [0, 0, 0, 0]
+    with Pool(processes=num_workers) as pool:
+        for input_dir, dir_totals in pool.imap_unordered(route_directory, tasks):
+            totals = [a + b for a, b in zip(totals, dir_totals)]
+            print(f"📂 Finished {input_dir}: {dir_totals[1]} matched, {dir_totals[2]} non-matched")
+
+    # Final Summary
+    print("\n🎯 Processing complete!")
+    print(f"📄 Total files processed: {totals[0]}")
+    print(f"✅ Total matched entries: {totals[1]}")
+    print(f"❌ Total non-matched entries: {totals[2]}")
+    print(f"⚠️ Total invalid entries: {totals[3]}")
+    print(f"📁 Final size of 'matches/' directory: {get_directory_size_gb(args.match_dir):.3f} GB")
+    print(f"📁 Final size of 'non_matches/' directory: {get_directory_size_gb(args.non_match_dir):.3f} GB")
+
+if __name__ == "__main__":
+    main()
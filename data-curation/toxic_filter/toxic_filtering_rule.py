@@ -2,16 +2,21 @@ import os
 import time
 import orjson
 import mmap
+import pickle
+import shutil
+import tempfile
 import ahocorasick
 import argparse
 import logging
-import re
-from dataclasses import dataclass
+import unicodedata
+from dataclasses import dataclass, field
 from typing import Set, Dict, List, Optional, Tuple
 from pathlib import Path
 from multiprocessing import Pool, cpu_count
 from contextlib import contextmanager
 
+from toxic_filter_inference import WriterPool, route_file
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -23,6 +28,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Word-character table for the Basic Multilingual Plane: letters, combining marks (Indic matras and
+# viramas), numbers, "_" and the zero-width joiners used inside Indic words. Anything else is a boundary.
+WORD_CHAR_TABLE = bytearray(
+    1 if unicodedata.category(chr(cp))[0] in "LMN" else 0 for cp in range(0x10000)
+)
+for _joiner in ("_", "\u200c", "\u200d"):
+    WORD_CHAR_TABLE[ord(_joiner)] = 1
+
+def is_word_char(char: str) -> bool:
+    """Unicode-aware equivalent of the regex \\w used for word boundaries, extended to combining marks"""
+    cp = ord(char)
+    if cp < 0x10000:
+        return WORD_CHAR_TABLE[cp] == 1
+    return unicodedata.category(char)[0] in "LMN"
+
+DEFAULT_CATEGORY = "default"
+
+# Filter shared by the worker processes of process_batch: inherited on fork, loaded once per worker otherwise
+_worker_filter: Optional["ToxicFilter"] = None
+
 @dataclass
 class ProcessingResult:
     """Data class to store file processing results"""
@@ -32,6 +57,46 @@ class ProcessingResult:
     removed_lines: int
     processing_time: float
     toxic_word_counts: Dict[str, int]
+    review_lines: int = 0
+    category_counts: Dict[str, int] = field(default_factory=dict)
+
+@dataclass
+class ScoringThresholds:
+    """Density thresholds for scoring mode: documents at or above toxic_density are removed,
+    documents with matches at or above review_density go to review, the rest stay clean"""
+    review_density: float = 0.0
+    toxic_density: float = 0.01
+
+@dataclass
+class ToxicityScore:
+    """All verified toxic matches of one document"""
+    matches: int
+    tokens: int
+    word_counts: Dict[str, int]
+    category_counts: Dict[str, int]
+
+    @property
+    def density(self) -> float:
+        return self.matches / self.tokens if self.tokens else 0.0
+
+    def route(self, thresholds: ScoringThresholds) -> str:
+        """Output bucket of the document: clean, review or toxic"""
+        if self.matches == 0:
+            return 'clean'
+        if self.density >= thresholds.toxic_density:
+            return 'toxic'
+        if self.density >= thresholds.review_density:
+            return 'review'
+        return 'clean'
+
+    def fields(self) -> Dict:
+        """Fields added to a scored record"""
+        return {
+            "toxic_word": max(self.word_counts, key=self.word_counts.get),
+            "toxic_matches": self.matches,
+            "toxic_density": round(self.density, 6),
+            "toxic_categories": self.category_counts,
+        }
 
 class ToxicFilter:
     # Word boundary characters that can appear before or after a word
@@ -42,21 +107,38 @@ class ToxicFilter:
 
     def __init__(self, toxic_words_path: Path):
         """Initialize the ToxicFilter with a path to toxic words file"""
-        self.toxic_words = self._load_toxic_words(toxic_words_path)
+        self.categories = self._load_toxic_words(toxic_words_path)
+        self.toxic_words = set(self.categories)
         self.toxic_trie = self._build_trie()
-        # Build regex pattern for verification
-        pattern = r'(?:^|[^\w]){0}(?:$|[^\w])'.format
-        self.toxic_patterns = {
-            word: re.compile(pattern(re.escape(word)), re.IGNORECASE)
-            for word in self.toxic_words
-        }
         logger.info(f"Initialized ToxicFilter with {len(self.toxic_words)} toxic words")
 
-    def _load_toxic_words(self, file_path: Path) -> Set[str]:
-        """Load toxic words from file with error handling"""
+    def save(self, automaton_path: Path) -> None:
+        """Serialize the prebuilt automaton so worker processes can load it instead of rebuilding"""
+        self.toxic_trie.save(str(automaton_path), pickle.dumps)
+
+    @classmethod
+    def load(cls, automaton_path: Path) -> "ToxicFilter":
+        """Load a ToxicFilter from an automaton written by save()"""
+        filter_obj = cls.__new__(cls)
+        filter_obj.toxic_trie = ahocorasick.load(str(automaton_path), pickle.loads)
+        filter_obj.categories = dict(filter_obj.toxic_trie.values())
+        filter_obj.toxic_words = set(filter_obj.categories)
+        return filter_obj
+
+    def _load_toxic_words(self, file_path: Path) -> Dict[str, str]:
+        """
+        Load toxic words from file with error handling.
+        Each line is a word, optionally followed by a tab and its category.
+        """
         try:
+            categories = {}
             with open(file_path, 'r', encoding="utf-8") as f:
-                return {line.strip().lower() for line in f if line.strip()}
+                for line in f:
+                    word, _, category = line.strip().partition("\t")
+                    word = word.strip().lower()
+                    if word:
+                        categories[word] = category.strip() or DEFAULT_CATEGORY
+            return categories
         except Exception as e:
             logger.error(f"Error loading toxic words from {file_path}: {e}")
             raise
@@ -65,49 +147,64 @@ class ToxicFilter:
         """Build an Aho-Corasick automaton for efficient first-pass matching"""
         trie = ahocorasick.Automaton()
         
-        for word in self.toxic_words:
+        for word, category in self.categories.items():
             # Only add the word itself - we'll verify boundaries later
-            trie.add_word(word, word)
+            trie.add_word(word, (word, category))
             
         trie.make_automaton()
         return trie
 
-    def _verify_word_match(self, text: str, word: str) -> bool:
+    @staticmethod
+    def _is_standalone(text: str, start: int, end: int) -> bool:
+        """Check that text[start:end] is not preceded or followed by a word character"""
+        if start > 0 and is_word_char(text[start - 1]):
+            return False
+        if end < len(text) and is_word_char(text[end]):
+            return False
+        return True
+
+    def iter_toxic_matches(self, text: str):
         """
-        Verify that a word is actually a standalone word using regex.
-        This is slower but more accurate than Aho-Corasick alone.
+        Yield (start, end, word) for every standalone toxic word, in text order.
+        Offsets refer to text.lower(): the automaton and the boundary checks both run on the
+        lowercased text, since lowercasing can change the length of a string (e.g. "İ").
         """
-        return bool(self.toxic_patterns[word].search(text))
+        text_lower = text.lower()
+        for end_index, (word, _) in self.toxic_trie.iter(text_lower):
+            start = end_index - len(word) + 1
+            if self._is_standalone(text_lower, start, end_index + 1):
+                yield start, end_index + 1, word
 
     def find_toxic_word(self, text: str) -> Optional[str]:
         """
-        Two-stage matching:
-        1. Fast Aho-Corasick to find potential matches
-        2. Regex verification to confirm exact word boundaries
+        Single-pass matching: Aho-Corasick finds candidates and each candidate's end offset
+        is checked against the word-character table to confirm exact word boundaries
         """
         try:
-            # First pass: Get all potential matches using fast Aho-Corasick
-            text_lower = text.lower()
-            potential_matches = set(match[1] for match in self.toxic_trie.iter(text_lower))
-            
-            if not potential_matches:
-                return None
-            
-            # Second pass: Verify matches have proper word boundaries
-            # Add spaces at start and end to simplify boundary checking
-            padded_text = f" {text} "
-            
-            # Check each potential match with regex
-            for word in potential_matches:
-                if self._verify_word_match(padded_text, word):
-                    return word
-                    
+            for _, _, word in self.iter_toxic_matches(text):
+                return word
             return None
-            
+
         except Exception as e:
             logger.warning(f"Error checking for toxic words: {e}")
             return None
 
+    def score(self, text: str) -> ToxicityScore:
+        """
+        Count every verified match in a single pass over the text.
+        Density is matches per whitespace-separated token.
+        """
+        word_counts: Dict[str, int] = {}
+        category_counts: Dict[str, int] = {}
+        matches = 0
+        for _, _, word in self.iter_toxic_matches(text):
+            matches += 1
+            word_counts[word] = word_counts.get(word, 0) + 1
+            category = self.categories[word]
+            category_counts[category] = category_counts.get(category, 0) + 1
+        tokens = len(text.split()) if matches else 0
+        return ToxicityScore(matches, tokens, word_counts, category_counts)
+
 @contextmanager
 def open_files(input_path: Path, output_paths: Dict[str, Path]):
     """Context manager for handling multiple file operations"""
@@ -128,22 +225,43 @@ def open_files(input_path: Path, output_paths: Dict[str, Path]):
             except Exception as e:
                 logger.error(f"Error closing file: {e}")
 
-def process_file(input_path: str, output_base_dir: str, filter_obj: ToxicFilter) -> ProcessingResult:
-    """Process a single file for toxic content"""
+def plan_chunks(input_path: str, chunk_size: int) -> List[Tuple[int, int]]:
+    """Split a file into byte ranges of roughly chunk_size bytes that start and end on line boundaries"""
+    file_size = os.path.getsize(input_path)
+    if file_size <= chunk_size:
+        return [(0, file_size)]
+
+    ranges = []
+    with open(input_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < file_size:
+            newline = mm.find(b"\n", min(start + chunk_size, file_size) - 1)
+            end = file_size if newline == -1 else newline + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+def process_file(input_path: str, output_base_dir: str, filter_obj: ToxicFilter,
+                 byte_range: Optional[Tuple[int, int]] = None, part: Optional[int] = None,
+                 scoring: Optional[ScoringThresholds] = None) -> ProcessingResult:
+    """
+    Process a single file, or one byte range of it, for toxic content.
+    A byte range writes to numbered part files that merge_parts joins afterwards.
+    Without scoring, any verified toxic word removes the line. With scoring, all matches
+    are counted and the line is routed to clean, review or toxic by its toxic-token density.
+    """
     start_time = time.time()
     stats = {
         'total_lines': 0,
         'filtered_lines': 0,
         'removed_lines': 0,
-        'toxic_word_counts': {}
+        'review_lines': 0,
+        'toxic_word_counts': {},
+        'category_counts': {}
     }
 
     input_path = Path(input_path)
-    output_paths = {
-        'clean': Path(output_base_dir) / "filtered_files" / input_path.name,
-        'toxic': Path(output_base_dir) / "toxic_files" / input_path.name,
-        'error': Path(output_base_dir) / "error_files" / input_path.name
-    }
+    output_paths = output_paths_for(input_path, output_base_dir, part, scoring is not None)
 
     # Ensure output directories exist
     for path in output_paths.values():
@@ -151,7 +269,10 @@ def process_file(input_path: str, output_base_dir: str, filter_obj: ToxicFilter)
 
     try:
         with open_files(input_path, output_paths) as files:
-            for line in iter(files['mmap'].readline, b""):
+            start, end = byte_range if byte_range else (0, len(files['mmap']))
+            files['mmap'].seek(start)
+            while files['mmap'].tell() < end:
+                line = files['mmap'].readline()
                 stats['total_lines'] += 1
                 
                 try:
@@ -163,6 +284,22 @@ def process_file(input_path: str, output_base_dir: str, filter_obj: ToxicFilter)
                         stats['filtered_lines'] += 1
                         continue
 
+                    if scoring is not None:
+                        score = filter_obj.score(text)
+                        route = score.route(scoring)
+                        if score.matches == 0:
+                            files['clean'].write(line.decode("utf-8"))
+                            stats['filtered_lines'] += 1
+                            continue
+                        data.update(score.fields())
+                        files[route].write(orjson.dumps(data).decode("utf-8") + "\n")
+                        stats[{'clean': 'filtered_lines', 'review': 'review_lines', 'toxic': 'removed_lines'}[route]] += 1
+                        for word, count in score.word_counts.items():
+                            stats['toxic_word_counts'][word] = stats['toxic_word_counts'].get(word, 0) + count
+                        for category, count in score.category_counts.items():
+                            stats['category_counts'][category] = stats['category_counts'].get(category, 0) + count
+                        continue
+
                     toxic_word = filter_obj.find_toxic_word(text)
                     
                     if toxic_word:
@@ -186,7 +323,8 @@ def process_file(input_path: str, output_base_dir: str, filter_obj: ToxicFilter)
         raise
 
     processing_time = time.time() - start_time
-    logger.info(f"Processed {input_path} in {processing_time:.2f} seconds")
+    if part is None:
+        logger.info(f"Processed {input_path} in {processing_time:.2f} seconds")
 
     return ProcessingResult(
         file=str(input_path),
@@ -194,37 +332,169 @@ def process_file(input_path: str, output_base_dir: str, filter_obj: ToxicFilter)
         filtered_lines=stats['filtered_lines'],
         removed_lines=stats['removed_lines'],
         processing_time=processing_time,
-        toxic_word_counts=stats['toxic_word_counts']
+        toxic_word_counts=stats['toxic_word_counts'],
+        review_lines=stats['review_lines'],
+        category_counts=stats['category_counts']
     )
 
-def process_batch(file_list: List[str], toxic_words_path: str, output_base_dir: str) -> List[ProcessingResult]:
-    """Process multiple files in parallel"""
+def output_paths_for(input_path: Path, output_base_dir: str, part: Optional[int] = None,
+                     review: bool = False) -> Dict[str, Path]:
+    """Output files of an input file, or of one of its byte-range parts"""
+    name = input_path.name if part is None else f"{input_path.name}.part{part:05d}"
+    paths = {
+        'clean': Path(output_base_dir) / "filtered_files" / name,
+        'toxic': Path(output_base_dir) / "toxic_files" / name,
+        'error': Path(output_base_dir) / "error_files" / name
+    }
+    if review:
+        paths['review'] = Path(output_base_dir) / "review_files" / name
+    return paths
+
+def merge_parts(input_path: str, output_base_dir: str, num_parts: int, review: bool = False) -> None:
+    """Concatenate the part files of a chunked input in order and remove them"""
+    final_paths = output_paths_for(Path(input_path), output_base_dir, review=review)
+    for key, final_path in final_paths.items():
+        with open(final_path, "wb") as out:
+            for part in range(num_parts):
+                part_path = output_paths_for(Path(input_path), output_base_dir, part, review)[key]
+                with open(part_path, "rb") as f:
+                    shutil.copyfileobj(f, out, 16 << 20)
+                part_path.unlink()
+
+def remove_parts(input_path: str, output_base_dir: str, num_parts: int, review: bool = False) -> None:
+    """Delete whatever part files the chunks of an input managed to write"""
+    for part in range(num_parts):
+        for part_path in output_paths_for(Path(input_path), output_base_dir, part, review).values():
+            part_path.unlink(missing_ok=True)
+
+def _init_worker(automaton_path: str) -> None:
+    """Pool initializer: load the shared automaton once per worker unless inherited via fork"""
+    global _worker_filter
+    if _worker_filter is None:
+        _worker_filter = ToxicFilter.load(Path(automaton_path))
+
+def _process_chunk(task: Tuple[str, str, Tuple[int, int], Optional[int], Optional[ScoringThresholds]]
+                   ) -> Tuple[str, ProcessingResult]:
+    input_path, output_base_dir, byte_range, part, scoring = task
+    return input_path, process_file(input_path, output_base_dir, _worker_filter, byte_range, part, scoring)
+
+def process_batch(file_list: List[str], toxic_words_path: str, output_base_dir: str,
+                  num_processes: Optional[int] = None, chunk_size: int = 256 << 20,
+                  automaton_path: Optional[str] = None,
+                  scoring: Optional[ScoringThresholds] = None,
+                  split_by_word: bool = False, max_open_files: int = 256) -> List[ProcessingResult]:
+    """
+    Process multiple files in parallel.
+
+    The automaton is built once in the parent and serialized to automaton_path; workers
+    inherit it on fork or load it once in the pool initializer, instead of receiving a
+    pickled filter with every task. Files larger than chunk_size are split into
+    line-aligned byte ranges so a single huge JSONL is spread over all workers.
+    Without automaton_path, the automaton goes to a temporary directory that is removed
+    once the pool finishes. Passing scoring thresholds switches every file to scoring mode (see process_file).
+    With split_by_word, each finished toxic file is also fanned out to
+    toxic_by_word/<word>/<file>, replacing a separate toxic_filter_inference.py run.
+    This fan-out is a serial second pass in the parent: it re-reads every merged toxic
+    file with route_file after the pool finishes, so its cost grows with the toxic output.
+    """
+    global _worker_filter
     filter_obj = ToxicFilter(Path(toxic_words_path))
-    num_processes = min(len(file_list), cpu_count())
-    
-    logger.info(f"Starting batch processing with {num_processes} processes")
-    
+    automaton_dir = None
+    if automaton_path is None:
+        automaton_dir = tempfile.mkdtemp(prefix="toxic_automaton_")
+        automaton_path = os.path.join(automaton_dir, "toxic_automaton.pkl")
+    filter_obj.save(Path(automaton_path))
+    _worker_filter = filter_obj
+
+    tasks = []
+    num_parts = {}
+    for path in file_list:
+        try:
+            ranges = plan_chunks(path, chunk_size)
+        except OSError as e:
+            logger.error(f"Task failed: {e}")
+            continue
+        num_parts[path] = len(ranges)
+        if len(ranges) == 1:
+            tasks.append((path, output_base_dir, None, None, scoring))
+        else:
+            tasks.extend((path, output_base_dir, byte_range, part, scoring) for part, byte_range in enumerate(ranges))
+
+    num_processes = num_processes or min(len(tasks), cpu_count()) or 1
+    logger.info(f"Starting batch processing of {len(file_list)} files in {len(tasks)} chunks with {num_processes} processes")
+
+    partial: Dict[str, List[ProcessingResult]] = {}
+    failed = set()
+    try:
+        with Pool(processes=num_processes, initializer=_init_worker, initargs=(automaton_path,)) as pool:
+            pending = [(task[0], pool.apply_async(_process_chunk, (task,))) for task in tasks]
+            for path, task in pending:
+                try:
+                    _, result = task.get()
+                    partial.setdefault(path, []).append(result)
+                except Exception as e:
+                    logger.error(f"Task failed: {e}")
+                    failed.add(path)
+    finally:
+        if automaton_dir is not None:
+            shutil.rmtree(automaton_dir, ignore_errors=True)
+
+    # The byte-range parts of a failed file are never merged; do not leave them next to the outputs
+    for path in failed:
+        if num_parts[path] > 1:
+            remove_parts(path, output_base_dir, num_parts[path], scoring is not None)
+
+    writers = WriterPool(os.path.join(output_base_dir, "toxic_by_word"), max_open_files) if split_by_word else None
     results = []
-    with Pool(processes=num_processes) as pool:
-        tasks = [
-            pool.apply_async(
-                process_file,
-                (path, output_base_dir, filter_obj)
-            )
-            for path in file_list
-        ]
-
-        for task in tasks:
-            try:
-                results.append(task.get())
-            except Exception as e:
-                logger.error(f"Task failed: {e}")
+    for path, chunk_results in partial.items():
+        if path in failed:
+            continue
+        if num_parts[path] > 1:
+            merge_parts(path, output_base_dir, num_parts[path], scoring is not None)
+        if writers is not None:
+            route_file(str(output_paths_for(Path(path), output_base_dir)['toxic']), writers, filter_obj.toxic_words)
+        toxic_word_counts: Dict[str, int] = {}
+        category_counts: Dict[str, int] = {}
+        for r in chunk_results:
+            for word, count in r.toxic_word_counts.items():
+                toxic_word_counts[word] = toxic_word_counts.get(word, 0) + count
+            for category, count in r.category_counts.items():
+                category_counts[category] = category_counts.get(category, 0) + count
+        result = ProcessingResult(
+            file=path,
+            total_lines=sum(r.total_lines for r in chunk_results),
+            filtered_lines=sum(r.filtered_lines for r in chunk_results),
+            removed_lines=sum(r.removed_lines for r in chunk_results),
+            processing_time=sum(r.processing_time for r in chunk_results),
+            toxic_word_counts=toxic_word_counts,
+            review_lines=sum(r.review_lines for r in chunk_results),
+            category_counts=category_counts
+        )
+        if num_parts[path] > 1:
+            logger.info(f"Processed {path} in {num_parts[path]} chunks ({result.processing_time:.2f} CPU seconds)")
+        results.append(result)
 
+    if writers is not None:
+        writers.close()
     return results
 
 def main():
     parser = argparse.ArgumentParser(description="Fast Toxic Word Filtering")
     parser.add_argument("--part", type=int, required=True, help="Part number to process")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--chunk-size-mb", type=int, default=256,
+                        help="Files larger than this are split into line-aligned byte ranges processed in parallel")
+    parser.add_argument("--score", action="store_true",
+                        help="Count all toxic matches per document and route by density to clean/review/toxic")
+    parser.add_argument("--review-density", type=float, default=0.0,
+                        help="Scoring mode: minimum toxic-token density sent to review_files")
+    parser.add_argument("--toxic-density", type=float, default=0.01,
+                        help="Scoring mode: minimum toxic-token density sent to toxic_files")
+    parser.add_argument("--split-by-word", action="store_true",
+                        help="Also write toxic lines to toxic_by_word/<word>/<file> "
+                             "(serial second pass over the toxic output after the pool)")
+    parser.add_argument("--max-open-files", type=int, default=256,
+                        help="Per-word files kept open with --split-by-word")
     args = parser.parse_args()
 
     # Base Paths
@@ -245,12 +515,17 @@ def main():
         with open(file_paths, "r", encoding="utf-8") as f:
             paths = [line.strip() for line in f if line.strip()]
 
-        results = process_batch(paths, toxic_words, output_base_dir)
+        scoring = ScoringThresholds(args.review_density, args.toxic_density) if args.score else None
+        results = process_batch(paths, toxic_words, output_base_dir,
+                                num_processes=args.workers, chunk_size=args.chunk_size_mb << 20,
+                                scoring=scoring, split_by_word=args.split_by_word,
+                                max_open_files=args.max_open_files)
         
         # Log summary statistics
         total_processed = sum(r.total_lines for r in results)
         total_filtered = sum(r.filtered_lines for r in results)
         total_removed = sum(r.removed_lines for r in results)
+        total_review = sum(r.review_lines for r in results)
         total_time = sum(r.processing_time for r in results)
         
         logger.info(f"""
@@ -259,6 +534,7 @@ Processing Summary:
 Total files processed: {len(results)}
 Total lines processed: {total_processed:,}
 Clean lines: {total_filtered:,}
+Review lines: {total_review:,}
 Toxic lines: {total_removed:,}
 Total processing time: {total_time:.2f} seconds
         """)